@@ -0,0 +1,126 @@
+'''
+Shared fixtures for the benchmarks. Everything runs offline - responses are either generated, or
+read from recorded JSON files.
+
+    GFITPY_BENCH_SIZES      comma separated numbers of points to generate (default 10000,100000).
+                            Bear in mind 10000000 points needs several GB of memory
+    GFITPY_BENCH_FIXTURES   a directory of recorded dataset responses (*.json) to benchmark too
+'''
+import os
+import json
+import glob
+import random
+import tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+
+from gfitpy.utils.date_range import DateRange
+
+
+def bench_sizes():
+    return [int(size) for size in os.environ.get('GFITPY_BENCH_SIZES', '10000,100000').split(',')]
+
+
+def recorded_fixtures():
+    directory = os.environ.get('GFITPY_BENCH_FIXTURES')
+    if not directory:
+        return []
+    return sorted(glob.glob(os.path.join(directory, '*.json')))
+
+
+def make_response(size, data_type='fpVal', seed=0):
+    '''
+    A dataset response of `size` consecutive points, a minute or so long each, like google gives
+    for calories. Seeded, so every run benchmarks the same data
+    '''
+    rand = random.Random(seed)
+    start = end = 1420070400 * 10 ** 9
+    points = []
+    for _ in range(size):
+        start = end + rand.choice((0, 0, 0, 60 * 10 ** 9))
+        end = start + rand.randint(30, 90) * 10 ** 9 + rand.randint(0, 999999999)
+        value = rand.uniform(0, 10) if data_type == 'fpVal' else rand.randint(0, 120)
+        points.append({
+            'startTimeNanos': str(start),
+            'endTimeNanos': str(end),
+            'dataTypeName': 'com.google.calories.expended',
+            'value': [{data_type: value}],
+        })
+
+    return {
+        'minStartTimeNs': points[0]['startTimeNanos'] if points else '0',
+        'maxEndTimeNs': points[-1]['endTimeNanos'] if points else '0',
+        'dataSourceId': 'derived:com.google.calories.expended:com.google.android.gms:from_activities',
+        'point': points,
+    }
+
+
+def make_ranges(size, seed=0):
+    '''
+    `size` DateRanges in no particular order - mostly following on from each other, with some
+    overlapping and some gaps
+    '''
+    rand = random.Random(seed)
+    time = datetime(2015, 1, 1)
+    ranges = []
+    for _ in range(size):
+        time += timedelta(seconds=rand.randint(-30, 900))
+        ranges.append(DateRange(time, time + timedelta(seconds=rand.randint(1, 600))))
+    rand.shuffle(ranges)
+    return ranges
+
+
+def pytest_generate_tests(metafunc):
+    if 'response' in metafunc.fixturenames:
+        params = [('synthetic', size) for size in bench_sizes()]
+        params += [('recorded', path) for path in recorded_fixtures()]
+        metafunc.parametrize(
+            'response',
+            params,
+            ids=['{0}-{1}'.format(kind, os.path.basename(str(value))) for kind, value in params],
+            indirect=True
+        )
+    if 'ranges' in metafunc.fixturenames:
+        metafunc.parametrize('ranges', bench_sizes(), indirect=True)
+
+
+# generating the data takes longer than some of the benchmarks, so only do it once per session
+_responses = {}
+
+
+@pytest.fixture
+def response(request):
+    kind, value = request.param
+    if request.param not in _responses:
+        _responses.clear()
+        if kind == 'synthetic':
+            _responses[request.param] = make_response(value)
+        else:
+            with open(value) as f:
+                _responses[request.param] = json.load(f)
+    return _responses[request.param]
+
+
+@pytest.fixture
+def ranges(request):
+    return make_ranges(request.param)
+
+
+@pytest.fixture
+def record_peak_memory(benchmark):
+    '''
+    Runs func once under tracemalloc, and adds its peak memory use to the benchmark's results.
+    This is kept apart from the timed runs, as tracing slows everything down
+    '''
+    def record(func, *args):
+        tracemalloc.start()
+        try:
+            func(*args)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info['peak_memory_mb'] = round(peak / 2 ** 20, 2)
+        return peak
+
+    return record
@@ -0,0 +1,48 @@
+import functools
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from gfitpy.utils.date_range import IntervalIndex, coalesce  # noqa
+
+
+def test_sort(benchmark, ranges):
+    benchmark(sorted, ranges)
+
+
+def test_overlap(benchmark, ranges):
+    ordered = sorted(ranges)
+    pairs = list(zip(ordered, ordered[1:]))
+
+    benchmark(lambda: sum(1 for first, second in pairs if second in first))
+
+
+def test_near(benchmark, ranges):
+    ordered = sorted(ranges)
+    pairs = list(zip(ordered, ordered[1:]))
+
+    benchmark(lambda: sum(1 for first, second in pairs if first.near(second)))
+
+
+def test_combine(benchmark, ranges):
+    benchmark(functools.reduce, lambda first, second: first.combine(second), ranges)
+
+
+def test_coalesce(benchmark, ranges, record_peak_memory):
+    record_peak_memory(coalesce, ranges)
+
+    benchmark(coalesce, ranges)
+
+
+def test_interval_index_build(benchmark, ranges, record_peak_memory):
+    record_peak_memory(IntervalIndex, ranges)
+
+    benchmark(IntervalIndex, ranges)
+
+
+def test_interval_index_queries(benchmark, ranges):
+    index = IntervalIndex(ranges)
+    queries = ranges[:1000]
+
+    benchmark(lambda: [index.near(query) for query in queries])
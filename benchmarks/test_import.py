@@ -0,0 +1,20 @@
+import sys
+import subprocess
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+
+def import_in_fresh_interpreter(module):
+    subprocess.check_call([sys.executable, '-c', 'import {0}'.format(module)])
+
+
+@pytest.mark.parametrize('module', ['gfitpy.utils.date_range', 'gfitpy.gfit_api', 'gfitpy.__main__'])
+def test_import(benchmark, module):
+    # includes starting python, so compare against 'sys' to see what gfitpy itself costs
+    benchmark.pedantic(import_in_fresh_interpreter, args=(module,), rounds=10)
+
+
+def test_import_baseline(benchmark):
+    benchmark.pedantic(import_in_fresh_interpreter, args=('sys',), rounds=10)
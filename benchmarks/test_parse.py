@@ -0,0 +1,74 @@
+import json
+
+import httplib2
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from googleapiclient.model import JsonModel  # noqa
+
+from gfitpy import fast_json  # noqa
+from gfitpy.gfit_api import GfitAPI  # noqa
+from gfitpy.utils.columns import FitColumns  # noqa
+
+
+def data_type(response):
+    points = response.get('point', [])
+    return next(iter(points[0]['value'][0])) if points else 'fpVal'
+
+
+def test_preprocess_data(benchmark, response, record_peak_memory):
+    api = GfitAPI({})
+    record_peak_memory(api.preprocess_data, response, data_type(response))
+
+    ret = benchmark(api.preprocess_data, response, data_type(response))
+
+    assert len(ret['data']) == len(response.get('point', []))
+
+
+def test_process_datapoint(benchmark, response):
+    points = response.get('point', [])
+    point_type = data_type(response)
+
+    benchmark(lambda: [GfitAPI.process_datapoint(point, point_type) for point in points])
+
+
+def test_columns_from_response(benchmark, response, record_peak_memory):
+    record_peak_memory(FitColumns.from_response, response, data_type(response))
+
+    cols = benchmark(FitColumns.from_response, response, data_type(response))
+
+    assert len(cols) == len(response.get('point', []))
+
+
+def test_merge_responses(benchmark, response):
+    # as if the response had been fetched in ten windows
+    points = response.get('point', [])
+    step = max(len(points) // 10, 1)
+    windows = [
+        dict(response, minStartTimeNs=chunk[0]['startTimeNanos'], point=chunk)
+        for chunk in (points[i:i + step] for i in range(0, len(points), step))
+    ]
+    if not windows:
+        pytest.skip('no points to merge')
+
+    merged = benchmark(GfitAPI.merge_responses, windows)
+
+    assert len(merged['point']) == len(points)
+
+
+def test_json_loads(benchmark, response, record_peak_memory):
+    body = json.dumps(response)
+    record_peak_memory(json.loads, body)
+
+    benchmark(json.loads, body)
+
+
+@pytest.mark.parametrize('decoder', ['googleapiclient', 'fast_json'])
+def test_decode_response(benchmark, response, record_peak_memory, decoder):
+    body = json.dumps(response).encode('utf-8')
+    resp = httplib2.Response({'status': 200})
+    decode = JsonModel().response if decoder == 'googleapiclient' else fast_json.decode_response
+    record_peak_memory(decode, resp, body)
+
+    benchmark(decode, resp, body)
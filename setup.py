@@ -35,18 +35,37 @@ setup(
         'Operating System :: Microsoft :: Windows',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Topic :: Utilities',
     ],
+    # AsyncGfitAPI needs asyncio.get_running_loop, new in 3.7 (google-api-python-client 2 needs 3.6)
+    python_requires='>=3.7',
     keywords=[
         'fitness', 'google', 'api', 'rest'
     ],
     install_requires=[
         'httplib2',
         'requests',
-        'google-api-python-client',
+        # 2.0 added static_discovery
+        'google-api-python-client>=2.0',
         # 'oauth2client>=1.4.6',
     ],
+    extras_require={
+        # vectorised FitColumns
+        'numpy': ['numpy'],
+        # gfitpy.export.ParquetWriter
+        'parquet': ['pyarrow'],
+        # faster decoding of big responses in gfitpy.fast_json
+        'fast': ['orjson'],
+        # gfitpy.metrics.PrometheusMetrics
+        'prometheus': ['prometheus_client'],
+        # the benchmarks/ suite
+        'benchmarks': ['pytest-benchmark'],
+    },
     setup_requires=['pytest-runner'],
     tests_require=['mock', 'pytest'],
     entry_points={
@@ -1,23 +1,187 @@
+import os
+import re
 import sys
 import logging
+import argparse
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
 from .gfit_api import GfitAPI
+from .export import CSVWriter, ParquetWriter
+from .lazy import LazyImport
+from .synthetic import SyntheticHttp
+from .transport import NullCredentials, RecordingTransport, ReplayHttp
 
-CLIENT_ID = 'abc'
-CLIENT_SECRET = 'def'
+tools = LazyImport('oauth2client.tools')
 
+logger = logging.getLogger(__name__)
 
-def main(argv=()):
+# short names for the data sources people will want most
+SOURCE_ALIASES = {
+    'calories': (GfitAPI.cal_data_source, 'fpVal'),
+    'activity': (GfitAPI.activity_data_source, 'intVal'),
+}
+
+
+def parse_time(value):
+    for fmt in ('%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise argparse.ArgumentTypeError('Cannot understand time {0!r}'.format(value))
+
+
+def positive(type_):
+    '''
+    An argparse type for numbers that have to be above zero - a window of 0 days would never
+    finish, and 0 workers can't fetch anything
+    '''
+    def parse(value):
+        try:
+            number = type_(value)
+        except ValueError:
+            raise argparse.ArgumentTypeError('Cannot understand number {0!r}'.format(value))
+        if number <= 0:
+            raise argparse.ArgumentTypeError('Must be more than 0, not {0!r}'.format(value))
+        return number
+    return parse
+
+
+def parse_source(value):
+    '''
+    A source is either one of SOURCE_ALIASES, or a full data source ID, optionally followed by
+    =fpVal or =intVal to say what type its values are (fpVal if not given). Returns a tuple of
+    (name, data source ID, data type)
+    '''
+    if value in SOURCE_ALIASES:
+        return (value,) + SOURCE_ALIASES[value]
+
+    data_source, _, data_type = value.partition('=')
+    data_type = data_type or 'fpVal'
+    if data_type not in ('fpVal', 'intVal'):
+        raise argparse.ArgumentTypeError('Unknown data type {0!r}'.format(data_type))
+    return re.sub(r'[^\w.-]+', '_', data_source), data_source, data_type
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='gfitpy',
+        description='Fetch data from Google Fit. oauth2client\'s flags for logging in (eg '
+                    '--noauth_local_webserver) are passed on to it'
+    )
+    subparsers = parser.add_subparsers(dest='command')
+
+    sync = subparsers.add_parser('sync', help='Fetch data sources and write them to files')
+    sync.set_defaults(func=sync_command)
+    sync.add_argument('--client-id', default=os.environ.get('GFITPY_CLIENT_ID'))
+    sync.add_argument('--client-secret', default=os.environ.get('GFITPY_CLIENT_SECRET'))
+    sync.add_argument('--credentials', default='user_credentials', help='Where the OAuth credentials are stored')
+    sync.add_argument('--start', type=parse_time, help='YYYY-MM-DD[THH:MM:SS] - defaults to 10 days ago')
+    sync.add_argument('--end', type=parse_time, help='YYYY-MM-DD[THH:MM:SS] - defaults to now')
+    sync.add_argument(
+        '--source',
+        dest='sources',
+        action='append',
+        type=parse_source,
+        help='{0}, or a data source ID (optionally followed by =intVal). Can be given more than once. '
+             'Defaults to all of {0}'.format(', '.join(sorted(SOURCE_ALIASES)))
+    )
+    sync.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+    sync.add_argument('--output', default='.', help='Directory to write a file per source into')
+    sync.add_argument('--window', type=positive(float), default=30, help='Days of data to fetch per request')
+    sync.add_argument('--page-size', type=int, help='Max points per response')
+    sync.add_argument('--concurrency', type=positive(int), default=4, help='How many sources to fetch at once')
+    sync.add_argument('--cache-dir', help='Keep data here, and only fetch what is new')
+
+    offline = sync.add_mutually_exclusive_group()
+    offline.add_argument('--record', metavar='DIR', help='Save every response from google in DIR')
+    offline.add_argument('--replay', metavar='DIR', help='Answer requests from a --record directory, rather than google')
+    offline.add_argument('--synthetic', action='store_true', help='Make up data rather than asking google')
+
+    return parser
+
+
+def sync_command(args, oauth_flags):
+    sources = args.sources or [parse_source(name) for name in sorted(SOURCE_ALIASES)]
+    end = args.end
+    start = args.start or (end or datetime.datetime.now()) - datetime.timedelta(days=10)
+
+    settings = {
+        'start_time': start,
+        'end_time': end,
+        'window': datetime.timedelta(days=args.window),
+        'page_size': args.page_size,
+        'credentials_file': args.credentials,
+        'oauth_flags': oauth_flags,
+        'cache_dir': args.cache_dir,
+    }
+    if args.client_id:
+        settings['client_id'] = args.client_id
+    if args.client_secret:
+        settings['client_secret'] = args.client_secret
+
+    if args.record:
+        settings['transport'] = RecordingTransport(args.record)
+    elif args.replay:
+        settings['transport'] = ReplayHttp(args.replay)
+        settings['credentials'] = NullCredentials()
+    elif args.synthetic:
+        settings['transport'] = SyntheticHttp()
+        settings['credentials'] = NullCredentials()
+
+    os.makedirs(args.output, exist_ok=True)
+    gfit = GfitAPI(settings)
+
+    with gfit.login():
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            rows = list(executor.map(
+                lambda source: write_source(gfit, args.format, args.output, *source),
+                sources
+            ))
+
+    for (name, _, _), count in zip(sources, rows):
+        logger.info('%s: %d points', name, count)
+    return 0
+
+
+def write_source(gfit, fmt, directory, name, data_source, data_type):
+    '''
+    Fetches one data source, writing each page out as soon as it arrives. Returns the number of
+    points written
+    '''
+    path = os.path.join(directory, '{0}.{1}'.format(name, fmt))
+    logger.info('Writing %s to %s', data_source, path)
+
+    if fmt == 'csv':
+        with open(path, 'w', newline='') as f, CSVWriter(f) as writer:
+            return write_columns(gfit, writer, data_source, data_type)
+    else:
+        with ParquetWriter(path) as writer:
+            return write_columns(gfit, writer, data_source, data_type)
+
+
+def write_columns(gfit, writer, data_source, data_type):
+    if gfit.cache is not None:
+        # the cache only works in whole ranges, so there's nothing to gain from streaming
+        chunks = [gfit.get_columns(data_source, data_type)]
+    else:
+        chunks = gfit.iter_columns(data_source, data_type)
+
+    for columns in chunks:
+        writer.write(columns, data_source)
+    return writer.rows
+
+
+def main(argv=None):
     """
     Args:
-        argv (list): List of arguments
+        argv (list): List of arguments - defaults to sys.argv
 
     Returns:
         int: A return code
 
-    Some sample code for gfitpy - starts up, and executes.
-    Gets calorie and activity data for the last ten days.
+    Entry point for the gfitpy command - eg `gfitpy sync --source calories --format parquet`.
     """
 
     logging.basicConfig(
@@ -25,23 +189,37 @@ def main(argv=()):
         level=logging.INFO
     )
 
-    start_time = datetime.datetime.now() - datetime.timedelta(days=10)
+    parser = build_parser()
+    args, oauth_flags = parser.parse_known_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    check_oauth_flags(parser, oauth_flags)
+    check_times(parser, args)
 
-    gfit = GfitAPI(
-        start_time=start_time,
-        settings_dict={'client_id': CLIENT_ID, 'client_secret': CLIENT_SECRET}
-    )
+    return args.func(args, oauth_flags)
+
+
+def check_oauth_flags(parser, oauth_flags):
+    '''
+    oauth2client only looks at its flags if we need to log in again - so check them now, rather
+    than quietly ignoring typos of our own arguments whenever the stored credentials are fine
+    '''
+    if not oauth_flags:
+        return
+
+    oauth_parser = argparse.ArgumentParser(parents=[tools.argparser], add_help=False)
+    _, unknown = oauth_parser.parse_known_args(oauth_flags)
+    if unknown:
+        parser.error('unrecognized arguments: {0}'.format(' '.join(unknown)))
+
+
+def check_times(parser, args):
+    # an empty range would just write empty files and look like it worked
+    end = args.end or datetime.datetime.now()
+    if args.start is not None and args.start >= end:
+        parser.error('--start ({0}) must be before --end ({1})'.format(args.start, end))
 
-    with gfit.login():
-        cal_data = gfit.get_cal_data()
-        act_data = gfit.get_activity_data()
-
-    import pdb
-    pdb.set_trace()
-    print(cal_data)
-    print(act_data)
-    print(argv)
-    return 0
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,127 @@
+import asyncio
+import itertools
+from functools import partial
+
+from .gfit_api import GfitAPI
+
+
+class AsyncGfitAPI(GfitAPI):
+    '''
+    An asyncio flavour of GfitAPI, for syncing lots of users from one event loop:
+
+        async with AsyncGfitAPI(settings) as gfit:
+            cal_data = await gfit.get_cal_data()
+
+    httplib2 can only block, so each request still runs on the executor - but the requests from
+    every user share that one bounded executor, rather than each user needing threads of their
+    own. Pass the same executor to every instance to cap the total number of requests in flight.
+
+    Every public method is a coroutine (or, for the iter_ ones, an async generator), so none of
+    them block the event loop - requests, reads and writes of the cache, and parsing the
+    responses all happen on the executor. Those without an async version of their own -
+    get_all_data, get_aggregated and friends - run the whole blocking call there.
+    '''
+    # how many points the iter_ methods fetch from the executor at a time
+    iter_chunk_size = 1000
+
+    def __init__(self, settings_dict=None, executor=None):
+        super().__init__(settings_dict)
+        self.executor = executor
+
+    async def __aenter__(self):
+        return await self.login()
+
+    async def __aexit__(self, exc_type, exc_val, traceback):
+        await self._run(self.__exit__, exc_type, exc_val, traceback)
+
+    def _run(self, func, *args):
+        return asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args))
+
+    async def _iterate(self, iterator, chunk_size):
+        # a trip to the executor per item would take longer than most items do to make
+        while True:
+            chunk = await self._run(lambda: list(itertools.islice(iterator, chunk_size)))
+            if not chunk:
+                return
+            for item in chunk:
+                yield item
+
+    async def login(self):
+        return await self._run(super().login)
+
+    async def _fetch_range_async(self, data_source, start, end):
+        windows = self.get_time_windows(start, end, self.window)
+
+        responses = await asyncio.gather(*(
+            self._run(self._get_dataset, data_source, window_start, window_end)
+            for window_start, window_end in windows
+        ))
+
+        return await self._run(self.merge_responses, responses, start, end)
+
+    async def _get_fit_response_async(self, data_source):
+        end = self.get_end_time()
+
+        if self.cache is None:
+            return await self._fetch_range_async(data_source, self.start, end)
+
+        # the cache is sqlite on disk, so it blocks just like a request does
+        fetch_start = await self._run(self._cache_fetch_start, data_source)
+        self.metrics.cache(data_source, hit=fetch_start >= end)
+        if fetch_start < end:
+            response = await self._fetch_range_async(data_source, fetch_start, end)
+            await self._run(self.cache.store, data_source, response)
+
+        return await self._run(
+            self.cache.get_response,
+            data_source,
+            self.datetime_to_ns(self.start),
+            self.datetime_to_ns(end)
+        )
+
+    async def _get_fit_data_async(self, data_source, data_type):
+        response = await self._get_fit_response_async(data_source)
+        return await self._run(self.preprocess_data, response, data_type)
+
+    async def _get_fit_columns_async(self, data_source, data_type):
+        response = await self._get_fit_response_async(data_source)
+        return await self._run(self._response_columns, response, data_type)
+
+    async def get_data(self, data_source, data_type=None):
+        return await self._get_fit_data_async(data_source, self.get_source_data_type(data_source, data_type))
+
+    async def get_columns(self, data_source, data_type=None):
+        return await self._get_fit_columns_async(data_source, self.get_source_data_type(data_source, data_type))
+
+    async def list_data_sources(self, data_type_names=None):
+        return await self._run(super().list_data_sources, data_type_names)
+
+    async def get_all_data(self, data_sources=None):
+        if data_sources is None:
+            data_sources = await self.list_data_sources()
+        return await self._run(super().get_all_data, data_sources)
+
+    async def get_aggregated(self, data_type, bucket='1d'):
+        return await self._run(super().get_aggregated, data_type, bucket)
+
+    async def get_cal_data(self):
+        return await self._get_fit_data_async(data_source=self.cal_data_source, data_type='fpVal')
+
+    async def get_activity_data(self):
+        return await self._get_fit_data_async(data_source=self.activity_data_source, data_type='intVal')
+
+    async def get_cal_columns(self):
+        return await self._get_fit_columns_async(data_source=self.cal_data_source, data_type='fpVal')
+
+    async def get_activity_columns(self):
+        return await self._get_fit_columns_async(data_source=self.activity_data_source, data_type='intVal')
+
+    def iter_cal_data(self):
+        return self._iterate(super().iter_cal_data(), self.iter_chunk_size)
+
+    def iter_activity_data(self):
+        return self._iterate(super().iter_activity_data(), self.iter_chunk_size)
+
+    def iter_columns(self, data_source, data_type):
+        # each FitColumns is already a whole page
+        return self._iterate(super().iter_columns(data_source, data_type), 1)
@@ -0,0 +1,318 @@
+import time
+import heapq
+import logging
+import itertools
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from .gfit_api import GfitAPI
+from .lazy import LazyImport
+from .retry import NO_RETRIES, RetryPolicy
+from .transport import HttpPool
+
+Storage = LazyImport('oauth2client.file', 'Storage')
+
+logger = logging.getLogger(__name__)
+
+
+class CredentialsError(LookupError):
+    pass
+
+
+class UserQuota(object):
+    '''
+    Keeps track of the requests we've made for one user, so we stay within google's per-user limits
+    - no more than `max_in_flight` requests at once, at least `min_interval` seconds apart, and
+    nothing at all while we're backing off after being throttled.
+
+    It never waits itself - BatchSync checks with it before sending each request, and holds the
+    user's requests back in its queue until they're allowed. Only BatchSync's scheduling thread
+    uses it, so there's no locking
+    '''
+    def __init__(self, max_in_flight=2, min_interval=0):
+        self.max_in_flight = max_in_flight
+        self.min_interval = min_interval
+        self.requests = 0
+        self.throttled = 0
+        self.in_flight = 0
+        # time.monotonic() before which we can't send another request
+        self.not_before = 0
+
+    def has_room(self):
+        return self.in_flight < self.max_in_flight
+
+    def start(self):
+        self.not_before = max(self.not_before, time.monotonic()) + self.min_interval
+        self.in_flight += 1
+        self.requests += 1
+
+    def finish(self):
+        self.in_flight -= 1
+
+    def back_off(self, delay):
+        self.throttled += 1
+        self.not_before = max(self.not_before, time.monotonic() + delay)
+
+
+class BatchSync(object):
+    '''
+    Fetches data for lots of users at once. Every user's requests share one pool of connections
+    and one pool of worker threads, so `max_workers` caps the total number of requests in flight,
+    however many users there are. Users are synced `users_per_round` at a time, and within a round
+    windows are scheduled round robin across users, so one user with a long history doesn't hold
+    everyone else up.
+
+    `users` maps a key of your choosing to the GfitAPI settings for that user - most importantly
+    their 'credentials_file', which must already hold valid credentials: we never start the OAuth
+    flow, as there's nobody here to log in. Users without valid credentials end up in self.errors.
+    Users with a 'cache_dir' only fetch what's new since their last sync, as with GfitAPI.
+
+    When google tells us to slow down (429 or 503) we back off that user according to
+    `retry_policy` - by default exponentially, with a bit of jitter, honouring Retry-After if
+    given. The backoff applies to all of that user's requests, not just the one that failed. Held
+    back requests wait in our queue rather than in a worker thread, so the workers carry on with
+    everyone else's.
+
+    If `metrics` (a gfitpy.metrics.Metrics) is given, it's shared by every user that doesn't have
+    metrics of their own.
+    '''
+    retry_statuses = (429, 503)
+
+    def __init__(self, users, data_sources=None, max_workers=16, pool_size=None,
+                 max_user_requests=2, min_user_interval=0, max_retries=5, backoff=1,
+                 retry_policy=None, metrics=None, users_per_round=100):
+        if data_sources is None:
+            data_sources = [
+                (GfitAPI.cal_data_source, 'fpVal'),
+                (GfitAPI.activity_data_source, 'intVal'),
+            ]
+        self.data_sources = data_sources
+        self.max_workers = max_workers
+        self.users_per_round = users_per_round
+        if retry_policy is None:
+            retry_policy = RetryPolicy(
+                max_attempts=max_retries + 1,
+                backoff=backoff,
+                retry_statuses=self.retry_statuses
+            )
+        self.retry_policy = retry_policy
+        self.pool = HttpPool(size=pool_size or max_workers, timeout=retry_policy.timeout)
+
+        # we do the retrying here, where we can hold back every request for the user
+        self.apis = {}
+        for key, settings in users.items():
+            settings = dict(settings, http_pool=self.pool, retry_policy=NO_RETRIES)
+            settings.setdefault('metrics', metrics)
+            self.apis[key] = GfitAPI(settings)
+        self.quotas = {
+            key: UserQuota(max_user_requests, min_user_interval)
+            for key in users
+        }
+        self.errors = {}
+
+    def run(self):
+        '''
+        Fetch every data source for every user. Returns {user key: {data source: data}}, with the
+        data in the same form as GfitAPI.get_cal_data and friends. Users that failed are left out,
+        and their exceptions can be found in self.errors.
+
+        This holds on to everyone's data until the end - for lots of users, use iter_results
+        '''
+        return dict(self.iter_results())
+
+    def iter_results(self):
+        '''
+        Like run, but yields a (user key, {data source: data}) tuple for each user as soon as they're
+        done, so there's only ever one round of users' data in memory at once
+        '''
+        self.errors = {}
+        keys = list(self.apis)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for round_start in range(0, len(keys), self.users_per_round):
+                yield from self._sync_round(executor, keys[round_start:round_start + self.users_per_round])
+
+    def _sync_round(self, executor, keys):
+        for key, error in zip(keys, executor.map(self._login, keys)):
+            if error is not None:
+                self.errors[key] = error
+
+        ranges = {key: self._user_ranges(key) for key in keys if key not in self.errors}
+        # user key -> deque of (data source, window start, window end, attempt) still to fetch
+        queues = {
+            key: deque(job + (0,) for job in jobs)
+            for key, jobs in self._schedule(ranges).items()
+        }
+        # user key -> {(data source, window start): response}
+        responses = {key: {} for key in ranges}
+
+        # users with nothing to fetch (eg the cache has it all) are done already
+        for key in ranges:
+            if not queues[key]:
+                del queues[key]
+                yield key, self._user_results(key, ranges[key], responses.pop(key))
+
+        # users that can send their next request now, taking turns - and a heap of (time, _, user
+        # key) of those backing off or spacing out their requests. Users are in neither while they
+        # have as many requests in flight as their quota allows, or have nothing left to send
+        ready = deque(queues)
+        waiting = []
+        queued = set(queues)
+        order = itertools.count()
+        running = {}
+
+        while ready or waiting or running:
+            now = time.monotonic()
+            while waiting and waiting[0][0] <= now:
+                ready.append(heapq.heappop(waiting)[2])
+
+            while ready and len(running) < self.max_workers:
+                key = ready.popleft()
+                quota = self.quotas[key]
+                if key in self.errors:
+                    queued.discard(key)
+                    continue
+                if quota.not_before > now:
+                    heapq.heappush(waiting, (quota.not_before, next(order), key))
+                    continue
+
+                job = queues[key].popleft()
+                quota.start()
+                running[executor.submit(self._fetch, key, *job[:3])] = (key, job)
+                if queues[key] and quota.has_room():
+                    ready.append(key)
+                else:
+                    queued.discard(key)
+
+            if not running:
+                # everyone left is waiting on their quota - wait here, rather than in a worker
+                time.sleep(max(waiting[0][0] - now, 0))
+                continue
+
+            timeout = max(waiting[0][0] - now, 0) if waiting else None
+            done, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                key, job = running.pop(future)
+                self.quotas[key].finish()
+                if key in self.errors:
+                    # already given up on them - don't bother with the rest of their requests
+                    continue
+
+                self._job_done(key, job, future, queues[key], responses[key])
+                if key in self.errors:
+                    queues.pop(key)
+                    responses.pop(key)
+                elif queues[key]:
+                    if key not in queued and self.quotas[key].has_room():
+                        ready.append(key)
+                        queued.add(key)
+                elif not self.quotas[key].in_flight:
+                    del queues[key]
+                    yield key, self._user_results(key, ranges[key], responses.pop(key))
+
+    def _job_done(self, key, job, future, queue, responses):
+        data_source, start, end, attempt = job
+        error = future.exception()
+        if error is None:
+            responses[data_source, start] = future.result()
+            return
+
+        if not self.retry_policy.should_retry(error, attempt):
+            logger.error('Giving up on %s', key, exc_info=error)
+            self.errors[key] = error
+            return
+
+        delay = self.retry_policy.delay(error, attempt)
+        self.apis[key].metrics.retry(error, attempt, delay)
+        logger.info('Throttled fetching %s for %s, backing off %.1fs', data_source, key, delay)
+        self.quotas[key].back_off(delay)
+        # first in the queue, so it goes as soon as the user's allowed again
+        queue.appendleft((data_source, start, end, attempt + 1))
+
+    def _login(self, key):
+        api = self.apis[key]
+        try:
+            if api.credentials is None:
+                api.credentials = self._load_credentials(api)
+            api.login()
+        except Exception as e:
+            logger.exception('Could not log in for %s', key)
+            return e
+
+    @staticmethod
+    def _load_credentials(api):
+        # not GfitAPI.get_credentials, as that falls back to the OAuth flow - which would wait for
+        # someone to log in with a browser, and parse our own command line for its flags
+        credentials = Storage(api.credentials_file).get()
+        if credentials is None or credentials.invalid:
+            raise CredentialsError('No valid credentials in {0}'.format(api.credentials_file))
+        return credentials
+
+    def _user_ranges(self, key):
+        '''
+        Returns a (data source, start, end) tuple for each data source, of the time we need to fetch
+        for the user - for users with a cache, only what's new since last time
+        '''
+        api = self.apis[key]
+        end = api.get_end_time()
+
+        ranges = []
+        for data_source, _ in self.data_sources:
+            start = api.start
+            if api.cache is not None:
+                start = api._cache_fetch_start(data_source)
+                api.metrics.cache(data_source, hit=start >= end)
+            ranges.append((data_source, start, end))
+        return ranges
+
+    def _user_results(self, key, ranges, responses):
+        api = self.apis[key]
+
+        results = {}
+        for (data_source, start, end), (_, data_type) in zip(ranges, self.data_sources):
+            windows = sorted(
+                (window_start, response)
+                for (window_source, window_start), response in responses.items()
+                if window_source == data_source
+            )
+            response = api.merge_responses([response for _, response in windows], start, end)
+            if api.cache is not None:
+                if start < end:
+                    api.cache.store(data_source, response)
+                response = api.cache.get_response(
+                    data_source,
+                    api.datetime_to_ns(api.start),
+                    api.datetime_to_ns(end)
+                )
+            results[data_source] = api.preprocess_data(response, data_type)
+        return results
+
+    def _schedule(self, ranges):
+        '''
+        Takes {user key: [(data source, start, end), ...]}, and returns {user key: [(data source,
+        window start, window end), ...]} - each user's windows interleaved across their data
+        sources. Users take turns to send a window each, so every user gets their first window
+        fetched before anyone gets their second
+        '''
+        jobs = {}
+        for key, user_ranges in ranges.items():
+            api = self.apis[key]
+            windows = [
+                [(data_source, start, window_end) for start, window_end in api.get_time_windows(start, end, api.window)]
+                for data_source, start, end in user_ranges
+            ]
+            jobs[key] = list(self._interleave(windows))
+        return jobs
+
+    @staticmethod
+    def _interleave(lists):
+        return (
+            item
+            for items in itertools.zip_longest(*lists)
+            for item in items
+            if item is not None
+        )
+
+    def _fetch(self, key, data_source, start, end):
+        # runs on a worker - retrying is left to _sync_round, so the worker's free while we wait
+        return self.apis[key]._get_dataset(data_source, start, end)
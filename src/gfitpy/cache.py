@@ -0,0 +1,113 @@
+import os
+import json
+import sqlite3
+import threading
+
+
+class DatasetCache(object):
+    '''
+    Keeps raw datapoints in an SQLite database on disk, so we only ever need to ask google for data
+    we haven't seen before. Historical fitness data doesn't change, so for each data source we
+    remember the time range we've synced (the last sync time being the high-water mark), and
+    subsequent syncs only fetch the tail since then.
+
+    Points are stored per data source, not per user - so give each user their own directory.
+    '''
+    filename = 'gfitpy_cache.sqlite3'
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, self.filename)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS points ('
+                '  data_source TEXT NOT NULL,'
+                '  start_ns INTEGER NOT NULL,'
+                '  end_ns INTEGER NOT NULL,'
+                '  point TEXT NOT NULL,'
+                # a point that's still in progress keeps its start time but gets a new end time, so
+                # don't key on the end - we want the newer copy to replace it
+                '  PRIMARY KEY (data_source, start_ns)'
+                ')'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS synced ('
+                '  data_source TEXT PRIMARY KEY,'
+                '  start_ns INTEGER NOT NULL,'
+                '  end_ns INTEGER NOT NULL'
+                ')'
+            )
+
+    def close(self):
+        self._conn.close()
+
+    def synced_range(self, data_source):
+        '''
+        Returns a (start_ns, end_ns) tuple of the time we have data for, or None if we've never
+        synced this data source
+        '''
+        with self._lock:
+            return self._conn.execute(
+                'SELECT start_ns, end_ns FROM synced WHERE data_source = ?',
+                (data_source,)
+            ).fetchone()
+
+    def store(self, data_source, response):
+        '''
+        Save the points from a dataset response. We only track one contiguous range per data source,
+        so the synced range only grows if the response touches or overlaps it - if there's a gap
+        between them, the response's range replaces it (we can't claim to have the gap).
+
+        Points that were still in progress last sync (say, an activity segment that was still going)
+        will have changed since, so any cached points overlapping the response are replaced.
+        '''
+        start_ns = int(response['minStartTimeNs'])
+        end_ns = int(response['maxEndTimeNs'])
+        synced = self.synced_range(data_source)
+        if synced is not None and start_ns <= synced[1] and synced[0] <= end_ns:
+            start_ns, end_ns = min(start_ns, synced[0]), max(end_ns, synced[1])
+
+        with self._lock, self._conn:
+            self._conn.execute(
+                'DELETE FROM points WHERE data_source = ? AND end_ns > ? AND start_ns < ?',
+                (data_source, int(response['minStartTimeNs']), int(response['maxEndTimeNs']))
+            )
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?)',
+                (
+                    (
+                        data_source,
+                        int(point['startTimeNanos']),
+                        int(point['endTimeNanos']),
+                        json.dumps(point)
+                    )
+                    for point in response.get('point', [])
+                )
+            )
+            self._conn.execute(
+                'INSERT OR REPLACE INTO synced VALUES (?, ?, ?)',
+                (data_source, start_ns, end_ns)
+            )
+
+    def get_response(self, data_source, start_ns, end_ns):
+        '''
+        Build a dataset response, in the same shape google would give us, out of the cached points
+        overlapping start_ns to end_ns
+        '''
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT point FROM points WHERE data_source = ? AND end_ns > ? AND start_ns < ?'
+                ' ORDER BY start_ns',
+                (data_source, start_ns, end_ns)
+            ).fetchall()
+
+        response = {
+            'minStartTimeNs': str(start_ns),
+            'maxEndTimeNs': str(end_ns),
+        }
+        if rows:
+            response['point'] = [json.loads(row[0]) for row in rows]
+        return response
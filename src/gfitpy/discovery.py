@@ -0,0 +1,76 @@
+import os
+import time
+import hashlib
+import tempfile
+import threading
+
+from googleapiclient.discovery_cache.base import Cache
+
+from .lazy import LazyImport
+
+# googleapiclient.discovery pulls in httplib2 and oauth2client, so wait until there's a service to build
+httplib2 = LazyImport('httplib2')
+build = LazyImport('googleapiclient.discovery', 'build')
+
+_services = {}
+_services_lock = threading.Lock()
+
+
+class FileCache(Cache):
+    '''
+    Keeps discovery documents on disk, so we don't have to go and fetch them every time we build the
+    API. Documents older than max_age (in seconds) are ignored, and fetched afresh.
+    '''
+    def __init__(self, directory, max_age=24 * 60 * 60):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_age = max_age
+
+    def _path(self, url):
+        return os.path.join(
+            self.directory,
+            hashlib.sha1(url.encode('utf-8')).hexdigest() + '.json'
+        )
+
+    def get(self, url):
+        path = self._path(url)
+        try:
+            if time.time() - os.path.getmtime(path) > self.max_age:
+                return None
+            with open(path, encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def set(self, url, content):
+        # write to a temp file and move it into place, so other processes never see half a document
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, self._path(url))
+
+
+def get_service(cache_dir=None, max_age=24 * 60 * 60):
+    '''
+    Returns the fitness API service object, only building it the first time it's asked for in each
+    process. By default it's built from the discovery document that comes with googleapiclient, so
+    it never has to go to google. If cache_dir is given, the document is fetched from google
+    instead, and kept there between processes for max_age seconds - so new API features turn up
+    without having to upgrade googleapiclient.
+
+    The service is shared by every GfitAPI, so it's built with an unauthorized Http - pass the
+    user's own http to each request's execute().
+    '''
+    with _services_lock:
+        if 'fitness' not in _services:
+            cache = FileCache(cache_dir, max_age) if cache_dir else None
+            _services['fitness'] = build(
+                'fitness',
+                'v1',
+                http=httplib2.Http(),
+                cache_discovery=cache is not None,
+                cache=cache,
+                # the bundled document would never touch the cache
+                static_discovery=cache is None
+            )
+        return _services['fitness']
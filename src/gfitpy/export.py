@@ -0,0 +1,128 @@
+import csv
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+
+class CSVWriter(object):
+    '''
+    Streams FitColumns out to a CSV file, a chunk at a time, so there's never more in memory than
+    the chunk being written:
+
+        with open('out.csv', 'w', newline='') as f, CSVWriter(f) as writer:
+            for columns in gfit.iter_columns(data_source, 'fpVal'):
+                writer.write(columns, data_source)
+    '''
+    fields = ('start_ns', 'end_ns', 'value', 'data_source')
+
+    def __init__(self, fileobj):
+        self.writer = csv.writer(fileobj)
+        self.writer.writerow(self.fields)
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, traceback):
+        self.close()
+
+    def write(self, columns, data_source):
+        self.writer.writerows(
+            (start, end, value, data_source)
+            for start, end, value in zip(
+                columns.start_ns.tolist(),
+                columns.end_ns.tolist(),
+                columns.values.tolist()
+            )
+        )
+        self.rows += len(columns)
+
+    def close(self):
+        pass
+
+
+def to_arrow(columns, data_source):
+    '''
+    Converts FitColumns to a pyarrow Table, with the same columns as CSVWriter. Requires pyarrow
+    '''
+    if pyarrow is None:
+        raise ImportError('pyarrow is needed to export to arrow - pip install gfitpy[parquet]')
+
+    return pyarrow.Table.from_arrays(
+        [
+            pyarrow.array(columns.start_ns, type=pyarrow.int64()),
+            pyarrow.array(columns.end_ns, type=pyarrow.int64()),
+            # a float can hold any intVal we're likely to see, and it keeps the schema the same
+            # whatever the data type
+            pyarrow.array(columns.values, type=pyarrow.float64()),
+            pyarrow.array([data_source] * len(columns), type=pyarrow.string()),
+        ],
+        schema=ParquetWriter.schema()
+    )
+
+
+class ParquetWriter(object):
+    '''
+    Streams FitColumns out to a parquet file. Chunks are buffered until there's enough for a row
+    group, then exactly row_group_size rows are written out and forgotten (the rest wait for the
+    next one), so every row group but the last is the same size, and memory is bounded by
+    row_group_size rather than by however much data there is. Requires pyarrow
+    '''
+    def __init__(self, path, row_group_size=64 * 1024):
+        if pyarrow is None:
+            raise ImportError('pyarrow is needed to export to parquet - pip install gfitpy[parquet]')
+
+        self.row_group_size = row_group_size
+        self.rows = 0
+        self._writer = pyarrow.parquet.ParquetWriter(path, self.schema())
+        self._pending = []
+        self._pending_rows = 0
+
+    @staticmethod
+    def schema():
+        return pyarrow.schema([
+            ('start_ns', pyarrow.int64()),
+            ('end_ns', pyarrow.int64()),
+            ('value', pyarrow.float64()),
+            ('data_source', pyarrow.string()),
+        ])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, traceback):
+        self.close()
+
+    def write(self, columns, data_source):
+        if not len(columns):
+            return
+        self._pending.append(to_arrow(columns, data_source))
+        self._pending_rows += len(columns)
+        self.rows += len(columns)
+
+        while self._pending_rows >= self.row_group_size:
+            self._flush(self.row_group_size)
+
+    def _flush(self, rows=None):
+        '''
+        Writes the first `rows` pending rows (or all of them) out as one row group
+        '''
+        if not self._pending_rows:
+            return
+
+        # concatenating and slicing tables doesn't copy the data
+        table = pyarrow.concat_tables(self._pending)
+        if rows is None:
+            rows = len(table)
+        self._writer.write_table(table.slice(0, rows), row_group_size=rows)
+
+        rest = table.slice(rows)
+        self._pending = [rest] if len(rest) else []
+        self._pending_rows = len(rest)
+
+    def close(self):
+        self._flush()
+        self._writer.close()
@@ -0,0 +1,32 @@
+import json
+
+from googleapiclient.errors import HttpError
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def loads(content):
+    '''
+    Decodes JSON from bytes (or str) - with orjson if it's installed, which is several times faster
+    than the json module and goes straight from the bytes, without decoding them to a str first
+    '''
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def decode_response(resp, content):
+    '''
+    Stands in for googleapiclient's JsonModel.response as a request's postproc, for the big
+    responses. googleapiclient decodes the whole body to a str and then parses that, so for a
+    moment there are three copies of the response in memory - this goes straight from the bytes to
+    the dict, via loads.
+    '''
+    if resp.status >= 300:
+        raise HttpError(resp, content)
+    if resp.status == 204:
+        return {}
+    return loads(content)
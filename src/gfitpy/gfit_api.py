@@ -1,18 +1,52 @@
-import httplib2
+import re
+import time
 import argparse
-from datetime import datetime
-
-from googleapiclient.discovery import build
-from oauth2client.file import Storage
-from oauth2client.client import OAuth2WebServerFlow
-from oauth2client import tools
+import threading
+from functools import partial
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
+from .cache import DatasetCache
+from .discovery import get_service
+from .fast_json import decode_response
+from .lazy import LazyImport
+from .metrics import MeteredHttp, Metrics
+from .retry import RetryPolicy
+from .utils.columns import FitColumns
+from .utils.activities import classify
+from .utils.data_types import DATA_TYPES, DataType, data_type_name, get_data_type
 from .utils.date_range import DateRange
+from .utils.timestamps import decode_nanos, ns_to_datetime
+
+# these take a good fraction of a second to import, and aren't needed until we log in
+httplib2 = LazyImport('httplib2')
+tools = LazyImport('oauth2client.tools')
+Storage = LazyImport('oauth2client.file', 'Storage')
+OAuth2WebServerFlow = LazyImport('oauth2client.client', 'OAuth2WebServerFlow')
 
 
 class GfitAPI(object):
     api_scope = None
 
+    # how many milliseconds in each unit of an aggregate bucket size
+    bucket_units = {
+        'ms': 1,
+        's': 1000,
+        'm': 60 * 1000,
+        'h': 60 * 60 * 1000,
+        'd': 24 * 60 * 60 * 1000,
+    }
+
+    # the most requests google will take in one batch
+    max_batch_size = 1000
+
+    # what google gives back when asked to aggregate com.google.activity.segment
+    activity_summary = 'com.google.activity.summary'
+
+    cal_data_source = 'derived:com.google.calories.expended:com.google.android.gms:from_activities'
+    activity_data_source = 'derived:com.google.activity.segment:com.google.android.gms:merge_activity_segments'
+
     def __init__(self, settings_dict=None):
         if settings_dict is None:
             settings_dict = {}
@@ -24,9 +58,34 @@ class GfitAPI(object):
         self.api_scope = settings['api_scope']
 
         self.start = settings['start_time']
+        self.end = settings['end_time']
+        self.window = settings['window']
+        self.check_window(self.window)
+        self.max_workers = settings['max_workers']
+        self.page_size = settings['page_size']
+        self.batch_size = settings['batch_size']
+        self.retry_policy = settings['retry_policy']
+        # the base Metrics ignores everything, so it's only worth timing requests if we were given one
+        self.metered = settings['metrics'] is not None
+        self.metrics = settings['metrics'] if self.metered else Metrics()
+        self.fast_json = settings['fast_json']
+        self.cache = DatasetCache(settings['cache_dir']) if settings['cache_dir'] else None
+        self.credentials_file = settings['credentials_file']
+        self.oauth_flags = settings['oauth_flags']
+        self.http_pool = settings['http_pool']
+        self.transport = settings['transport']
+        self.discovery_cache_dir = settings['discovery_cache_dir']
+        self.discovery_max_age = settings['discovery_max_age']
         self.api = None
-        self.credentials = None
+        self.credentials = settings['credentials']
         self.authed_http = None
+        # httplib2 objects aren't thread safe, so every worker thread gets its own - the executor
+        # lives as long as we do, so its threads (and their warm connections) get reused
+        self._local = threading.local()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # (data source, start, end) -> response, for the windows of a fetch that's still going
+        self._completed_windows = {}
         super().__init__()
 
     @staticmethod
@@ -36,17 +95,65 @@ class GfitAPI(object):
             'client_secret': 'MY_CLIENT_SECRET',
             'api_scope': 'https://www.googleapis.com/auth/fitness.activity.read',
             # if not specified, take the data from the earliest time known to man, the beginning of the modern epoch
-            'start_time': datetime(1970, 1, 1)
+            'start_time': datetime(1970, 1, 1),
+            # if not specified, take the data up until now
+            'end_time': None,
+            # long histories are split into windows of this size, and fetched in parallel
+            'window': timedelta(days=30),
+            'max_workers': 4,
+            # max points per response - if None, google decides
+            'page_size': None,
+            # if set, dataset gets are sent in google batch requests of up to this many (google
+            # allows 1000), rather than as an HTTP request each
+            'batch_size': None,
+            # how long to wait for each response, and how to retry the ones that fail
+            'retry_policy': RetryPolicy(),
+            # a gfitpy.metrics.Metrics to tell about requests, retries, parsing and the cache
+            'metrics': None,
+            # decode datasets with gfitpy.fast_json (orjson, if installed) rather than leaving it
+            # to googleapiclient
+            'fast_json': True,
+            # if set, get_cal_data and get_activity_data keep their data here, and only fetch what's
+            # new since the last call. Use a separate directory per user!
+            'cache_dir': None,
+            'credentials_file': 'user_credentials',
+            # oauth2client credentials to use, rather than loading them from credentials_file (or
+            # asking the user) - eg gfitpy.transport.NullCredentials to work offline
+            'credentials': None,
+            # command line flags for oauth2client's login flow - if None, they come from sys.argv
+            'oauth_flags': None,
+            # a gfitpy.transport.HttpPool to share connections with other GfitAPIs
+            'http_pool': None,
+            # where requests go, if not to google - anything with an authorize(credentials) method
+            # returning an httplib2.Http lookalike, eg gfitpy.transport.ReplayHttp or
+            # gfitpy.synthetic.SyntheticHttp
+            'transport': None,
+            # where to keep google's discovery document between runs, and how long to trust it for. If
+            # None, we use the copy that comes with googleapiclient and never fetch it at all
+            'discovery_cache_dir': None,
+            'discovery_max_age': timedelta(days=1),
         }
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, traceback):
-        pass
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def get_end_time(self):
+        return self.end if self.end is not None else datetime.now()
 
     def get_credentials(self):
-        storage = Storage('user_credentials')
+        storage = Storage(self.credentials_file)
 
         cred = storage.get()
         if cred is None or cred.invalid:
@@ -60,39 +167,482 @@ class GfitAPI(object):
             self.api_scope
         )
         # google requires me to give an argparser for flags,
-        # although I know i'll be passing none in
+        # although I usually pass none in
         parser = argparse.ArgumentParser(parents=[tools.argparser])
-        flags = parser.parse_args()
+        flags = parser.parse_args(self.oauth_flags)
         return tools.run_flow(flow, storage, flags)
 
     def login(self):
         # code liberated from:
         #  https://cloud.google.com/appengine/docs/python/endpoints/access_from_python
-        self.credentials = self.get_credentials()
+        login_start = time.perf_counter()
+        if self.credentials is None:
+            self.credentials = self.get_credentials()
 
-        self.authed_http = self.credentials.authorize(httplib2.Http())
-        self.api = build('fitness', 'v1', http=self.authed_http)
+        self.authed_http = self._authorize()
+        # the service is shared between instances - every request gets our own http on execute
+        self.api = get_service(
+            cache_dir=self.discovery_cache_dir,
+            max_age=self.discovery_max_age.total_seconds()
+        )
+        self.metrics.login(time.perf_counter() - login_start)
         return self.__enter__()
 
-    def _get_fit_data(self, data_source, data_type):
-        response = self.api.users().dataSources().datasets().get(
+    def _authorize(self):
+        if self.transport is not None:
+            http = self.transport.authorize(self.credentials)
+        elif self.http_pool is not None:
+            http = self.http_pool.authorize(self.credentials)
+        else:
+            http = self.credentials.authorize(httplib2.Http(timeout=self.retry_policy.timeout))
+
+        if self.metered:
+            http = MeteredHttp(http, self.metrics)
+        return http
+
+    def _get_http(self):
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            http = self._local.http = self._authorize()
+        return http
+
+    def _execute(self, request):
+        return self.retry_policy.call(request.execute, http=self._get_http(), on_retry=self.metrics.retry)
+
+    def _iter_dataset_pages(self, data_source, start, end):
+        '''
+        Yields each page of the dataset between start and end, following nextPageToken until
+        google has nothing more to give us
+        '''
+        page_args = self._page_args()
+
+        while True:
+            response = self._execute(self._dataset_request(data_source, start, end, page_args))
+            yield response
+
+            if not response.get('nextPageToken'):
+                break
+            page_args['pageToken'] = response['nextPageToken']
+
+    def _page_args(self):
+        page_args = {}
+        if self.page_size is not None:
+            page_args['limit'] = self.page_size
+        return page_args
+
+    def _dataset_request(self, data_source, start, end, page_args):
+        request = self.api.users().dataSources().datasets().get(
             userId='me',
             dataSourceId=data_source,
-            datasetId=self.get_time_range_str(self.start, datetime.now())
-        ).execute()
+            datasetId=self.get_time_range_str(start, end),
+            **page_args
+        )
+        if self.fast_json:
+            # datasets are the responses big enough for this to matter
+            request.postproc = decode_response
+        return request
+
+    def _get_dataset(self, data_source, start, end):
+        pages = self._iter_dataset_pages(data_source, start, end)
+        response = next(pages)
+        for page in pages:
+            response.setdefault('point', []).extend(page.get('point', []))
+        response.pop('nextPageToken', None)
+        return response
+
+    def _fetch_range(self, data_source, start, end):
+        return self._fetch_ranges([(data_source, start, end)])[0]
+
+    def _fetch_ranges(self, ranges):
+        '''
+        Fetches a list of (data_source, start, end) ranges, returning a merged response for each.
+        Every window of every range goes on the same executor, so one data source with a long
+        history doesn't hold up the rest.
+
+        Windows are kept as they complete, until every range has been fetched - so if one window
+        fails for good, calling again only fetches the windows we don't already have. Only the
+        windows of the latest fetch of each data source are kept, though - with end_time None the
+        last window is different every time, and would otherwise never be cleared out
+        '''
+        jobs = [
+            (i, (data_source,) + window)
+            for i, (data_source, start, end) in enumerate(ranges)
+            for window in self.get_time_windows(start, end, self.window)
+        ]
+        self._forget_windows({data_source for data_source, _, _ in ranges}, {window for _, window in jobs})
+        missing = [window for _, window in jobs if window not in self._completed_windows]
+
+        if self.batch_size:
+            for window, response in zip(missing, self._batch_get_datasets(missing)):
+                self._completed_windows[window] = response
+        else:
+            list(self._get_executor().map(lambda window: self._fetch_window(*window), missing))
+
+        windows = [[] for _ in ranges]
+        for i, window in jobs:
+            windows[i].append(self._completed_windows[window])
+        for _, window in jobs:
+            self._completed_windows.pop(window, None)
+        return [
+            self.merge_responses(range_responses, start, end)
+            for range_responses, (_, start, end) in zip(windows, ranges)
+        ]
+
+    def _forget_windows(self, data_sources, keep):
+        # windows from earlier fetches of these sources that this fetch won't use
+        for window in list(self._completed_windows):
+            if window[0] in data_sources and window not in keep:
+                self._completed_windows.pop(window, None)
+
+    def _fetch_window(self, data_source, start, end):
+        self._completed_windows[data_source, start, end] = self._get_dataset(data_source, start, end)
+
+    def _batch_get_datasets(self, windows):
+        '''
+        Like calling _get_dataset for each (data_source, start, end) in windows, but with the gets
+        sent batch_size at a time as google batch requests - so a dozen data sources is one round
+        trip rather than a dozen. Windows with more than one page have their next page sent in the
+        next round of batches, as do any gets that failed but are worth retrying
+        '''
+        batch_size = min(self.batch_size, self.max_batch_size)
+        responses = [None] * len(windows)
+        attempts = [0] * len(windows)
+        errors = []
+        pending = [(i, self._page_args()) for i in range(len(windows))]
+
+        while pending:
+            next_pending = []
+            delays = []
+
+            def on_response(page_args, request_id, response, exception):
+                i = int(request_id)
+                if exception is not None:
+                    if not self.retry_policy.should_retry(exception, attempts[i]):
+                        errors.append(exception)
+                        return
+                    delays.append(self.retry_policy.delay(exception, attempts[i]))
+                    self.metrics.retry(exception, attempts[i], delays[-1])
+                    attempts[i] += 1
+                    next_pending.append((i, page_args))
+                    return
+
+                page_token = response.pop('nextPageToken', None)
+                if responses[i] is None:
+                    responses[i] = response
+                else:
+                    responses[i].setdefault('point', []).extend(response.get('point', []))
+
+                if page_token:
+                    next_pending.append((i, dict(page_args, pageToken=page_token)))
+                else:
+                    self._completed_windows[windows[i]] = responses[i]
+
+            batches = []
+            for chunk_start in range(0, len(pending), batch_size):
+                batch = self.api.new_batch_http_request()
+                for i, page_args in pending[chunk_start:chunk_start + batch_size]:
+                    batch.add(
+                        self._dataset_request(*windows[i], page_args=page_args),
+                        callback=partial(on_response, page_args),
+                        request_id=str(i)
+                    )
+                batches.append(batch)
+
+            list(self._get_executor().map(self._execute, batches))
+
+            if errors:
+                raise errors[0]
+            if delays:
+                time.sleep(max(delays))
+            pending = sorted(next_pending)
+
+        return responses
+
+    def _get_fit_response(self, data_source):
+        end = self.get_end_time()
+
+        if self.cache is None:
+            return self._fetch_range(data_source, self.start, end)
+        else:
+            return self._sync_cache(data_source, end)
+
+    def _get_fit_responses(self, data_sources):
+        '''
+        Like _get_fit_response, for several data sources at once
+        '''
+        end = self.get_end_time()
+
+        if self.cache is None:
+            return self._fetch_ranges([(data_source, self.start, end) for data_source in data_sources])
+
+        ranges = [(data_source, self._cache_fetch_start(data_source), end) for data_source in data_sources]
+        for data_source, start, _ in ranges:
+            self.metrics.cache(data_source, hit=start >= end)
+        ranges = [(data_source, start, end) for data_source, start, end in ranges if start < end]
+        for (data_source, _, _), response in zip(ranges, self._fetch_ranges(ranges)):
+            self.cache.store(data_source, response)
+
+        return [
+            self.cache.get_response(data_source, self.datetime_to_ns(self.start), self.datetime_to_ns(end))
+            for data_source in data_sources
+        ]
+
+    def _get_fit_data(self, data_source, data_type):
+        return self.preprocess_data(self._get_fit_response(data_source), data_type)
+
+    def _get_fit_columns(self, data_source, data_type):
+        return self._response_columns(self._get_fit_response(data_source), data_type)
+
+    def _response_columns(self, response, data_type):
+        parse_start = time.perf_counter()
+        if isinstance(data_type, DataType):
+            columns = data_type.to_columns(response)
+        else:
+            columns = FitColumns.from_response(response, data_type)
+        self.metrics.parse(len(response.get('point', [])), time.perf_counter() - parse_start)
+        return columns
+
+    def _sync_cache(self, data_source, end):
+        fetch_start = self._cache_fetch_start(data_source)
+        self.metrics.cache(data_source, hit=fetch_start >= end)
+        if fetch_start < end:
+            self.cache.store(data_source, self._fetch_range(data_source, fetch_start, end))
+
+        return self.cache.get_response(
+            data_source,
+            self.datetime_to_ns(self.start),
+            self.datetime_to_ns(end)
+        )
+
+    def _cache_fetch_start(self, data_source):
+        synced = self.cache.synced_range(data_source)
+
+        if synced is not None and synced[0] <= self.datetime_to_ns(self.start):
+            # we've already got everything up to the high-water mark, only fetch the tail. If start is
+            # past the mark, fetch the gap too - the cache only knows about one contiguous range
+            return ns_to_datetime(synced[1])
+        return self.start
+
+    def _iter_fit_data(self, data_source, data_type):
+        windows = self.get_time_windows(self.start, self.get_end_time(), self.window)
+
+        for i, (start, end) in enumerate(windows):
+            for page in self._iter_dataset_pages(data_source, start, end):
+                points = self.window_points(page, first_window=(i == 0))
+                yield from self.process_datapoints(points, data_type)
+
+    def iter_columns(self, data_source, data_type):
+        '''
+        Yields a FitColumns for each page of data_source as it is fetched, window by window
+        '''
+        windows = self.get_time_windows(self.start, self.get_end_time(), self.window)
+
+        for i, (start, end) in enumerate(windows):
+            for page in self._iter_dataset_pages(data_source, start, end):
+                points = self.window_points(page, first_window=(i == 0))
+                yield FitColumns.from_response({'point': points}, data_type)
+
+    def list_data_sources(self, data_type_names=None):
+        '''
+        Returns the data sources the user has, optionally only those of the given data types (eg
+        ['com.google.heart_rate.bpm']). Each is a dict as described here:
+        https://developers.google.com/fit/rest/v1/reference/users/dataSources
+        '''
+        kwargs = {}
+        if data_type_names is not None:
+            kwargs['dataTypeName'] = list(data_type_names)
+
+        response = self._execute(self.api.users().dataSources().list(userId='me', **kwargs))
+        return response.get('dataSource', [])
+
+    @staticmethod
+    def get_source_data_type(data_source, data_type=None):
+        '''
+        Works out how to decode data_source's points. data_source is an ID, or a dict from
+        list_data_sources. If data_type isn't given, it comes from the data source - from its
+        description if we have one, otherwise by looking the data type in its ID up in the registry
+        '''
+        if data_type is not None:
+            return data_type
+        if isinstance(data_source, dict):
+            return DataType.from_description(data_source['dataType'])
+        return get_data_type(data_type_name(data_source))
 
-        return self.preprocess_data(response, data_type)
+    def get_data(self, data_source, data_type=None):
+        '''
+        Fetches any data source. data_type is a DataType, or the value key (eg 'fpVal') for single
+        field types - if not given, it's looked up from the data source's ID. Points from single
+        field data types have a plain value, and from multi-field ones a dict of field name to value
+        '''
+        return self._get_fit_data(data_source, self.get_source_data_type(data_source, data_type))
+
+    def get_columns(self, data_source, data_type=None):
+        '''
+        Like get_data, but returns columns - see DataType.to_columns
+        '''
+        return self._get_fit_columns(data_source, self.get_source_data_type(data_source, data_type))
+
+    def get_all_data(self, data_sources=None):
+        '''
+        Fetches several data sources in one go. data_sources is a list of IDs, or of dicts from
+        list_data_sources - if not given, every data source the user has is fetched. Returns an
+        OrderedDict of data source ID to the same as get_data
+        '''
+        if data_sources is None:
+            data_sources = self.list_data_sources()
+
+        ids = [
+            source['dataStreamId'] if isinstance(source, dict) else source
+            for source in data_sources
+        ]
+        data_types = [self.get_source_data_type(source) for source in data_sources]
+
+        return OrderedDict(
+            (data_source, self.preprocess_data(response, data_type))
+            for data_source, data_type, response in zip(ids, data_types, self._get_fit_responses(ids))
+        )
 
     def get_cal_data(self):
-        data = 'derived:com.google.calories.expended:com.google.android.gms:from_activities'
-        return self._get_fit_data(data_source=data, data_type='fpVal')
+        return self._get_fit_data(data_source=self.cal_data_source, data_type='fpVal')
 
     def get_activity_data(self):
-        data = 'derived:com.google.activity.segment:com.google.android.gms:merge_activity_segments'
-        return self._get_fit_data(data_source=data, data_type='intVal')
+        return self._get_fit_data(data_source=self.activity_data_source, data_type='intVal')
+
+    def get_cal_columns(self):
+        '''
+        Like get_cal_data, but returns a FitColumns rather than a list of dicts
+        '''
+        return self._get_fit_columns(data_source=self.cal_data_source, data_type='fpVal')
+
+    def get_activity_columns(self):
+        '''
+        Like get_activity_data, but returns a FitColumns rather than a list of dicts
+        '''
+        return self._get_fit_columns(data_source=self.activity_data_source, data_type='intVal')
+
+    def iter_cal_data(self):
+        '''
+        Like get_cal_data, but yields each point as it is fetched, rather than building a list
+        '''
+        return self._iter_fit_data(data_source=self.cal_data_source, data_type='fpVal')
+
+    def iter_activity_data(self):
+        '''
+        Like get_activity_data, but yields each point as it is fetched, rather than building a list
+        '''
+        return self._iter_fit_data(data_source=self.activity_data_source, data_type='intVal')
+
+    def get_aggregated(self, data_type, bucket='1d'):
+        '''
+        Has google sum up data_type (eg 'com.google.calories.expended') into buckets of time for us,
+        rather than fetching every point. bucket is a number and a unit (ms, s, m, h or d), or a
+        timedelta. Returns an OrderedDict mapping each bucket's DateRange to its total - for
+        'com.google.activity.segment', a dict of Activity to how long was spent doing it.
+
+        Types that aggregate to several fields (eg heart rate, whose summaries have an average, max
+        and min) can't be totalled, and raise a ValueError.
+        '''
+        bucket_ms = self.parse_bucket(bucket)
+        end = self.get_end_time()
+
+        # fetch in windows as for datasets, but keep each window a whole number of buckets, so that
+        # the buckets line up with what google would have given us in one go
+        window = self.window
+        if window is not None:
+            bucket_size = timedelta(milliseconds=bucket_ms)
+            window = max(window // bucket_size, 1) * bucket_size
+
+        responses = list(self._get_executor().map(
+            lambda window: self._get_aggregate(data_type, bucket_ms, *window),
+            self.get_time_windows(self.start, end, window)
+        ))
+
+        buckets = OrderedDict()
+        for response in responses:
+            buckets.update(self.process_buckets(response))
+        return buckets
+
+    def _get_aggregate(self, data_type, bucket_ms, start, end):
+        return self._execute(self.api.users().dataset().aggregate(
+            userId='me',
+            body={
+                'aggregateBy': [{'dataTypeName': data_type}],
+                'bucketByTime': {'durationMillis': bucket_ms},
+                'startTimeMillis': self.datetime_to_ns(start) // 1000000,
+                'endTimeMillis': self.datetime_to_ns(end) // 1000000,
+            }
+        ))
 
     @staticmethod
-    def process_datapoint(point, data_type):
+    def parse_bucket(bucket):
+        '''
+        Returns the size of the bucket in milliseconds
+        '''
+        if isinstance(bucket, timedelta):
+            return int(bucket.total_seconds() * 1000)
+
+        match = re.match(r'^(\d+)(ms|s|m|h|d)$', bucket)
+        if match is None:
+            raise ValueError('Cannot understand bucket size {0}'.format(bucket))
+        return int(match.group(1)) * GfitAPI.bucket_units[match.group(2)]
+
+    @staticmethod
+    def process_buckets(response):
+        buckets = OrderedDict()
+        for bucket in response.get('bucket', []):
+            times = DateRange(
+                ns_to_datetime(int(bucket['startTimeMillis']) * 1000000),
+                ns_to_datetime(int(bucket['endTimeMillis']) * 1000000)
+            )
+            buckets[times] = GfitAPI.bucket_total(bucket.get('dataset', []))
+        return buckets
+
+    @staticmethod
+    def bucket_total(datasets):
+        '''
+        Adds up the points in a bucket, decoding them according to their data type. Aggregating
+        activity segments gives activity summaries - an activity, a duration and a number of
+        segments - so those are totalled up as a dict of Activity (or the activity's number, if we
+        don't know it) to timedelta
+        '''
+        total = 0
+        for dataset in datasets:
+            name = data_type_name(dataset['dataSourceId']) if 'dataSourceId' in dataset else None
+            if name == GfitAPI.activity_summary:
+                total = {}
+
+            for point in dataset.get('point', []):
+                point_name = point.get('dataTypeName', name)
+                if point_name == GfitAPI.activity_summary:
+                    summary = get_data_type(point_name).decode(point)
+                    activity = classify([summary['activity']])[0] or summary['activity']
+                    # in case the dataset didn't say what it was
+                    total = total or {}
+                    total[activity] = total.get(activity, timedelta()) + timedelta(milliseconds=summary['duration'])
+                else:
+                    total += GfitAPI.bucket_value(point, point_name)
+        return total
+
+    @staticmethod
+    def bucket_value(point, name=None):
+        data_type = DATA_TYPES.get(name)
+        if data_type is not None and len(data_type.fields) != 1:
+            raise ValueError('Cannot total {0} points, as they have several fields: {1}'.format(
+                name, ', '.join(data_type.field_names)
+            ))
+        if len(point['value']) != 1:
+            raise ValueError('Cannot total points with several values, found {0}'.format(point))
+
+        value = point['value'][0]
+        if 'fpVal' in value:
+            return value['fpVal']
+        return value.get('intVal', 0)
+
+    @staticmethod
+    def point_value(point, data_type):
+        if isinstance(data_type, DataType):
+            return data_type.decode(point)
+
         # no idea what might trip this one up
         if len(point['value']) != 1:
             raise ValueError(
@@ -100,36 +650,133 @@ class GfitAPI(object):
                     point
                 )
             )
+        return point['value'][0][data_type]
 
-        start_ns = float(point['startTimeNanos'])
-        end_ns = float(point['endTimeNanos'])
-
-        start = datetime.fromtimestamp(start_ns / 1e9)
-        end = datetime.fromtimestamp(end_ns / 1e9)
-
+    @staticmethod
+    def make_datapoint(start_ns, end_ns, value):
         # the calories burnt between start and end
         return {
-            'times': DateRange(start, end),
-            'value': point['value'][0][data_type]
+            'times': DateRange(ns_to_datetime(start_ns), ns_to_datetime(end_ns)),
+            'value': value
         }
 
-    def preprocess_data(self, data, data_type):
-        global_start = datetime.fromtimestamp(float(data['minStartTimeNs']) / 1e9)
-        global_end = datetime.fromtimestamp(float(data['maxEndTimeNs']) / 1e9)
+    @staticmethod
+    def process_datapoint(point, data_type):
+        value = GfitAPI.point_value(point, data_type)
+        return GfitAPI.make_datapoint(
+            int(point['startTimeNanos']),
+            int(point['endTimeNanos']),
+            value
+        )
 
-        if 'point' in data:
-            points = [self.process_datapoint(point, data_type) for point in data['point']]
-        else:
-            points = []
+    @staticmethod
+    def process_datapoints(points, data_type):
+        '''
+        Like process_datapoint, for a whole list of points - all the timestamps are decoded in one go
+        '''
+        values = [GfitAPI.point_value(point, data_type) for point in points]
+        starts = decode_nanos([point['startTimeNanos'] for point in points])
+        ends = decode_nanos([point['endTimeNanos'] for point in points])
+
+        # consecutive points usually share a boundary, so only convert each timestamp the once
+        times = {ns: ns_to_datetime(ns) for ns in set(starts).union(ends)}
+
+        return [
+            {'times': DateRange(times[start], times[end]), 'value': value}
+            for start, end, value in zip(starts, ends, values)
+        ]
+
+    def preprocess_data(self, data, data_type):
+        '''
+        Returns {'times': DateRange, 'data': [point, ...]} - times is None if the range asked for was
+        empty (eg starting in the future)
+        '''
+        parse_start = time.perf_counter()
+        start_ns = int(data['minStartTimeNs'])
+        end_ns = int(data['maxEndTimeNs'])
+        times = None
+        if start_ns < end_ns:
+            times = DateRange(ns_to_datetime(start_ns), ns_to_datetime(end_ns))
 
+        points = self.process_datapoints(data.get('point', []), data_type)
+        self.metrics.parse(len(points), time.perf_counter() - parse_start)
         return {
-            'times': DateRange(global_start, global_end),
+            'times': times,
             'data': points
         }
 
     @staticmethod
-    def get_time_range_str(start, end):
+    def merge_responses(responses, start=None, end=None):
+        '''
+        Stitch together the responses for consecutive time windows into one big response. Points
+        that straddle a window boundary come back in both windows, so only keep the first copy.
+
+        start and end are the range the windows were for - if it was empty there are no windows at
+        all, and we return an empty response for the range instead
+        '''
+        if not responses:
+            if start is None or end is None:
+                raise ValueError('Need the start and end of the range to merge no responses')
+            return {
+                'minStartTimeNs': str(GfitAPI.datetime_to_ns(start)),
+                'maxEndTimeNs': str(GfitAPI.datetime_to_ns(max(start, end))),
+            }
+
+        points = []
+        for i, response in enumerate(responses):
+            points.extend(GfitAPI.window_points(response, first_window=(i == 0)))
+
+        merged = {
+            'minStartTimeNs': responses[0]['minStartTimeNs'],
+            'maxEndTimeNs': responses[-1]['maxEndTimeNs'],
+        }
+        if points:
+            merged['point'] = points
+        return merged
+
+    @staticmethod
+    def window_points(response, first_window):
+        '''
+        Returns the points in a window's response that weren't already returned by the window
+        before it
+        '''
+        points = response.get('point', [])
+        if first_window:
+            return points
+
+        window_start = int(response['minStartTimeNs'])
+        return [point for point in points if int(point['startTimeNanos']) >= window_start]
+
+    @staticmethod
+    def check_window(window):
+        # a window that isn't positive would never get us any closer to the end of the range.
+        # window * 0 is the zero of whatever window is - a timedelta, or ns in the tests
+        if window is not None and window <= window * 0:
+            raise ValueError('window must be positive, not {0}'.format(window))
+
+    @staticmethod
+    def get_time_windows(start, end, window):
+        '''
+        Split the time between start and end into consecutive (start, end) tuples, each no longer
+        than window. If window is None, the whole range is returned as one window.
+        '''
+        if window is None:
+            return [(start, end)]
+        GfitAPI.check_window(window)
+
+        windows = []
+        while start < end:
+            windows.append((start, min(start + window, end)))
+            start += window
+        return windows
+
+    @staticmethod
+    def datetime_to_ns(time):
         # google accepts timestamps in nanoseconds
-        start = int(start.timestamp() * 1e9)
-        end = int(end.timestamp() * 1e9)
+        return int(time.timestamp() * 1e9)
+
+    @staticmethod
+    def get_time_range_str(start, end):
+        start = GfitAPI.datetime_to_ns(start)
+        end = GfitAPI.datetime_to_ns(end)
         return '{s}-{e}'.format(s=start, e=end)
@@ -0,0 +1,39 @@
+import importlib
+
+
+class LazyImport(object):
+    '''
+    Stands in for a module (or something in one) that's slow to import, only importing it the first
+    time it's actually used - so that importing gfitpy doesn't mean waiting for googleapiclient,
+    oauth2client and httplib2 when all you want is the utils:
+
+        httplib2 = LazyImport('httplib2')
+        Storage = LazyImport('oauth2client.file', 'Storage')
+
+    Attribute lookups and calls are passed on to the real thing. It can't stand in for a class in
+    isinstance checks, or as a base class - import those properly.
+    '''
+    def __init__(self, module, name=None):
+        self._module = module
+        self._name = name
+
+    def _resolve(self):
+        # import_module is just a dict lookup once the module has been imported
+        target = importlib.import_module(self._module)
+        if self._name is not None:
+            target = getattr(target, self._name)
+        return target
+
+    def __getattr__(self, attr):
+        if attr in ('_module', '_name'):
+            # not set up yet, eg while being copied - don't recurse looking for them
+            raise AttributeError(attr)
+        return getattr(self._resolve(), attr)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        if self._name is not None:
+            return '<LazyImport {0}.{1}>'.format(self._module, self._name)
+        return '<LazyImport {0}>'.format(self._module)
@@ -0,0 +1,185 @@
+import time
+import threading
+
+try:
+    import prometheus_client
+except ImportError:  # pragma: no cover
+    prometheus_client = None
+
+
+class Metrics(object):
+    '''
+    Hooks that GfitAPI calls as it goes, to say where the time went. This base class ignores
+    everything - subclass it and override whichever you're interested in, or use StatsMetrics or
+    PrometheusMetrics. Pass an instance as the 'metrics' setting.
+
+    Hooks can be called from several threads at once, so they need to be thread safe.
+    '''
+    def login(self, seconds):
+        pass
+
+    def request(self, seconds, status, response_bytes):
+        '''
+        Called for every HTTP request sent - a batch request counts as one. status is None if
+        the request didn't get a response at all
+        '''
+        pass
+
+    def retry(self, error, attempt, delay):
+        pass
+
+    def parse(self, points, seconds):
+        '''
+        Called when a response has been turned into points (or columns)
+        '''
+        pass
+
+    def cache(self, data_source, hit):
+        '''
+        Called each time the cache is checked - it's a hit if nothing new needed fetching
+        '''
+        pass
+
+
+class MeteredHttp(object):
+    '''
+    Wraps an authorized http, telling metrics about every request it sends
+    '''
+    def __init__(self, http, metrics):
+        self.http = http
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        # googleapiclient looks for credentials (amongst other things) on the http
+        return getattr(self.http, name)
+
+    def request(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            resp, content = self.http.request(*args, **kwargs)
+        except Exception:
+            self.metrics.request(time.perf_counter() - start, None, 0)
+            raise
+        self.metrics.request(time.perf_counter() - start, resp.status, len(content or b''))
+        return resp, content
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class StatsMetrics(Metrics):
+    '''
+    Keeps everything in memory - call summary() to see how a sync went
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.logins = []
+        self.request_seconds = []
+        self.statuses = {}
+        self.response_bytes = 0
+        self.retries = 0
+        self.parse_seconds = 0
+        self.points = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def login(self, seconds):
+        with self._lock:
+            self.logins.append(seconds)
+
+    def request(self, seconds, status, response_bytes):
+        with self._lock:
+            self.request_seconds.append(seconds)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+            self.response_bytes += response_bytes
+
+    def retry(self, error, attempt, delay):
+        with self._lock:
+            self.retries += 1
+
+    def parse(self, points, seconds):
+        with self._lock:
+            self.points += points
+            self.parse_seconds += seconds
+
+    def cache(self, data_source, hit):
+        with self._lock:
+            if hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+    def summary(self):
+        with self._lock:
+            cache_lookups = self.cache_hits + self.cache_misses
+            return {
+                'login_seconds': sum(self.logins),
+                'requests': len(self.request_seconds),
+                'statuses': dict(self.statuses),
+                'request_seconds': sum(self.request_seconds),
+                'request_seconds_p50': _percentile(self.request_seconds, 0.5),
+                'request_seconds_p95': _percentile(self.request_seconds, 0.95),
+                'response_bytes': self.response_bytes,
+                'retries': self.retries,
+                'points': self.points,
+                'parse_seconds': self.parse_seconds,
+                'cache_hit_rate': self.cache_hits / cache_lookups if cache_lookups else None,
+            }
+
+
+class PrometheusMetrics(Metrics):
+    '''
+    Reports to prometheus_client counters and histograms, all named with `prefix`. Requires
+    prometheus_client
+    '''
+    def __init__(self, registry=None, prefix='gfitpy'):
+        if prometheus_client is None:
+            raise ImportError('prometheus_client is needed for PrometheusMetrics - pip install gfitpy[prometheus]')
+        if registry is None:
+            registry = prometheus_client.REGISTRY
+
+        def name(metric):
+            return '{0}_{1}'.format(prefix, metric)
+
+        self.login_seconds = prometheus_client.Histogram(
+            name('login_seconds'), 'Time taken to log in', registry=registry
+        )
+        self.request_seconds = prometheus_client.Histogram(
+            name('request_seconds'), 'Time taken by each request to google', ['status'], registry=registry
+        )
+        self.response_bytes = prometheus_client.Counter(
+            name('response_bytes'), 'Bytes received from google', registry=registry
+        )
+        self.retries = prometheus_client.Counter(
+            name('retries'), 'Requests retried', ['error'], registry=registry
+        )
+        self.parse_seconds = prometheus_client.Histogram(
+            name('parse_seconds'), 'Time taken to process each response', registry=registry
+        )
+        self.points = prometheus_client.Counter(
+            name('points'), 'Points processed', registry=registry
+        )
+        self.cache_lookups = prometheus_client.Counter(
+            name('cache_lookups'), 'Times the cache was checked', ['result'], registry=registry
+        )
+
+    def login(self, seconds):
+        self.login_seconds.observe(seconds)
+
+    def request(self, seconds, status, response_bytes):
+        self.request_seconds.labels(status=str(status) if status is not None else 'error').observe(seconds)
+        self.response_bytes.inc(response_bytes)
+
+    def retry(self, error, attempt, delay):
+        self.retries.labels(error=type(error).__name__).inc()
+
+    def parse(self, points, seconds):
+        self.parse_seconds.observe(seconds)
+        self.points.inc(points)
+
+    def cache(self, data_source, hit):
+        self.cache_lookups.labels(result='hit' if hit else 'miss').inc()
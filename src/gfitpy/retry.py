@@ -0,0 +1,77 @@
+import time
+import socket
+import random
+import logging
+
+from googleapiclient.errors import HttpError
+
+from .lazy import LazyImport
+
+httplib2 = LazyImport('httplib2')
+
+logger = logging.getLogger(__name__)
+
+
+class RetryPolicy(object):
+    '''
+    How hard to try before giving up on a request. Errors that are likely to go away on their own -
+    the statuses in `retry_statuses`, timeouts and dropped connections - are retried up to
+    `max_attempts` times in all, backing off exponentially from `backoff` seconds (with a bit of
+    jitter, so that lots of threads don't all come back at the same moment) up to `max_backoff`.
+    If google sends a Retry-After, we wait that long instead.
+
+    `timeout` is how many seconds to wait for any one response - None waits forever.
+    '''
+    def __init__(self, max_attempts=5, backoff=1, max_backoff=60,
+                 retry_statuses=(429, 500, 502, 503, 504), timeout=60):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = frozenset(retry_statuses)
+        self.timeout = timeout
+
+    @property
+    def retry_exceptions(self):
+        # the errors that aren't HttpErrors but are still worth another go
+        return (socket.timeout, ConnectionError, httplib2.ServerNotFoundError)
+
+    def is_retryable(self, error):
+        if isinstance(error, HttpError):
+            return error.resp.status in self.retry_statuses
+        return isinstance(error, self.retry_exceptions)
+
+    def should_retry(self, error, attempt):
+        '''
+        attempt counts from 0, so the first retry is after attempt 0 fails
+        '''
+        return attempt + 1 < self.max_attempts and self.is_retryable(error)
+
+    def delay(self, error, attempt):
+        if isinstance(error, HttpError):
+            retry_after = error.resp.get('retry-after')
+            if retry_after is not None and retry_after.isdigit():
+                return int(retry_after)
+        return min(self.backoff * 2 ** attempt, self.max_backoff) * random.uniform(0.5, 1)
+
+    def call(self, func, *args, on_retry=None, **kwargs):
+        '''
+        Calls func until it either works, or fails in a way (or as many times) that isn't worth
+        retrying. If given, on_retry(error, attempt, delay) is called before each retry
+        '''
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if not self.should_retry(e, attempt):
+                    raise
+                delay = self.delay(e, attempt)
+                logger.info('Request failed (%s), retrying in %.1fs', e, delay)
+                if on_retry is not None:
+                    on_retry(e, attempt, delay)
+                time.sleep(delay)
+                attempt += 1
+
+
+# for when something else is in charge of retrying
+NO_RETRIES = RetryPolicy(max_attempts=1)
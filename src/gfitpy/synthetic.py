@@ -0,0 +1,156 @@
+import re
+import json
+import urllib.parse
+
+from .gfit_api import GfitAPI
+from .transport import FakeHttp
+from .utils.activities import Activity
+
+NANOS_PER_MINUTE = 60 * 10 ** 9
+
+# roughly how many calories a minute each activity burns
+CALORIE_RATES = {
+    Activity.sleeping: 0.9,
+    Activity.still_not_moving: 1.3,
+    Activity.walking: 4.5,
+    Activity.running: 11.0,
+    Activity.biking: 8.0,
+}
+
+
+def _noise(seed, i):
+    '''
+    A number between 0 and 1 that looks random, but is always the same for the same seed and i -
+    so overlapping windows see the same data, however the range is split up
+    '''
+    # splitmix64's finaliser - cheap, and good enough that neighbouring i look unrelated
+    x = (i + seed * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & 0xFFFFFFFFFFFFFFFF
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & 0xFFFFFFFFFFFFFFFF
+    return (x ^ (x >> 31)) / 2 ** 64
+
+
+class SyntheticHttp(FakeHttp):
+    '''
+    Makes up calorie and activity data, for load testing without google. Use it as the 'transport'
+    setting, along with NullCredentials:
+
+        GfitAPI({'transport': SyntheticHttp(), 'credentials': NullCredentials(), ...})
+
+    Activity segments are `activity_minutes` long - asleep at night, mostly still during the day,
+    with the odd walk, run or bike ride. Calories come a point every `calorie_minutes`, at a rate
+    that depends on the activity at the time. There's no limit on how much data you can ask for:
+    the points for each window are generated on demand, and the same for every run with the
+    same seed.
+
+    Other data sources come back empty, and anything else (eg aggregates) gets a 404.
+    '''
+    dataset_path = re.compile(r'/users/me/dataSources/(?P<source>[^/]+)/datasets/(?P<start>\d+)-(?P<end>\d+)$')
+    data_sources_path = re.compile(r'/users/me/dataSources$')
+
+    def __init__(self, seed=0, calorie_minutes=1, activity_minutes=15):
+        self.seed = seed
+        self.calorie_minutes = calorie_minutes
+        self.activity_minutes = activity_minutes
+
+    def respond(self, method, uri, body):
+        parts = urllib.parse.urlsplit(uri)
+        query = dict(urllib.parse.parse_qsl(parts.query))
+
+        match = self.dataset_path.search(parts.path)
+        if match is not None and method == 'GET':
+            response = self.dataset(
+                urllib.parse.unquote(match.group('source')),
+                int(match.group('start')),
+                int(match.group('end')),
+                limit=int(query['limit']) if 'limit' in query else None,
+                page_token=query.get('pageToken')
+            )
+            return 200, json.dumps(response).encode('utf-8')
+
+        if self.data_sources_path.search(parts.path) and method == 'GET':
+            return 200, json.dumps({'dataSource': self.data_sources()}).encode('utf-8')
+
+        error = {'error': {'code': 404, 'message': 'SyntheticHttp cannot answer {0} {1}'.format(method, uri)}}
+        return 404, json.dumps(error).encode('utf-8')
+
+    def data_sources(self):
+        return [
+            {
+                'dataStreamId': GfitAPI.cal_data_source,
+                'type': 'derived',
+                'dataType': {'name': 'com.google.calories.expended', 'field': [{'name': 'calories', 'format': 'floatPoint'}]},
+            },
+            {
+                'dataStreamId': GfitAPI.activity_data_source,
+                'type': 'derived',
+                'dataType': {'name': 'com.google.activity.segment', 'field': [{'name': 'activity', 'format': 'integer'}]},
+            },
+        ]
+
+    def dataset(self, data_source, start_ns, end_ns, limit=None, page_token=None):
+        if data_source == GfitAPI.cal_data_source:
+            points = self.calorie_points(start_ns, end_ns)
+        elif data_source == GfitAPI.activity_data_source:
+            points = self.activity_points(start_ns, end_ns)
+        else:
+            points = []
+
+        response = {
+            'minStartTimeNs': str(start_ns),
+            'maxEndTimeNs': str(end_ns),
+            'dataSourceId': data_source,
+        }
+        offset = int(page_token) if page_token else 0
+        if limit is not None:
+            if offset + limit < len(points):
+                response['nextPageToken'] = str(offset + limit)
+            points = points[offset:offset + limit]
+        if points:
+            response['point'] = points
+        return response
+
+    def activity(self, slot):
+        # slot is the number of activity_minutes since the epoch
+        hour = (slot * self.activity_minutes // 60) % 24
+        if hour < 7 or hour >= 23:
+            return Activity.sleeping
+
+        noise = _noise(self.seed, slot)
+        if noise < 0.75:
+            return Activity.still_not_moving
+        elif noise < 0.9:
+            return Activity.walking
+        elif noise < 0.96:
+            return Activity.running
+        return Activity.biking
+
+    def _slots(self, start_ns, end_ns, minutes):
+        width = minutes * NANOS_PER_MINUTE
+        return range(start_ns // width, -(-end_ns // width)), width
+
+    def activity_points(self, start_ns, end_ns):
+        slots, width = self._slots(start_ns, end_ns, self.activity_minutes)
+        return [
+            {
+                'startTimeNanos': str(slot * width),
+                'endTimeNanos': str((slot + 1) * width),
+                'dataTypeName': 'com.google.activity.segment',
+                'value': [{'intVal': self.activity(slot).value, 'mapVal': []}],
+            }
+            for slot in slots
+        ]
+
+    def calorie_points(self, start_ns, end_ns):
+        slots, width = self._slots(start_ns, end_ns, self.calorie_minutes)
+        points = []
+        for slot in slots:
+            activity = self.activity(slot * self.calorie_minutes // self.activity_minutes)
+            rate = CALORIE_RATES[activity] * (0.8 + 0.4 * _noise(self.seed + 1, slot))
+            points.append({
+                'startTimeNanos': str(slot * width),
+                'endTimeNanos': str((slot + 1) * width),
+                'dataTypeName': 'com.google.calories.expended',
+                'value': [{'fpVal': rate * self.calorie_minutes, 'mapVal': []}],
+            })
+        return points
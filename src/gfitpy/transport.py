@@ -0,0 +1,331 @@
+import os
+import json
+import uuid
+import queue
+import hashlib
+import tempfile
+import threading
+import email.parser
+import urllib.parse
+from contextlib import contextmanager
+from http.client import responses as reasons
+
+from .lazy import LazyImport
+
+httplib2 = LazyImport('httplib2')
+
+# httplib2's default - but using httplib2.DEFAULT_MAX_REDIRECTS would mean importing it up front
+DEFAULT_MAX_REDIRECTS = 5
+
+
+class HttpPool(object):
+    '''
+    A pool of httplib2.Http objects to share between users (and threads). httplib2 keeps connections
+    open between requests, so sharing the Http objects lets every user reuse the same warm
+    connections to google, rather than each opening their own. At most `size` requests can be in
+    flight at once - any more will wait for a connection to be free.
+    '''
+    def __init__(self, size=10, timeout=None):
+        self.size = size
+        self.timeout = timeout
+        # LIFO, so the most recently used (and so most likely still open) connection goes out first
+        self._idle = queue.LifoQueue()
+        self._available = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        with self._available:
+            try:
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                http = httplib2.Http(timeout=self.timeout)
+
+            try:
+                yield http
+            finally:
+                self._idle.put(http)
+
+    def authorize(self, credentials):
+        return PooledHttp(self, credentials)
+
+
+class PooledHttp(object):
+    '''
+    Stands in for an authorized httplib2.Http, applying one user's credentials to each request and
+    then sending it on whichever of the pool's connections is free
+    '''
+    # statuses that mean our access token has expired
+    refresh_statuses = (401,)
+
+    def __init__(self, pool, credentials):
+        self.pool = pool
+        # googleapiclient looks for this when sending batch requests
+        self.credentials = credentials
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=DEFAULT_MAX_REDIRECTS, connection_type=None):
+        with self.pool.connection() as http:
+            if not self.credentials.access_token:
+                self.credentials.refresh(http)
+
+            # a stored token can expire between us reading it and using it, so we might need to
+            # try twice
+            for attempt in range(2):
+                auth_headers = dict(headers or {})
+                self.credentials.apply(auth_headers)
+
+                resp, content = http.request(
+                    uri,
+                    method,
+                    body=body,
+                    headers=auth_headers,
+                    redirections=redirections,
+                    connection_type=connection_type
+                )
+                if resp.status not in self.refresh_statuses or attempt:
+                    break
+                self.credentials.refresh(http)
+
+        return resp, content
+
+
+class NullCredentials(object):
+    '''
+    Credentials for when there's no google to log in to - eg with a ReplayHttp or SyntheticHttp.
+    Pass as the 'credentials' setting to skip the OAuth flow entirely
+    '''
+    access_token = 'offline'
+    invalid = False
+
+    def authorize(self, http):
+        return http
+
+    def apply(self, headers):
+        pass
+
+    def refresh(self, http):
+        pass
+
+
+class FakeHttp(object):
+    '''
+    Base for stand-ins for httplib2.Http that answer requests themselves rather than sending them
+    to google. Subclasses implement respond(method, uri, body), returning (status, content).
+    Google batch requests are split up, and each request in them answered separately.
+
+    A FakeHttp can be used as the 'transport' setting directly - every user gets the same one
+    '''
+    # googleapiclient looks for this when sending batch requests
+    credentials = None
+
+    def authorize(self, credentials):
+        return self
+
+    def respond(self, method, uri, body):
+        raise NotImplementedError
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=DEFAULT_MAX_REDIRECTS, connection_type=None):
+        content_type = {key.lower(): value for key, value in (headers or {}).items()}.get('content-type', '')
+        if content_type.startswith('multipart/mixed'):
+            parts = [
+                (content_id,) + self.respond(*request)
+                for content_id, *request in split_batch(uri, body, content_type)
+            ]
+            return join_batch_response(parts)
+
+        status, content = self.respond(method, uri, body)
+        return json_response(status), content
+
+
+def json_response(status):
+    return httplib2.Response({'status': status, 'content-type': 'application/json; charset=UTF-8'})
+
+
+def _decode(body):
+    if isinstance(body, bytes):
+        return body.decode('utf-8')
+    return body or ''
+
+
+def split_batch(uri, body, content_type):
+    '''
+    Splits a google batch request's body up into a (content id, method, uri, body) for each request
+    in it
+    '''
+    message = email.parser.Parser().parsestr(
+        'content-type: {0}\r\n\r\n{1}'.format(content_type, _decode(body))
+    )
+    base = urllib.parse.urlsplit(uri)
+
+    requests = []
+    for part in message.get_payload():
+        request_line, _, rest = part.get_payload().partition('\n')
+        method, path, _ = request_line.split(' ', 2)
+        headers = email.parser.Parser().parsestr(rest)
+        requests.append((
+            part['Content-ID'],
+            method,
+            '{0}://{1}{2}'.format(base.scheme, headers['Host'] or base.netloc, path),
+            headers.get_payload() or None
+        ))
+    return requests
+
+
+def split_batch_response(response, content):
+    '''
+    Splits a google batch response up into a (content id, status, content) for each response in it
+    '''
+    message = email.parser.Parser().parsestr(
+        'content-type: {0}\r\n\r\n{1}'.format(response['content-type'], _decode(content))
+    )
+
+    responses = []
+    for part in message.get_payload():
+        status_line, _, rest = part.get_payload().partition('\n')
+        responses.append((
+            part['Content-ID'],
+            int(status_line.split(' ', 2)[1]),
+            rest.partition('\r\n\r\n')[2].encode('utf-8')
+        ))
+    return responses
+
+
+def join_batch_response(parts):
+    '''
+    The reverse of split_batch_response - builds a batch response out of (content id, status,
+    content) tuples, where the content ids are those of the requests being answered
+    '''
+    boundary = 'batch_{0}'.format(uuid.uuid4().hex)
+    body = []
+    for content_id, status, content in parts:
+        if content_id.startswith('<') and not content_id.startswith('<response-'):
+            content_id = '<response-' + content_id[1:]
+        body.append(
+            '--{boundary}\r\n'
+            'Content-Type: application/http\r\n'
+            'Content-ID: {content_id}\r\n'
+            '\r\n'
+            'HTTP/1.1 {status} {reason}\r\n'
+            'Content-Type: application/json; charset=UTF-8\r\n'
+            '\r\n'
+            '{content}\r\n'.format(
+                boundary=boundary,
+                content_id=content_id,
+                status=status,
+                reason=reasons.get(status, ''),
+                content=_decode(content)
+            )
+        )
+    body.append('--{0}--\r\n'.format(boundary))
+
+    response = httplib2.Response({
+        'status': 200,
+        'content-type': 'multipart/mixed; boundary={0}'.format(boundary),
+    })
+    return response, ''.join(body).encode('utf-8')
+
+
+def request_key(method, uri, body):
+    '''
+    A file name for a request, the same each time it's made - so leaving out anything that changes
+    from one run to the next, like access tokens
+    '''
+    parts = urllib.parse.urlsplit(uri)
+    query = sorted(
+        (key, value)
+        for key, value in urllib.parse.parse_qsl(parts.query)
+        if key not in ('access_token', 'key')
+    )
+    normalised = '{0} {1}{2}?{3}\n{4}'.format(
+        method.upper(),
+        parts.netloc,
+        parts.path,
+        urllib.parse.urlencode(query),
+        _decode(body)
+    )
+    return hashlib.sha1(normalised.encode('utf-8')).hexdigest() + '.json'
+
+
+class ReplayError(LookupError):
+    pass
+
+
+class ReplayHttp(FakeHttp):
+    '''
+    Answers requests from the files saved by a RecordingTransport, so a fetch can be run again
+    without going anywhere near google. Requests that weren't recorded raise a ReplayError.
+
+    Remember that the dataset IDs include the start and end times - so set 'end_time' when both
+    recording and replaying, otherwise none of the requests will match.
+    '''
+    def __init__(self, directory):
+        self.directory = directory
+
+    def respond(self, method, uri, body):
+        path = os.path.join(self.directory, request_key(method, uri, body))
+        try:
+            with open(path, encoding='utf-8') as f:
+                recording = json.load(f)
+        except FileNotFoundError:
+            raise ReplayError('No recording of {0} {1}'.format(method, uri))
+        return recording['status'], recording['content'].encode('utf-8')
+
+
+class RecordingTransport(object):
+    '''
+    Sends requests on as normal (through `transport`, or a plain httplib2.Http if not given), and
+    saves every response in `directory` for a ReplayHttp to play back later
+    '''
+    def __init__(self, directory, transport=None, timeout=None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.transport = transport
+        self.timeout = timeout
+
+    def authorize(self, credentials):
+        if self.transport is not None:
+            http = self.transport.authorize(credentials)
+        else:
+            http = credentials.authorize(httplib2.Http(timeout=self.timeout))
+        return RecordingHttp(http, self.directory)
+
+
+class RecordingHttp(object):
+    def __init__(self, http, directory):
+        self.http = http
+        self.directory = directory
+        self.credentials = getattr(http, 'credentials', None)
+
+    def request(self, uri, method='GET', body=None, headers=None,
+                redirections=DEFAULT_MAX_REDIRECTS, connection_type=None):
+        resp, content = self.http.request(
+            uri,
+            method,
+            body=body,
+            headers=headers,
+            redirections=redirections,
+            connection_type=connection_type
+        )
+
+        content_type = {key.lower(): value for key, value in (headers or {}).items()}.get('content-type', '')
+        if content_type.startswith('multipart/mixed') and resp.status < 300:
+            # save each request in the batch on its own, so they can be replayed however they're
+            # batched up next time
+            requests = {content_id: request for content_id, *request in split_batch(uri, body, content_type)}
+            for content_id, status, part_content in split_batch_response(resp, content):
+                request_id = content_id.replace('<response-', '<', 1)
+                if request_id in requests:
+                    self.save(*requests[request_id], status=status, content=part_content)
+        else:
+            self.save(method, uri, body, status=resp.status, content=content)
+
+        return resp, content
+
+    def save(self, method, uri, body, status, content):
+        path = os.path.join(self.directory, request_key(method, uri, body))
+        # write to a temp file and move it into place, as several threads might be recording at once
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'method': method, 'uri': uri, 'status': status, 'content': _decode(content)}, f)
+        os.replace(tmp_path, path)
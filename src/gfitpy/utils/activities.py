@@ -1,6 +1,8 @@
-from enum import Enum
+from enum import Enum, unique
 
 
+# unique, so that a typo'd duplicate value fails loudly rather than quietly becoming an alias
+@unique
 class Activity(Enum):
     '''
     As defined here:
@@ -17,7 +19,6 @@ class Activity(Enum):
     walking = 7
     running = 8
     aerobics = 9
-    zumba = 10
     badminton = 10
     baseball = 11
     basketball = 12
@@ -109,6 +110,7 @@ class Activity(Enum):
     wheelchair = 98
     windsurfing = 99
     yoga = 100
+    zumba = 101
     diving = 102
     ergometer = 103
     ice_skating = 104
@@ -125,21 +127,43 @@ class Activity(Enum):
         '''
         Returns true if the current value is in the following list of supported vals
         '''
-        return self in (
-            Activity.biking,
-            Activity.walking,
-            Activity.running,
-        )
+        return _VALID[self.value]
 
     @property
     def mfp_id(self):
-        if self == Activity.biking:
-            return 19
-        elif self == Activity.walking:
-            # Walking, 12.5 mins per km, mod. pace
-            return 26688321
-        elif self == Activity.running:
-            # Running (jogging), 10.7 kph (5.6 min per km)
-            return 127
-        else:
+        mfp_id = _MFP_IDS[self.value]
+        if mfp_id is None:
             raise NotImplementedError('We do not know the myfitnesspal ID for {0}'.format(self))
+        return mfp_id
+
+
+_MFP_ID_BY_ACTIVITY = {
+    Activity.biking: 19,
+    # Walking, 12.5 mins per km, mod. pace
+    Activity.walking: 26688321,
+    # Running (jogging), 10.7 kph (5.6 min per km)
+    Activity.running: 127,
+}
+
+# lookup tables, indexed by activity value - much quicker than going through the Enum machinery,
+# which matters when there's a whole column of activities to get through
+_ACTIVITIES = [None] * (max(activity.value for activity in Activity) + 1)
+for _activity in Activity:
+    _ACTIVITIES[_activity.value] = _activity
+del _activity
+_MFP_IDS = [
+    _MFP_ID_BY_ACTIVITY.get(activity) if activity is not None else None
+    for activity in _ACTIVITIES
+]
+# we only support the activities we can send on to myfitnesspal
+_VALID = [mfp_id is not None for mfp_id in _MFP_IDS]
+
+
+def classify(values):
+    '''
+    Maps a whole column of activity values (eg the intVals from GfitAPI.get_activity_data) to
+    Activity members in one go. Values that aren't a known activity come back as None.
+    '''
+    table = _ACTIVITIES
+    size = len(table)
+    return [table[value] if 0 <= value < size else None for value in values]
@@ -0,0 +1,126 @@
+import array
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from .date_range import DateRange
+from .timestamps import decode_nanos, decode_nanos_array, ns_to_datetime
+
+
+class FitColumns(object):
+    '''
+    Processed datapoints stored column by column rather than as a dict per point - start and end
+    times as integer nanoseconds since the epoch, and the values typed according to the point's
+    data type. If numpy is installed the columns are numpy arrays (so `cols.values.sum()` and
+    friends are vectorised), otherwise they fall back to the standard library's `array.array`.
+    '''
+    # (numpy dtype, array.array typecode) for each data type
+    value_types = {
+        'fpVal': ('float64', 'd'),
+        'intVal': ('int64', 'q'),
+    }
+
+    def __init__(self, start_ns, end_ns, values):
+        assert len(start_ns) == len(end_ns) == len(values)
+        self.start_ns, self.end_ns, self.values = start_ns, end_ns, values
+
+    @classmethod
+    def from_response(cls, response, data_type, field=None):
+        '''
+        Build the columns straight from a dataset response's raw JSON, without going via
+        process_datapoint.
+
+        Points normally have exactly one value. For data types with several fields (eg latitude,
+        longitude, accuracy and altitude for a location) pass the index of the field you want -
+        fields a point leaves out come back as NaN. An int64 column can't hold NaN, so intVal fields
+        picked out this way are always floats (exact up to 2 ** 53, which is plenty for google's
+        ints).
+        '''
+        starts, ends, values = [], [], []
+        for point in response.get('point', []):
+            if field is None:
+                if len(point['value']) != 1:
+                    raise ValueError(
+                        'can only handle one value in a point, instead found {0}'.format(point)
+                    )
+                value = point['value'][0][data_type]
+            elif field < len(point['value']) and data_type in point['value'][field]:
+                value = point['value'][field][data_type]
+            else:
+                value = float('nan')
+            starts.append(point['startTimeNanos'])
+            ends.append(point['endTimeNanos'])
+            values.append(value)
+
+        return cls(
+            cls._int_column(starts),
+            cls._int_column(ends),
+            # always the same type for the field, rather than only when there's a gap, so columns
+            # from different pages can still be concatenated
+            cls._value_column(values, 'fpVal' if field is not None else data_type)
+        )
+
+    @classmethod
+    def concat(cls, columns):
+        columns = list(columns)
+        if numpy is not None:
+            return cls(
+                numpy.concatenate([col.start_ns for col in columns]),
+                numpy.concatenate([col.end_ns for col in columns]),
+                numpy.concatenate([col.values for col in columns])
+            )
+
+        start_ns, end_ns, values = columns[0].start_ns[:], columns[0].end_ns[:], columns[0].values[:]
+        for col in columns[1:]:
+            start_ns.extend(col.start_ns)
+            end_ns.extend(col.end_ns)
+            values.extend(col.values)
+        return cls(start_ns, end_ns, values)
+
+    @staticmethod
+    def _int_column(nanos):
+        if numpy is not None:
+            return decode_nanos_array(nanos)
+        return array.array('q', decode_nanos(nanos))
+
+    @classmethod
+    def _value_column(cls, values, data_type):
+        dtype, typecode = cls.value_types[data_type]
+        if numpy is not None:
+            return numpy.array(values, dtype=dtype)
+        return array.array(typecode, values)
+
+    @property
+    def start_times(self):
+        '''
+        The start times as a UTC datetime64[ns] array. Requires numpy
+        '''
+        return numpy.asarray(self.start_ns, dtype=numpy.int64).view('datetime64[ns]')
+
+    @property
+    def end_times(self):
+        '''
+        The end times as a UTC datetime64[ns] array. Requires numpy
+        '''
+        return numpy.asarray(self.end_ns, dtype=numpy.int64).view('datetime64[ns]')
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_points(self):
+        '''
+        Returns the points in the same list of dicts shape as GfitAPI.preprocess_data
+        '''
+        return [
+            {
+                'times': DateRange(ns_to_datetime(start), ns_to_datetime(end)),
+                'value': value
+            }
+            for start, end, value in zip(
+                self.start_ns.tolist(),
+                self.end_ns.tolist(),
+                self.values.tolist()
+            )
+        ]
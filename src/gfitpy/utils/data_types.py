@@ -0,0 +1,154 @@
+from collections import OrderedDict
+
+from .columns import FitColumns
+
+
+class DataType(object):
+    '''
+    A google fit data type - its name, and the name and format of each of its fields, as described
+    here: https://developers.google.com/fit/datatypes
+
+    A point holds one value per field, in the same order as the fields. decode turns those into
+    something usable - just the value for the usual single field types, or a dict of field name to
+    value for types like com.google.location.sample that have several.
+    '''
+    # the key a point's value is kept under, for each field format
+    value_keys = {
+        'floatPoint': 'fpVal',
+        'integer': 'intVal',
+        'map': 'mapVal',
+        'string': 'stringVal',
+    }
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = tuple(fields)
+        self.keys = tuple(self.value_keys[field_format] for _, field_format in self.fields)
+
+    def __repr__(self):
+        return 'DataType({0!r}, {1!r})'.format(self.name, self.fields)
+
+    def __eq__(self, other):
+        return isinstance(other, DataType) and (self.name, self.fields) == (other.name, other.fields)
+
+    def __hash__(self):
+        return hash((self.name, self.fields))
+
+    @classmethod
+    def from_description(cls, description):
+        '''
+        Builds a DataType from the 'dataType' of a data source, as returned by
+        GfitAPI.list_data_sources
+        '''
+        return cls(
+            description['name'],
+            [(field['name'], field['format']) for field in description.get('field', [])]
+        )
+
+    @property
+    def field_names(self):
+        return tuple(name for name, _ in self.fields)
+
+    def decode(self, point):
+        values = point['value']
+        if len(self.fields) == 1:
+            if len(values) != 1:
+                raise ValueError(
+                    'can only handle one value in a point, instead found {0}'.format(point)
+                )
+            return decode_value(values[0], self.keys[0])
+
+        # optional fields (eg a location's altitude) are either left out or sent as {}
+        return {
+            name: decode_value(values[i], key) if i < len(values) else None
+            for i, (name, key) in enumerate(zip(self.field_names, self.keys))
+        }
+
+    def to_columns(self, response):
+        '''
+        Builds FitColumns from a dataset response. Single field types give a FitColumns, same as
+        FitColumns.from_response. Multi-field types give an OrderedDict of field name to
+        FitColumns, one per numeric field - map and string fields can't go in a column, so they're
+        left out. Optional fields can be missing, so these columns are all floats, with NaN for the
+        gaps.
+        '''
+        if len(self.fields) == 1:
+            if self.keys[0] not in FitColumns.value_types:
+                raise ValueError('{0} has no numeric field to make columns from'.format(self.name))
+            return FitColumns.from_response(response, self.keys[0])
+
+        return OrderedDict(
+            (name, FitColumns.from_response(response, key, field=i))
+            for i, (name, key) in enumerate(zip(self.field_names, self.keys))
+            if key in FitColumns.value_types
+        )
+
+
+def decode_value(value, key):
+    if key == 'mapVal':
+        # a list of {'key': ..., 'value': {'fpVal': ...}} - google only ever uses fpVal in maps
+        return {entry['key']: entry['value'].get('fpVal') for entry in value.get('mapVal', [])}
+    return value.get(key)
+
+
+DATA_TYPES = {}
+
+
+def register(data_type):
+    '''
+    Adds a DataType to the registry, replacing any already there with the same name, so that data
+    sources of that type can be fetched without saying how to decode them
+    '''
+    DATA_TYPES[data_type.name] = data_type
+    return data_type
+
+
+def get_data_type(name):
+    try:
+        return DATA_TYPES[name]
+    except KeyError:
+        raise ValueError('Unknown data type {0} - register a DataType for it first'.format(name))
+
+
+def data_type_name(data_source):
+    '''
+    Data source IDs look like type:data type name:app:device:stream, eg
+    'derived:com.google.calories.expended:com.google.android.gms:from_activities'
+    '''
+    parts = data_source.split(':')
+    if len(parts) < 2:
+        raise ValueError('Cannot find a data type in data source {0}'.format(data_source))
+    return parts[1]
+
+
+# the public data types from https://developers.google.com/fit/datatypes - anything else (eg
+# custom data types) either comes from list_data_sources or needs registering
+for _name, _fields in [
+    ('com.google.activity.segment', [('activity', 'integer')]),
+    ('com.google.activity.summary', [('activity', 'integer'), ('duration', 'integer'), ('num_segments', 'integer')]),
+    ('com.google.active_minutes', [('duration', 'integer')]),
+    ('com.google.body.fat.percentage', [('percentage', 'floatPoint')]),
+    ('com.google.calories.bmr', [('calories', 'floatPoint')]),
+    ('com.google.calories.expended', [('calories', 'floatPoint')]),
+    ('com.google.cycling.pedaling.cadence', [('rpm', 'floatPoint')]),
+    ('com.google.distance.delta', [('distance', 'floatPoint')]),
+    ('com.google.heart_minutes', [('intensity', 'floatPoint')]),
+    ('com.google.heart_rate.bpm', [('bpm', 'floatPoint')]),
+    ('com.google.heart_rate.summary', [('average', 'floatPoint'), ('max', 'floatPoint'), ('min', 'floatPoint')]),
+    ('com.google.height', [('height', 'floatPoint')]),
+    ('com.google.hydration', [('volume', 'floatPoint')]),
+    ('com.google.location.sample', [
+        ('latitude', 'floatPoint'),
+        ('longitude', 'floatPoint'),
+        ('accuracy', 'floatPoint'),
+        ('altitude', 'floatPoint'),
+    ]),
+    ('com.google.nutrition', [('nutrients', 'map'), ('meal_type', 'integer'), ('food_item', 'string')]),
+    ('com.google.power.sample', [('watts', 'floatPoint')]),
+    ('com.google.sleep.segment', [('sleep_segment_type', 'integer')]),
+    ('com.google.speed', [('speed', 'floatPoint')]),
+    ('com.google.step_count.cadence', [('rpm', 'floatPoint')]),
+    ('com.google.step_count.delta', [('steps', 'integer')]),
+    ('com.google.weight', [('weight', 'floatPoint')]),
+]:
+    register(DataType(_name, _fields))
@@ -1,11 +1,46 @@
 import datetime
 
 
-class DateRange(object):
-    near_time = datetime.timedelta(seconds=10 * 60)
+class _InstanceOverridable(object):
+    '''
+    A class attribute that individual instances can still override, even though they use __slots__
+    and so have no __dict__ to put the override in
+    '''
+    def __init__(self, default, slot):
+        self.default = default
+        self.slot = slot
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self.default
+        return getattr(instance, self.slot, self.default)
+
+    def __set__(self, instance, value):
+        setattr(instance, self.slot, value)
+
+
+class _DateRangeType(type):
+    '''
+    Setting an _InstanceOverridable on the class itself (eg `DateRange.near_time = ...`) would
+    normally replace the descriptor with the plain value, and then instances couldn't override it
+    any more - so instead we swap in a new descriptor with the new default
+    '''
+    def __setattr__(cls, name, value):
+        current = next((klass.__dict__[name] for klass in cls.__mro__ if name in klass.__dict__), None)
+        if isinstance(current, _InstanceOverridable) and not isinstance(value, _InstanceOverridable):
+            value = _InstanceOverridable(value, current.slot)
+        super().__setattr__(name, value)
+
+
+class DateRange(object, metaclass=_DateRangeType):
+    # there can be millions of these in memory at once - slots save us a dict per range
+    __slots__ = ('_start', '_end', '_near_time')
+
+    near_time = _InstanceOverridable(datetime.timedelta(seconds=10 * 60), '_near_time')
 
     def __init__(self, start, end):
-        assert start < end
+        # start == end is fine - samples like heart rate or location are instants, not spans
+        assert start <= end
         self._start, self._end = start, end
 
     @property
@@ -18,15 +53,20 @@ class DateRange(object):
 
     @property
     def duration(self):
-        return self.end - self.start
+        return self._end - self._start
 
     def near(self, other):
         '''
         Similar to contains, but returns if they are within ten minutes of each other
         '''
-        # create a copy with 5 minutes on either side
-        wider_reach_date = DateRange(self.start - self.near_time, self.end + self.near_time)
-        return other in wider_reach_date
+        # the same as contains, but with near_time added on either side
+        near_time = self.near_time
+        if isinstance(other, DateRange):
+            return self._start - near_time <= other._end and other._start <= self._end + near_time
+        elif isinstance(other, datetime.datetime):
+            return self._start - near_time <= other <= self._end + near_time
+        else:
+            raise NotImplementedError('Cannot compare DateRange and {0}'.format(type(other)))
 
     def __contains__(self, other):
         '''
@@ -42,9 +82,9 @@ class DateRange(object):
         All three x, y and z will return True.
         '''
         if isinstance(other, DateRange):
-            return self.start <= other.end and other.start <= self.end
+            return self._start <= other._end and other._start <= self._end
         elif isinstance(other, datetime.datetime):
-            return self.start <= other <= self.end
+            return self._start <= other <= self._end
         else:
             raise NotImplementedError('Cannot compare DateRange and {0}'.format(type(other)))
 
@@ -53,16 +93,16 @@ class DateRange(object):
         this is smaller than the other if its start time is earlier. if they're identical
         then it looks at the end times
         '''
-        if self.start == other.start:
-            return self.end < other.end
+        if self._start == other._start:
+            return self._end < other._end
         else:
-            return self.start < other.start
+            return self._start < other._start
 
     def __hash__(self):
-        return hash((self.start, self.end))
+        return hash((self._start, self._end))
 
     def __eq__(self, other):
-        return self.start == other.start and self.end == other.end
+        return self._start == other._start and self._end == other._end
 
     # don't bother testing str and repr - they're boring functions
     def __str__(self):  # pragma: no cover
@@ -82,6 +122,139 @@ class DateRange(object):
         Return a new DateRange that encompasses both this DateRange and the Other
         '''
         return DateRange(
-            start=min(self.start, other.start),
-            end=max(self.end, other.end)
+            start=min(self._start, other._start),
+            end=max(self._end, other._end)
         )
+
+
+class IntervalIndex(object):
+    '''
+    An index over lots of DateRanges, to quickly find the ones that overlap (or are near) another
+    range or datetime - in O(log n + k) per query rather than checking every single range.
+
+    `items` can be anything, as long as `key` picks a DateRange out of each one - so to index
+    processed points, use `IntervalIndex(points, key=lambda point: point['times'])`. By default the
+    items are assumed to be DateRanges themselves.
+
+    Internally the ranges are sorted by start, and treated as a balanced binary tree (the middle of
+    each slice being the parent of the two halves either side of it), with each node remembering
+    the latest end in its subtree so that whole subtrees that finish too early can be skipped.
+    '''
+    def __init__(self, items, key=None):
+        if key is None:
+            key = lambda item: item  # noqa
+        pairs = sorted(((key(item), item) for item in items), key=lambda pair: pair[0])
+
+        self._ranges = [date_range for date_range, _ in pairs]
+        self._items = [item for _, item in pairs]
+        self._starts = [date_range.start for date_range in self._ranges]
+        self._max_ends = [None] * len(self._ranges)
+        self._build(0, len(self._ranges))
+
+    def _build(self, lo, hi):
+        if lo >= hi:
+            return None
+        mid = (lo + hi) // 2
+        max_end = self._ranges[mid].end
+        for child_end in (self._build(lo, mid), self._build(mid + 1, hi)):
+            if child_end is not None and child_end > max_end:
+                max_end = child_end
+        self._max_ends[mid] = max_end
+        return max_end
+
+    def __len__(self):
+        return len(self._items)
+
+    def _search(self, start, end):
+        found = []
+        stack = [(0, len(self._ranges))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self._max_ends[mid] < start:
+                # everything under here is over before we start
+                continue
+
+            stack.append((lo, mid))
+            # everything right of mid starts after mid, so if mid starts too late, so do they
+            if self._starts[mid] <= end:
+                if self._ranges[mid].end >= start:
+                    found.append(mid)
+                stack.append((mid + 1, hi))
+
+        return [self._items[i] for i in sorted(found)]
+
+    def overlapping(self, other):
+        '''
+        Returns the items whose ranges intersect `other` (a DateRange or a datetime), in order of
+        start time. Intersecting means the same as for `other in date_range`.
+        '''
+        if isinstance(other, DateRange):
+            return self._search(other.start, other.end)
+        elif isinstance(other, datetime.datetime):
+            return self._search(other, other)
+        else:
+            raise NotImplementedError('Cannot compare DateRange and {0}'.format(type(other)))
+
+    def near(self, other, near_time=None):
+        '''
+        Like overlapping, but also returns the items within `near_time` (by default,
+        DateRange.near_time) of `other`
+        '''
+        if near_time is None:
+            near_time = DateRange.near_time
+        if isinstance(other, DateRange):
+            return self._search(other.start - near_time, other.end + near_time)
+        elif isinstance(other, datetime.datetime):
+            return self._search(other - near_time, other + near_time)
+        else:
+            raise NotImplementedError('Cannot compare DateRange and {0}'.format(type(other)))
+
+
+def coalesce(ranges, gap=None, values=None, aggregate=sum):
+    '''
+    Merges DateRanges that overlap, or that are within `gap` (by default, DateRange.near_time) of
+    each other, into as few ranges as possible - eg to join up a day's fragmented activity segments
+    into sessions. The ranges are sorted once, and then merged in a single sweep. For a gap of
+    timedelta(0), only ranges that overlap or touch are merged.
+
+    If `values` are given (one per range - eg the calories for each point), returns a list of
+    (DateRange, aggregate(values)) tuples, where values are those of the ranges that went into
+    that merged range, in start order.
+    '''
+    if gap is None:
+        gap = DateRange.near_time
+    ranges = list(ranges)
+    if values is not None:
+        values = list(values)
+        if len(values) != len(ranges):
+            raise ValueError('Got {0} values for {1} ranges'.format(len(values), len(ranges)))
+
+    merged = []
+    start = end = None
+    group = []
+
+    def flush():
+        date_range = DateRange(start, end)
+        merged.append(date_range if values is None else (date_range, aggregate(group)))
+
+    for i in sorted(range(len(ranges)), key=ranges.__getitem__):
+        date_range = ranges[i]
+
+        if end is not None and date_range._start <= end + gap:
+            if date_range._end > end:
+                end = date_range._end
+        else:
+            if end is not None:
+                flush()
+            start, end = date_range._start, date_range._end
+            group = []
+
+        if values is not None:
+            group.append(values[i])
+
+    if end is not None:
+        flush()
+    return merged
@@ -0,0 +1,151 @@
+import array
+import datetime
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+from .columns import FitColumns
+from .date_range import DateRange
+from .timestamps import ns_to_datetime
+
+
+def resample(points, width, origin=None):
+    '''
+    Totals up points into fixed width buckets - eg calories per hour or per day. Points that
+    straddle a bucket boundary are split between the buckets in proportion to how much of the point
+    falls in each (so a 100 calorie point from 11:30 to 12:30 gives 50 calories to each hour).
+
+    `points` is either the list of dicts from GfitAPI.preprocess_data, or a FitColumns, and you get
+    the same back: a list of {'times': DateRange, 'value': total} dicts, or a FitColumns with a
+    row per bucket. Every bucket from the first point to the last is included, even empty ones.
+
+    `width` is a timedelta. Buckets are lined up with `origin` (a datetime) - by default, midnight
+    at the start of the first point's day.
+    '''
+    if isinstance(points, FitColumns):
+        return _resample_columns(points, width, origin)
+
+    if not points:
+        return []
+
+    if origin is None:
+        origin = _midnight(min(point['times'].start for point in points))
+
+    first, totals = _sweep(
+        ((point['times'].start, point['times'].end, point['value']) for point in points),
+        width,
+        origin
+    )
+    return [
+        {
+            'times': DateRange(origin + (first + i) * width, origin + (first + i + 1) * width),
+            'value': total
+        }
+        for i, total in enumerate(totals)
+    ]
+
+
+def _midnight(time):
+    return datetime.datetime.combine(time.date(), datetime.time())
+
+
+def _sweep(intervals, width, origin):
+    '''
+    Spreads each (start, end, value) across the buckets it covers. Works equally well on datetimes
+    with timedelta widths, or on integer nanoseconds. Returns the index of the first bucket, and a
+    list of the totals from there on
+    '''
+    totals = {}
+    for start, end, value in intervals:
+        first = (start - origin) // width
+        last = (end - origin) // width
+        if first == last or start == end:
+            totals[first] = totals.get(first, 0) + value
+            continue
+
+        duration = end - start
+        for i in range(first, last + 1):
+            bucket_start = origin + i * width
+            overlap = min(end, bucket_start + width) - max(start, bucket_start)
+            if overlap:
+                totals[i] = totals.get(i, 0) + value * (overlap / duration)
+
+    if not totals:
+        return 0, []
+    first, last = min(totals), max(totals)
+    return first, [totals.get(i, 0) for i in range(first, last + 1)]
+
+
+def _resample_columns(columns, width, origin):
+    width_ns = (width.days * 86400 + width.seconds) * 1000000000 + width.microseconds * 1000
+
+    if not len(columns):
+        return FitColumns(array.array('q'), array.array('q'), array.array('d'))
+
+    if origin is None:
+        origin = _midnight(ns_to_datetime(min(columns.start_ns)))
+    # whole seconds from timestamp(), so no float rounding creeps into the bucket edges
+    origin_ns = (
+        int(origin.replace(microsecond=0).timestamp()) * 1000000000 + origin.microsecond * 1000
+    )
+
+    if numpy is None:
+        first, totals = _sweep(
+            zip(columns.start_ns, columns.end_ns, columns.values),
+            width_ns,
+            origin_ns
+        )
+        edges = [origin_ns + (first + i) * width_ns for i in range(len(totals) + 1)]
+        return FitColumns(array.array('q', edges[:-1]), array.array('q', edges[1:]), array.array('d', totals))
+
+    edges, totals = _vectorised_sweep(
+        numpy.asarray(columns.start_ns, dtype=numpy.int64),
+        numpy.asarray(columns.end_ns, dtype=numpy.int64),
+        numpy.asarray(columns.values, dtype=numpy.float64),
+        width_ns,
+        origin_ns
+    )
+    return FitColumns(edges[:-1], edges[1:], totals)
+
+
+def _vectorised_sweep(start, end, values, width, origin):
+    '''
+    The numpy version of _sweep. Each point contributes value / duration per nanosecond between its
+    start and end, so the running total over time is piecewise linear, changing slope only at
+    point starts and ends. We sort those events once, work out the running total at each of them,
+    and then interpolate it at every bucket edge - the difference between neighbouring edges
+    being that bucket's total.
+    '''
+    durations = end - start
+    instant = durations == 0
+
+    first = (start.min() - origin) // width
+    # a point ending exactly on a bucket boundary doesn't reach into the next bucket
+    last = (numpy.where(instant, start, end - 1).max() - origin) // width
+    edges = origin + numpy.arange(first, last + 2, dtype=numpy.int64) * width
+    rates = numpy.where(instant, 0, values / numpy.where(instant, 1, durations))
+
+    times = numpy.concatenate([start, end])
+    slopes = numpy.concatenate([rates, -rates])
+    order = numpy.argsort(times, kind='mergesort')
+    times, slopes = times[order], numpy.cumsum(slopes[order])
+
+    # the running total at each event, and then at each bucket edge
+    running = numpy.concatenate([[0.0], numpy.cumsum(slopes[:-1] * numpy.diff(times).astype(numpy.float64))])
+    i = numpy.searchsorted(times, edges, side='right') - 1
+    before_first = i < 0
+    i = numpy.maximum(i, 0)
+    at_edges = numpy.where(
+        before_first,
+        0.0,
+        running[i] + slopes[i] * (edges - times[i]).astype(numpy.float64)
+    )
+    totals = numpy.diff(at_edges)
+
+    # points with no duration don't have a rate, so just drop them in the bucket they're in
+    if instant.any():
+        numpy.add.at(totals, (start[instant] - origin) // width - first, values[instant])
+
+    return edges, totals
@@ -0,0 +1,50 @@
+from .activities import classify
+
+
+def attribute_calories(cal_points, activity_points):
+    '''
+    Works out the calories burnt during each activity segment, and in total for each Activity.
+
+    Takes the processed points from get_cal_data and get_activity_data (ie the lists under
+    'data'). Calorie points that only partly overlap a segment count in proportion to how much of
+    them overlaps it. Both streams are sorted and then walked through together in a single pass,
+    rather than comparing every calorie point with every segment - which relies on calorie points
+    not overlapping each other, as google's never do.
+
+    Returns a dict of:
+        'segments': a list of {'times': DateRange, 'activity': Activity, 'calories': float}, in order
+        'activities': a dict mapping each Activity to its total calories
+
+    Activity values gfitpy doesn't know about come back as an activity of None.
+    '''
+    cals = sorted(cal_points, key=lambda point: point['times'])
+    segments = sorted(activity_points, key=lambda point: point['times'])
+    activities = classify([segment['value'] for segment in segments])
+
+    attributed = []
+    totals = {}
+    first = 0
+    for segment, activity in zip(segments, activities):
+        times = segment['times']
+
+        # calorie points that ended before this segment will have ended before the next one too
+        while first < len(cals) and cals[first]['times'].end <= times.start:
+            first += 1
+
+        calories = 0
+        i = first
+        while i < len(cals) and cals[i]['times'].start < times.end:
+            cal_times = cals[i]['times']
+            overlap_start = max(cal_times.start, times.start)
+            overlap_end = min(cal_times.end, times.end)
+            if overlap_start < overlap_end:
+                calories += cals[i]['value'] * ((overlap_end - overlap_start) / cal_times.duration)
+            i += 1
+
+        attributed.append({'times': times, 'activity': activity, 'calories': calories})
+        totals[activity] = totals.get(activity, 0) + calories
+
+    return {
+        'segments': attributed,
+        'activities': totals,
+    }
@@ -0,0 +1,40 @@
+from datetime import datetime
+
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None
+
+
+def decode_nanos(nanos):
+    '''
+    Converts a batch of google's nanosecond timestamps (which come to us as strings) into exact
+    integers. Going via float, as we used to, rounds away everything below a few hundred ns
+    '''
+    return list(map(int, nanos))
+
+
+def decode_nanos_array(nanos):
+    '''
+    Like decode_nanos, but returns an int64 numpy array - numpy parses the strings itself, so this
+    is much quicker for big responses. Requires numpy
+    '''
+    return numpy.array(nanos, dtype=numpy.int64)
+
+
+def to_datetime64(nanos):
+    '''
+    Converts a batch of nanosecond timestamps to a numpy datetime64[ns] array. Note that, unlike
+    ns_to_datetime, these are UTC rather than local time. Requires numpy
+    '''
+    return decode_nanos_array(nanos).view('datetime64[ns]')
+
+
+def ns_to_datetime(ns):
+    '''
+    Converts integer nanoseconds since the epoch to a local datetime, exact to the microsecond
+    '''
+    # whole microseconds fit in a float exactly, and the division is well within half a
+    # microsecond of the true value - which fromtimestamp rounds to - so nothing is lost. It's
+    # also a lot quicker than building the datetime from the seconds and replacing the microseconds
+    return datetime.fromtimestamp(ns // 1000 / 1e6)
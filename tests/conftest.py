@@ -0,0 +1,27 @@
+'''
+Helpers shared between the tests. They're plain functions rather than fixtures, as some are used in
+parametrize lists - import them with `from conftest import ...` (tests/ is on the path)
+'''
+from unittest.mock import Mock
+
+from googleapiclient.errors import HttpError
+
+from gfitpy.utils.columns import FitColumns
+
+
+def columns(*intervals):
+    '''
+    FitColumns of fpVal points, from (start ns, end ns, value) tuples
+    '''
+    return FitColumns.from_response({
+        'point': [
+            {'startTimeNanos': str(start), 'endTimeNanos': str(end), 'value': [{'fpVal': value}]}
+            for start, end, value in intervals
+        ]
+    }, 'fpVal')
+
+
+def http_error(status, headers=None):
+    resp = Mock(status=status)
+    resp.get.side_effect = (headers or {}).get
+    return HttpError(resp, b'')
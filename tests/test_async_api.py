@@ -0,0 +1,142 @@
+import asyncio
+import threading
+from datetime import datetime
+from unittest.mock import ANY, Mock, patch, call
+
+import pytest
+
+from gfitpy.async_api import AsyncGfitAPI
+from gfitpy.gfit_api import GfitAPI
+
+
+@pytest.fixture
+def run():
+    loop = asyncio.new_event_loop()
+    yield loop.run_until_complete
+    loop.close()
+
+
+@patch.object(GfitAPI, 'login')
+def test_async_with_logs_in(login, run):
+    api = AsyncGfitAPI({})
+
+    async def use_api():
+        async with api as gfit:
+            return gfit
+
+    assert run(use_api()) == login.return_value
+    assert login.call_args_list == [call()]
+
+
+@patch.object(AsyncGfitAPI, '_get_dataset')
+def test_get_cal_data_fetches_windows_concurrently(get_dataset, run):
+    api = AsyncGfitAPI({'start_time': 1, 'end_time': 10, 'window': 4})
+    get_dataset.side_effect = lambda source, start, end: {
+        'minStartTimeNs': str(start),
+        'maxEndTimeNs': str(end),
+        'point': [{'startTimeNanos': str(start), 'endTimeNanos': str(end), 'value': [{'fpVal': 1.5}]}]
+    }
+
+    with patch.object(AsyncGfitAPI, 'preprocess_data') as preprocess_data:
+        ret = run(api.get_cal_data())
+
+    assert sorted(get_dataset.call_args_list) == [
+        call(GfitAPI.cal_data_source, 1, 5),
+        call(GfitAPI.cal_data_source, 5, 9),
+        call(GfitAPI.cal_data_source, 9, 10),
+    ]
+    response, data_type = preprocess_data.call_args[0]
+    assert data_type == 'fpVal'
+    # merged in window order, whatever order they finished in
+    assert [point['startTimeNanos'] for point in response['point']] == ['1', '5', '9']
+    assert ret == preprocess_data.return_value
+
+
+@patch.object(AsyncGfitAPI, '_fetch_range_async')
+def test_get_activity_columns_uses_cache(fetch_range, run):
+    api = AsyncGfitAPI({'start_time': datetime(2015, 1, 1)})
+    api.cache = Mock()
+    api.cache.synced_range.return_value = None
+    api.cache.get_response.return_value = {
+        'point': [{'startTimeNanos': '1', 'endTimeNanos': '2', 'value': [{'intVal': 7}]}]
+    }
+
+    async def fetched(*args):
+        return 'fetched'
+    fetch_range.side_effect = fetched
+
+    cols = run(api.get_activity_columns())
+
+    assert fetch_range.call_args_list == [call(GfitAPI.activity_data_source, api.start, ANY)]
+    assert api.cache.store.call_args_list == [call(GfitAPI.activity_data_source, 'fetched')]
+    assert list(cols.values) == [7]
+
+
+
+@patch.object(AsyncGfitAPI, '_fetch_range_async')
+def test_cache_and_parsing_run_on_the_executor(fetch_range, run):
+    api = AsyncGfitAPI({'start_time': datetime(2015, 1, 1)})
+    threads = {}
+
+    def record(name, ret):
+        def called(*args):
+            threads[name] = threading.current_thread()
+            return ret
+        return called
+
+    api.cache = Mock()
+    api.cache.synced_range.side_effect = record('synced_range', None)
+    api.cache.store.side_effect = record('store', None)
+    api.cache.get_response.side_effect = record('get_response', {'minStartTimeNs': '1', 'maxEndTimeNs': '2'})
+
+    async def fetched(*args):
+        return 'fetched'
+    fetch_range.side_effect = fetched
+
+    with patch.object(AsyncGfitAPI, 'preprocess_data', side_effect=record('preprocess_data', 'data')):
+        assert run(api.get_cal_data()) == 'data'
+
+    assert sorted(threads) == ['get_response', 'preprocess_data', 'store', 'synced_range']
+    assert threading.current_thread() not in threads.values()
+
+
+@patch.object(AsyncGfitAPI, '_fetch_range_async')
+def test_get_columns_decodes_like_gfit_api(fetch_range, run):
+    metrics = Mock()
+    api = AsyncGfitAPI({'metrics': metrics})
+
+    async def fetched(*args):
+        return {
+            'minStartTimeNs': '1',
+            'maxEndTimeNs': '3',
+            'point': [{'startTimeNanos': '1', 'endTimeNanos': '2', 'value': [{'fpVal': 62.5}]}],
+        }
+    fetch_range.side_effect = fetched
+
+    cols = run(api.get_columns('raw:com.google.weight:scale'))
+
+    assert list(cols.values) == [62.5]
+    assert metrics.parse.call_args_list == [call(1, ANY)]
+
+
+@patch.object(GfitAPI, 'get_aggregated')
+def test_blocking_methods_run_on_the_executor(get_aggregated, run):
+    api = AsyncGfitAPI({})
+    threads = []
+    get_aggregated.side_effect = lambda *args: threads.append(threading.current_thread()) or 'buckets'
+
+    assert run(api.get_aggregated('com.google.calories.expended', '1h')) == 'buckets'
+    assert get_aggregated.call_args_list == [call('com.google.calories.expended', '1h')]
+    assert threads != [threading.current_thread()]
+
+
+@patch.object(GfitAPI, 'iter_cal_data')
+def test_iter_cal_data(iter_cal_data, run):
+    api = AsyncGfitAPI({})
+    api.iter_chunk_size = 2
+    iter_cal_data.return_value = iter(range(5))
+
+    async def collect():
+        return [point async for point in api.iter_cal_data()]
+
+    assert run(collect()) == [0, 1, 2, 3, 4]
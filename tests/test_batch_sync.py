@@ -0,0 +1,270 @@
+import sys
+import threading
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch, call
+
+import pytest
+
+from gfitpy.batch_sync import BatchSync, CredentialsError, UserQuota
+
+from conftest import http_error
+
+
+def response(start, end):
+    return {
+        'minStartTimeNs': str(start),
+        'maxEndTimeNs': str(end),
+        'point': [{'startTimeNanos': str(start), 'endTimeNanos': str(end), 'value': [{'fpVal': 1.5}]}]
+    }
+
+
+@pytest.fixture
+def sync():
+    start = datetime(2015, 1, 1)
+    users = {
+        'alice': {'credentials_file': 'alice', 'credentials': Mock(), 'start_time': start, 'window': None},
+        'bob': {'credentials_file': 'bob', 'credentials': Mock(), 'start_time': start, 'window': None},
+    }
+    sync = BatchSync(users, data_sources=[('source', 'fpVal')], max_workers=1, backoff=0)
+    for api in sync.apis.values():
+        api.login = Mock()
+    return sync
+
+
+@pytest.fixture
+def clock():
+    # time only moves on when someone sleeps - and we note down who that was
+    with patch('gfitpy.batch_sync.time') as time:
+        time.monotonic.return_value = 100
+        time.sleepers = []
+
+        def sleep(seconds):
+            time.sleepers.append(threading.current_thread())
+            time.monotonic.return_value += seconds
+        time.sleep.side_effect = sleep
+        yield time
+
+
+def test_apis_share_a_pool(sync):
+    assert sync.apis['alice'].http_pool is sync.pool
+    assert sync.apis['bob'].http_pool is sync.pool
+    assert sync.apis['alice'].credentials_file == 'alice'
+
+
+def test_schedule_interleaves_data_sources(sync):
+    for api in sync.apis.values():
+        api.window = 1
+
+    assert sync._schedule({
+        'alice': [('source', 1, 3), ('other', 2, 3)],
+        'bob': [('source', 1, 4)],
+    }) == {
+        'alice': [('source', 1, 2), ('other', 2, 3), ('source', 2, 3)],
+        'bob': [('source', 1, 2), ('source', 2, 3), ('source', 3, 4)],
+    }
+
+
+def test_users_take_turns(sync):
+    sync.users_per_round = 2
+    fetched = []
+    for key, api in sync.apis.items():
+        api.window = timedelta(seconds=1)
+        api.end = datetime(2015, 1, 1, 0, 0, 3)
+        api._get_dataset = Mock(side_effect=lambda source, start, end, key=key: fetched.append((key, start.second)) or response(1, 2))
+
+    sync.run()
+
+    assert fetched == [('alice', 0), ('bob', 0), ('alice', 1), ('bob', 1), ('alice', 2), ('bob', 2)]
+
+
+def test_run_returns_data_per_user(sync):
+    for api in sync.apis.values():
+        api._get_dataset = Mock(return_value=response(1000000000, 2000000000))
+
+    ret = sync.run()
+
+    assert set(ret) == {'alice', 'bob'}
+    assert [point['value'] for point in ret['alice']['source']['data']] == [1.5]
+    assert sync.quotas['alice'].requests == 1
+    assert sync.errors == {}
+
+
+def test_run_backs_off_when_throttled(sync, clock):
+    sync.apis['alice']._get_dataset = Mock(side_effect=[
+        http_error(429, {'retry-after': '3'}),
+        http_error(503),
+        response(1000000000, 2000000000)
+    ])
+    sync.apis['bob']._get_dataset = Mock(return_value=response(1000000000, 2000000000))
+
+    ret = sync.run()
+
+    assert set(ret) == {'alice', 'bob'}
+    assert sync.quotas['alice'].throttled == 2
+    assert sync.quotas['alice'].requests == 3
+    # we waited for the retry-after before trying again
+    assert clock.sleep.call_args_list[0][0][0] == pytest.approx(3)
+
+
+def test_throttled_users_dont_hold_up_workers(sync, clock):
+    bob = sync.apis['bob']
+    bob.window = timedelta(days=1)
+    bob.end = bob.start + timedelta(days=3)
+    fetched = []
+
+    def alice_get(*args):
+        fetched.append('alice')
+        if len(fetched) == 1:
+            raise http_error(429, {'retry-after': '60'})
+        return response(1000000000, 2000000000)
+    sync.apis['alice']._get_dataset = Mock(side_effect=alice_get)
+    bob._get_dataset = Mock(side_effect=lambda *args: fetched.append('bob') or response(1000000000, 2000000000))
+
+    ret = [key for key, _ in sync.iter_results()]
+
+    # our only worker got on with bob's windows while alice was backing off
+    assert fetched == ['alice', 'bob', 'bob', 'bob', 'alice']
+    assert ret == ['bob', 'alice']
+    assert clock.sleep.call_args_list == [call(60)]
+    assert clock.sleepers == [threading.current_thread()]
+
+
+def test_failed_users_are_left_out(sync):
+    error = ValueError()
+    sync.apis['alice'].login.side_effect = error
+    sync.apis['alice']._get_dataset = Mock()
+    sync.apis['bob']._get_dataset = Mock(return_value=response(1000000000, 2000000000))
+
+    ret = sync.run()
+
+    assert set(ret) == {'bob'}
+    assert sync.errors == {'alice': error}
+    assert not sync.apis['alice']._get_dataset.called
+
+
+def test_run_gives_up_on_other_errors(sync):
+    error = http_error(404)
+    sync.apis['alice']._get_dataset = Mock(side_effect=error)
+    sync.apis['bob']._get_dataset = Mock(return_value=response(1000000000, 2000000000))
+
+    ret = sync.run()
+
+    assert set(ret) == {'bob'}
+    assert sync.errors == {'alice': error}
+    assert sync.apis['alice']._get_dataset.call_count == 1
+
+
+def test_run_gives_up_after_max_retries(sync, clock):
+    sync.retry_policy.max_attempts = 3
+    sync.apis['alice']._get_dataset = Mock(side_effect=http_error(429))
+    sync.apis['bob']._get_dataset = Mock(return_value=response(1000000000, 2000000000))
+
+    ret = sync.run()
+
+    assert set(ret) == {'bob'}
+    assert sync.apis['alice']._get_dataset.call_count == 3
+    assert 'alice' in sync.errors
+
+
+@patch('gfitpy.batch_sync.time')
+def test_quota(time):
+    time.monotonic.return_value = 100
+    quota = UserQuota(max_in_flight=2, min_interval=2)
+
+    quota.start()
+    assert quota.has_room()
+    quota.start()
+    assert not quota.has_room()
+    # the second request had to wait for the first's interval
+    assert quota.not_before == 104
+
+    quota.finish()
+    quota.back_off(10)
+    assert quota.has_room()
+    assert quota.not_before == 110
+    assert (quota.requests, quota.throttled, quota.in_flight) == (2, 1, 1)
+
+
+def test_run_spaces_out_requests(sync, clock):
+    sync.quotas['alice'].min_interval = 2
+    sync.apis['alice'].window = timedelta(days=1)
+    sync.apis['alice'].end = sync.apis['alice'].start + timedelta(days=3)
+    sync.apis['alice']._get_dataset = Mock(return_value=response(1000000000, 2000000000))
+    sync.apis['bob']._get_dataset = Mock(return_value=response(1000000000, 2000000000))
+
+    sync.run()
+
+    assert sync.apis['alice']._get_dataset.call_count == 3
+    assert clock.sleep.call_args_list == [call(2), call(2)]
+
+
+def test_metrics_are_shared(clock):
+    metrics = Mock()
+    own_metrics = Mock()
+    sync = BatchSync(
+        {'alice': {'credentials': Mock()}, 'bob': {'credentials': Mock(), 'metrics': own_metrics}},
+        data_sources=[('source', 'fpVal')],
+        backoff=0,
+        metrics=metrics
+    )
+    for api in sync.apis.values():
+        api.login = Mock()
+        api._get_dataset = Mock(return_value=response(1000000000, 2000000000))
+    sync.apis['alice']._get_dataset.side_effect = [http_error(503), response(1000000000, 2000000000)]
+
+    sync.run()
+
+    assert sync.apis['alice'].metrics is metrics
+    assert sync.apis['bob'].metrics is own_metrics
+    assert metrics.retry.call_count == 1
+    assert not own_metrics.retry.called
+
+
+@pytest.mark.parametrize('stored', [None, Mock(invalid=True)])
+@patch('gfitpy.batch_sync.Storage')
+def test_never_runs_the_oauth_flow(storage, stored, sync):
+    storage.return_value.get.return_value = stored
+    sync.apis['alice'].credentials = None
+    sync.apis['alice'].refresh_credentials = Mock()
+    sync.apis['bob']._get_dataset = Mock(return_value=response(1000000000, 2000000000))
+
+    with patch.object(sys, 'argv', ['job.py', '--some-job-flag']):
+        ret = sync.run()
+
+    assert set(ret) == {'bob'}
+    assert storage.call_args_list == [call('alice')]
+    assert isinstance(sync.errors['alice'], CredentialsError)
+    assert not sync.apis['alice'].refresh_credentials.called
+
+
+def test_iter_results_yields_each_user_when_done(sync):
+    sync.users_per_round = 1
+    for api in sync.apis.values():
+        api._get_dataset = Mock(return_value=response(1000000000, 2000000000))
+
+    results = sync.iter_results()
+    key, data = next(results)
+
+    assert key == 'alice'
+    assert data['source']['data'][0]['value'] == 1.5
+    # bob's round hasn't started yet
+    assert not sync.apis['bob']._get_dataset.called
+    assert [key for key, _ in results] == ['bob']
+
+
+def test_run_uses_cache(tmpdir):
+    sync = BatchSync(
+        {'alice': {'credentials': Mock(), 'cache_dir': str(tmpdir), 'start_time': datetime(2015, 1, 1), 'window': None}},
+        data_sources=[('source', 'fpVal')]
+    )
+    api = sync.apis['alice']
+    api.login = Mock()
+    synced_end = datetime(2015, 6, 1)
+    api.cache.store('source', response(api.datetime_to_ns(api.start), api.datetime_to_ns(synced_end)))
+    api._get_dataset = Mock(side_effect=lambda source, start, end: response(api.datetime_to_ns(start), api.datetime_to_ns(end)))
+
+    ret = sync.run()
+
+    # only what's new since the last sync is fetched, but we get everything back
+    assert api._get_dataset.call_args_list[0][0][:2] == ('source', synced_end)
+    assert len(ret['alice']['source']['data']) == 2
@@ -0,0 +1,79 @@
+import pytest
+
+from gfitpy.cache import DatasetCache
+
+
+def point(start, end, val=1.0):
+    return {'startTimeNanos': str(start), 'endTimeNanos': str(end), 'value': [{'fpVal': val}]}
+
+
+@pytest.fixture
+def cache(tmpdir):
+    cache = DatasetCache(str(tmpdir.join('cache')))
+    yield cache
+    cache.close()
+
+
+def test_synced_range_empty(cache):
+    assert cache.synced_range('source') is None
+
+
+def test_store_and_retrieve(cache):
+    cache.store('source', {'minStartTimeNs': '0', 'maxEndTimeNs': '100', 'point': [point(10, 20)]})
+
+    assert cache.synced_range('source') == (0, 100)
+    assert cache.get_response('source', 0, 100) == {
+        'minStartTimeNs': '0',
+        'maxEndTimeNs': '100',
+        'point': [point(10, 20)]
+    }
+
+
+def test_store_extends_synced_range(cache):
+    cache.store('source', {'minStartTimeNs': '0', 'maxEndTimeNs': '100', 'point': [point(10, 20)]})
+    cache.store('source', {'minStartTimeNs': '100', 'maxEndTimeNs': '200', 'point': [point(150, 160)]})
+
+    assert cache.synced_range('source') == (0, 200)
+    assert cache.get_response('source', 0, 200)['point'] == [point(10, 20), point(150, 160)]
+
+
+def test_store_does_not_bridge_gaps(cache):
+    cache.store('source', {'minStartTimeNs': '0', 'maxEndTimeNs': '100', 'point': [point(10, 20)]})
+    cache.store('source', {'minStartTimeNs': '300', 'maxEndTimeNs': '400', 'point': [point(350, 360)]})
+
+    # we never fetched 100 to 300, so can't say we've synced it
+    assert cache.synced_range('source') == (300, 400)
+
+
+def test_store_replaces_in_progress_points(cache):
+    # the segment was still going at the last sync, and has since grown
+    cache.store('source', {'minStartTimeNs': '0', 'maxEndTimeNs': '100', 'point': [point(90, 95)]})
+    cache.store('source', {'minStartTimeNs': '100', 'maxEndTimeNs': '200', 'point': [point(90, 130)]})
+
+    assert cache.get_response('source', 0, 200)['point'] == [point(90, 130)]
+
+
+def test_get_response_filters_by_time_and_source(cache):
+    cache.store('source', {
+        'minStartTimeNs': '0',
+        'maxEndTimeNs': '100',
+        'point': [point(10, 20), point(30, 40), point(50, 60)]
+    })
+    cache.store('other', {'minStartTimeNs': '0', 'maxEndTimeNs': '100', 'point': [point(35, 36)]})
+
+    assert cache.get_response('source', 25, 45)['point'] == [point(30, 40)]
+
+
+def test_get_response_no_points(cache):
+    assert 'point' not in cache.get_response('source', 0, 100)
+
+
+def test_cache_persists(tmpdir):
+    directory = str(tmpdir.join('cache'))
+    cache = DatasetCache(directory)
+    cache.store('source', {'minStartTimeNs': '0', 'maxEndTimeNs': '100', 'point': [point(10, 20)]})
+    cache.close()
+
+    cache = DatasetCache(directory)
+    assert cache.synced_range('source') == (0, 100)
+    cache.close()
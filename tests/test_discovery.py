@@ -0,0 +1,94 @@
+import os
+import time
+from unittest.mock import ANY, patch, call
+
+import httplib2
+import googleapiclient
+import pytest
+
+from gfitpy import discovery
+from gfitpy.discovery import FileCache, get_service
+
+
+@pytest.fixture
+def services():
+    with patch.dict(discovery._services, clear=True):
+        yield discovery._services
+
+
+def test_file_cache_round_trip(tmpdir):
+    cache = FileCache(str(tmpdir))
+
+    cache.set('http://discovery/fitness', '{"a": 1}')
+
+    assert cache.get('http://discovery/fitness') == '{"a": 1}'
+    assert cache.get('http://discovery/other') is None
+
+
+def test_file_cache_expires(tmpdir):
+    cache = FileCache(str(tmpdir), max_age=60)
+    cache.set('url', 'doc')
+    path = cache._path('url')
+    an_hour_ago = time.time() - 60 * 60
+    os.utime(path, (an_hour_ago, an_hour_ago))
+
+    assert cache.get('url') is None
+
+
+@patch('gfitpy.discovery.build')
+def test_get_service_is_built_once(build, services):
+    first = get_service()
+    second = get_service()
+
+    assert first is second is build.return_value
+    assert build.call_args_list == [call('fitness', 'v1', http=ANY, cache_discovery=False, cache=None, static_discovery=True)]
+
+
+@patch('gfitpy.discovery.build')
+def test_get_service_uses_file_cache(build, services, tmpdir):
+    get_service(cache_dir=str(tmpdir), max_age=5)
+
+    cache = build.call_args[1]['cache']
+    assert isinstance(cache, FileCache)
+    assert cache.directory == str(tmpdir)
+    assert cache.max_age == 5
+    assert build.call_args[1]['static_discovery'] is False
+
+
+class DiscoveryHttp(object):
+    '''
+    Serves the discovery document that comes with googleapiclient, counting how often it's asked
+    '''
+    def __init__(self):
+        self.requests = []
+
+    def request(self, uri, method='GET', **kwargs):
+        self.requests.append(uri)
+        with open(os.path.join(os.path.dirname(googleapiclient.__file__), 'discovery_cache', 'documents', 'fitness.v1.json'), 'rb') as f:
+            return httplib2.Response({'status': 200}), f.read()
+
+
+def test_get_service_fetches_into_file_cache(services, tmpdir):
+    http = DiscoveryHttp()
+
+    with patch('gfitpy.discovery.httplib2.Http', return_value=http):
+        service = get_service(cache_dir=str(tmpdir))
+        assert len(http.requests) == 1
+        assert len(os.listdir(str(tmpdir))) == 1
+
+        # a new process would find the document in the cache
+        services.clear()
+        assert get_service(cache_dir=str(tmpdir)) is not service
+        assert len(http.requests) == 1
+
+    assert hasattr(service.users(), 'dataSources')
+
+
+def test_get_service_without_cache_stays_offline(services):
+    http = DiscoveryHttp()
+
+    with patch('gfitpy.discovery.httplib2.Http', return_value=http):
+        service = get_service()
+
+    assert http.requests == []
+    assert hasattr(service.users(), 'dataSources')
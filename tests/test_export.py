@@ -0,0 +1,59 @@
+import io
+import csv
+
+import pytest
+
+from gfitpy.export import CSVWriter, ParquetWriter, to_arrow
+
+from conftest import columns
+
+
+def test_csv_writer():
+    out = io.StringIO()
+
+    with CSVWriter(out) as writer:
+        writer.write(columns((1, 2, 1.5), (2, 3, 2.5)), 'cals')
+        writer.write(columns((3, 4, 3.5)), 'other')
+
+    out.seek(0)
+    assert list(csv.reader(out)) == [
+        ['start_ns', 'end_ns', 'value', 'data_source'],
+        ['1', '2', '1.5', 'cals'],
+        ['2', '3', '2.5', 'cals'],
+        ['3', '4', '3.5', 'other'],
+    ]
+    assert writer.rows == 3
+
+
+def test_to_arrow():
+    pytest.importorskip('pyarrow')
+
+    table = to_arrow(columns((1445385600123456789, 1445385660123456789, 1.5)), 'cals')
+
+    assert table.to_pydict() == {
+        'start_ns': [1445385600123456789],
+        'end_ns': [1445385660123456789],
+        'value': [1.5],
+        'data_source': ['cals'],
+    }
+
+
+def test_parquet_writer_row_groups(tmpdir):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    path = str(tmpdir.join('out.parquet'))
+
+    with ParquetWriter(path, row_group_size=2) as writer:
+        writer.write(columns((1, 2, 1.0)), 'cals')
+        # nothing's been written yet - we're waiting for a full row group
+        assert writer._pending_rows == 1
+        writer.write(columns((2, 3, 2.0), (3, 4, 3.0)), 'cals')
+        # a whole row group went out, and the row left over waits for the next
+        assert writer._pending_rows == 1
+        writer.write(columns(), 'cals')
+        writer.write(columns((4, 5, 4.0), (5, 6, 5.0), (6, 7, 6.0), (7, 8, 7.0)), 'other')
+        assert writer._pending_rows == 1
+
+    f = parquet.ParquetFile(path)
+    assert f.metadata.num_rows == 7
+    assert [f.metadata.row_group(i).num_rows for i in range(f.metadata.num_row_groups)] == [2, 2, 2, 1]
+    assert f.read().to_pydict()['data_source'] == ['cals'] * 3 + ['other'] * 4
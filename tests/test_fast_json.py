@@ -0,0 +1,51 @@
+from unittest.mock import Mock, patch
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from gfitpy import fast_json
+from gfitpy.fast_json import decode_response, loads
+from gfitpy.gfit_api import GfitAPI
+
+
+@pytest.fixture(params=['orjson', 'json'])
+def backend(request, monkeypatch):
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(fast_json, 'orjson', None)
+    return request.param
+
+
+def test_loads(backend):
+    assert loads(b'{"point": [{"startTimeNanos": "1", "value": [{"fpVal": 1.5}]}]}') == {
+        'point': [{'startTimeNanos': '1', 'value': [{'fpVal': 1.5}]}]
+    }
+    assert loads('{"a": "\\u00e9"}') == {'a': 'é'}
+
+
+def test_decode_response(backend):
+    assert decode_response(Mock(status=200), b'{"a": 1}') == {'a': 1}
+    assert decode_response(Mock(status=204), b'') == {}
+
+
+def test_decode_response_raises_http_errors():
+    resp = Mock(status=503)
+    resp.get.return_value = None
+
+    with pytest.raises(HttpError):
+        decode_response(resp, b'{"error": {}}')
+
+
+@pytest.mark.parametrize('fast, postproc', [
+    (True, decode_response),
+    (False, 'unchanged'),
+])
+def test_dataset_request_postproc(fast, postproc):
+    api = GfitAPI({'fast_json': fast})
+    api.api = Mock()
+    request = api.api.users.return_value.dataSources.return_value.datasets.return_value.get.return_value
+    request.postproc = 'unchanged'
+
+    with patch.object(GfitAPI, 'get_time_range_str', return_value='1-2'):
+        assert api._dataset_request('source', 1, 2, {}).postproc == postproc
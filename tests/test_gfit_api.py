@@ -1,8 +1,18 @@
-from unittest.mock import MagicMock, Mock, patch, call
+import threading
+from unittest.mock import ANY, MagicMock, Mock, patch, call
+
+from datetime import datetime, timedelta
 
 import pytest
 
 from gfitpy.gfit_api import GfitAPI
+from gfitpy.retry import RetryPolicy
+from gfitpy.utils.activities import Activity
+from gfitpy.utils.data_types import get_data_type
+from gfitpy.utils.date_range import DateRange
+from gfitpy.utils.timestamps import ns_to_datetime
+
+from conftest import http_error
 
 
 def test_get_time_range():
@@ -12,25 +22,24 @@ def test_get_time_range():
     assert GfitAPI.get_time_range_str(start, end) == expected
 
 
-@patch('gfitpy.gfit_api.datetime')
+@patch('gfitpy.gfit_api.ns_to_datetime', side_effect=str)
 @patch('gfitpy.gfit_api.DateRange')
-@patch.object(GfitAPI, 'process_datapoint')
-def test_preprocess_data_correct_daterange(proc_datapoint, daterange, datetime):
+@patch.object(GfitAPI, 'process_datapoints')
+def test_preprocess_data_correct_daterange(proc_datapoints, daterange, ns_to_datetime):
     data = {
-        'minStartTimeNs': 1000000000,
-        'maxEndTimeNs': 2000000000,
+        'minStartTimeNs': '1000000000',
+        'maxEndTimeNs': '2000000000',
     }
-    datetime.fromtimestamp = str
 
     GfitAPI({}).preprocess_data(data, Mock())
 
-    assert daterange.call_args_list == [call('1.0', '2.0')]
+    assert daterange.call_args_list == [call('1000000000', '2000000000')]
 
 
-@patch('gfitpy.gfit_api.datetime')
+@patch('gfitpy.gfit_api.ns_to_datetime')
 @patch('gfitpy.gfit_api.DateRange')
-@patch.object(GfitAPI, 'process_datapoint')
-def test_preprocess_data_calls_datapoint(proc_datapoint, daterange, datetime):
+@patch.object(GfitAPI, 'process_datapoints')
+def test_preprocess_data_calls_datapoints(proc_datapoints, daterange, ns_to_datetime):
     data = {
         'minStartTimeNs': 1,
         'maxEndTimeNs': 1,
@@ -38,15 +47,16 @@ def test_preprocess_data_calls_datapoint(proc_datapoint, daterange, datetime):
     }
     d_t = Mock()
 
-    GfitAPI({}).preprocess_data(data, d_t)
+    ret = GfitAPI({}).preprocess_data(data, d_t)
 
-    assert proc_datapoint.call_args_list == [call('a', d_t), call('b', d_t)]
+    assert proc_datapoints.call_args_list == [call(['a', 'b'], d_t)]
+    assert ret['data'] == proc_datapoints.return_value
 
 
-@patch('gfitpy.gfit_api.datetime')
+@patch('gfitpy.gfit_api.ns_to_datetime')
 @patch('gfitpy.gfit_api.DateRange')
-@patch.object(GfitAPI, 'process_datapoint')
-def test_preprocess_data_no_points(proc_datapoint, daterange, datetime):
+@patch.object(GfitAPI, 'process_datapoints')
+def test_preprocess_data_no_points(proc_datapoints, daterange, ns_to_datetime):
     data = {
         'minStartTimeNs': 1,
         'maxEndTimeNs': 1,
@@ -54,21 +64,22 @@ def test_preprocess_data_no_points(proc_datapoint, daterange, datetime):
 
     GfitAPI({}).preprocess_data(data, Mock())
 
-    assert not proc_datapoint.called
+    assert proc_datapoints.call_args_list == [call([], ANY)]
 
 @patch('gfitpy.gfit_api.httplib2')
 @patch.object(GfitAPI, '__enter__')
 @patch.object(GfitAPI, 'get_credentials')
-@patch('gfitpy.gfit_api.build')
-def test_login(build, get_creds, enter, httplib):
+@patch('gfitpy.gfit_api.get_service')
+def test_login(get_service, get_creds, enter, httplib):
     creds = get_creds.return_value
-    api = GfitAPI({})
+    api = GfitAPI({'discovery_cache_dir': 'dir'})
 
     ret = api.login()
 
     assert creds.authorize.call_args_list == [call(httplib.Http.return_value)]
-    assert build.call_args_list == [call('fitness', 'v1', http=creds.authorize.return_value)]
-    assert api.api == build.return_value
+    assert api.authed_http == creds.authorize.return_value
+    assert get_service.call_args_list == [call(cache_dir='dir', max_age=24 * 60 * 60)]
+    assert api.api == get_service.return_value
     assert ret == enter.return_value
 
 
@@ -170,7 +181,7 @@ def test_process_datapoint_gets_value():
         'value': [{data_type: val}]
     }
 
-    with patch('gfitpy.gfit_api.datetime'), \
+    with patch('gfitpy.gfit_api.ns_to_datetime'), \
             patch('gfitpy.gfit_api.DateRange'):
         ret = GfitAPI.process_datapoint(point, data_type)
 
@@ -179,17 +190,792 @@ def test_process_datapoint_gets_value():
 
 def test_process_datapoint_creates_timerange():
     point = {
-        'startTimeNanos': 1000000000,
-        'endTimeNanos': 2000000000,
+        'startTimeNanos': '1000000000',
+        'endTimeNanos': '2000000000',
         'value': [MagicMock()]
     }
 
-    with patch('gfitpy.gfit_api.datetime') as dt, \
+    with patch('gfitpy.gfit_api.ns_to_datetime') as ns_to_datetime, \
             patch('gfitpy.gfit_api.DateRange') as dr:
-        # use the str cast as a way to distinguish what goes in (1, 2) and what comes out ('1', '2')
-        dt.fromtimestamp.side_effect = str
+        # use the str cast as a way to distinguish what goes in (ints) and what comes out (strs)
+        ns_to_datetime.side_effect = str
         ret = GfitAPI.process_datapoint(point, Mock())
 
-    assert dt.fromtimestamp.call_args_list == [call(1), call(2)]
-    dr.assert_called_once_with('1.0', '2.0')
+    assert ns_to_datetime.call_args_list == [call(1000000000), call(2000000000)]
+    dr.assert_called_once_with('1000000000', '2000000000')
     assert ret['times'] == dr.return_value
+
+
+def test_process_datapoints_keeps_nanosecond_precision():
+    # this is more precision than a float can hold
+    point = {
+        'startTimeNanos': '1445385600123456789',
+        'endTimeNanos': '1445385660987654321',
+        'value': [{'fpVal': 1.5}]
+    }
+
+    with patch('gfitpy.gfit_api.ns_to_datetime', side_effect=lambda ns: ns):
+        ret = GfitAPI.process_datapoints([point], 'fpVal')
+
+    assert ret == [{
+        'times': DateRange(1445385600123456789, 1445385660987654321),
+        'value': 1.5
+    }]
+
+
+@pytest.mark.parametrize(
+    'point',
+    [
+        # empty val
+        {'startTimeNanos': '1', 'endTimeNanos': '2', 'value': []},
+        # too many vals
+        {'startTimeNanos': '1', 'endTimeNanos': '2', 'value': [Mock(), Mock()]},
+    ]
+)
+def test_process_datapoints_raises(point):
+    with pytest.raises(ValueError):
+        GfitAPI.process_datapoints([point], data_type=Mock())
+
+def test_get_time_windows_splits_range():
+    windows = GfitAPI.get_time_windows(1, 10, 4)
+
+    assert windows == [(1, 5), (5, 9), (9, 10)]
+
+
+def test_get_time_windows_no_window():
+    assert GfitAPI.get_time_windows(1, 10, None) == [(1, 10)]
+
+
+@pytest.mark.parametrize('window', [timedelta(0), timedelta(days=-1), 0, -4])
+def test_get_time_windows_rejects_non_positive_window(window):
+    with pytest.raises(ValueError):
+        GfitAPI.get_time_windows(1, 10, window)
+
+
+@pytest.mark.parametrize('window', [timedelta(0), timedelta(days=-1)])
+def test_init_rejects_non_positive_window(window):
+    with pytest.raises(ValueError):
+        GfitAPI({'window': window})
+
+
+def test_merge_responses_drops_duplicate_boundary_points():
+    responses = [
+        {
+            'minStartTimeNs': '0',
+            'maxEndTimeNs': '10',
+            'point': [{'startTimeNanos': '1'}, {'startTimeNanos': '8'}]
+        },
+        {
+            'minStartTimeNs': '10',
+            'maxEndTimeNs': '20',
+            # the first point here straddles the boundary, and was returned by both windows
+            'point': [{'startTimeNanos': '8'}, {'startTimeNanos': '12'}]
+        },
+    ]
+
+    merged = GfitAPI.merge_responses(responses)
+
+    assert merged == {
+        'minStartTimeNs': '0',
+        'maxEndTimeNs': '20',
+        'point': [{'startTimeNanos': '1'}, {'startTimeNanos': '8'}, {'startTimeNanos': '12'}]
+    }
+
+
+def test_merge_responses_no_points():
+    merged = GfitAPI.merge_responses([{'minStartTimeNs': '0', 'maxEndTimeNs': '10'}])
+
+    assert 'point' not in merged
+
+
+def test_merge_responses_no_windows():
+    start = datetime(2016, 1, 1)
+
+    merged = GfitAPI.merge_responses([], start, start)
+
+    ns = str(GfitAPI.datetime_to_ns(start))
+    assert merged == {'minStartTimeNs': ns, 'maxEndTimeNs': ns}
+
+
+@pytest.mark.parametrize('end', [datetime(2016, 1, 1), datetime(2015, 1, 1)])
+@patch.object(GfitAPI, '_get_dataset')
+def test_get_cal_data_empty_range(get_dataset, end):
+    api = GfitAPI({'start_time': datetime(2016, 1, 1), 'end_time': end})
+
+    ret = api.get_cal_data()
+
+    assert not get_dataset.called
+    assert ret == {'times': None, 'data': []}
+
+
+@patch.object(GfitAPI, '_get_dataset')
+def test_fetch_ranges_reuses_threads(get_dataset):
+    api = GfitAPI({'window': 10, 'max_workers': 2})
+    threads = set()
+
+    def get(source, start, end):
+        threads.add(threading.current_thread())
+        return {'minStartTimeNs': str(start), 'maxEndTimeNs': str(end)}
+
+    get_dataset.side_effect = get
+
+    with api:
+        for _ in range(3):
+            api._fetch_ranges([('a', 0, 40)])
+        executor = api._executor
+
+    # so each thread's http (and its open connections) gets used again
+    assert len(threads) <= 2
+    assert api._executor is None
+    assert executor._shutdown
+
+
+@patch.object(GfitAPI, 'preprocess_data')
+@patch.object(GfitAPI, '_get_dataset')
+def test_get_fit_data_fetches_each_window(get_dataset, preprocess_data):
+    api = GfitAPI({'start_time': 1, 'window': 4})
+    get_dataset.side_effect = lambda source, start, end: {
+        'minStartTimeNs': str(start),
+        'maxEndTimeNs': str(end),
+    }
+
+    with patch('gfitpy.gfit_api.datetime') as dt:
+        dt.now.return_value = 10
+        ret = api._get_fit_data('source', 'fpVal')
+
+    assert sorted(get_dataset.call_args_list) == [
+        call('source', 1, 5),
+        call('source', 5, 9),
+        call('source', 9, 10),
+    ]
+    assert preprocess_data.call_args_list == [
+        call({'minStartTimeNs': '1', 'maxEndTimeNs': '10'}, 'fpVal')
+    ]
+    assert ret == preprocess_data.return_value
+
+
+def test_iter_dataset_pages_follows_page_tokens():
+    api = GfitAPI({'page_size': 2})
+    api.api = Mock()
+    get = api.api.users.return_value.dataSources.return_value.datasets.return_value.get
+    pages = [{'nextPageToken': 'abc'}, {'nextPageToken': ''}]
+
+    with patch.object(GfitAPI, '_execute', side_effect=pages), \
+            patch.object(GfitAPI, 'get_time_range_str', return_value='1-2'):
+        ret = list(api._iter_dataset_pages('source', 1, 2))
+
+    assert ret == pages
+    assert get.call_args_list == [
+        call(userId='me', dataSourceId='source', datasetId='1-2', limit=2),
+        call(userId='me', dataSourceId='source', datasetId='1-2', limit=2, pageToken='abc'),
+    ]
+
+
+@patch.object(GfitAPI, '_iter_dataset_pages')
+def test_get_dataset_joins_pages(iter_pages):
+    iter_pages.return_value = iter([
+        {'minStartTimeNs': '1', 'point': ['a'], 'nextPageToken': 'abc'},
+        {'minStartTimeNs': '1'},
+        {'minStartTimeNs': '1', 'point': ['b']},
+    ])
+
+    ret = GfitAPI({})._get_dataset('source', 1, 2)
+
+    assert ret == {'minStartTimeNs': '1', 'point': ['a', 'b']}
+
+
+@patch.object(
+    GfitAPI,
+    'process_datapoints',
+    side_effect=lambda points, data_type: [point['startTimeNanos'] for point in points]
+)
+@patch.object(GfitAPI, '_iter_dataset_pages')
+def test_iter_fit_data_yields_points_lazily(iter_pages, process_datapoints):
+    api = GfitAPI({'start_time': 0, 'window': 10})
+    iter_pages.side_effect = lambda source, start, end: iter([
+        {'minStartTimeNs': str(start), 'point': [{'startTimeNanos': str(start - 1)}]},
+        {'minStartTimeNs': str(start), 'point': [{'startTimeNanos': str(start + 1)}]},
+    ])
+
+    with patch('gfitpy.gfit_api.datetime') as dt:
+        dt.now.return_value = 20
+        points = api.iter_cal_data()
+
+        assert not iter_pages.called
+        ret = list(points)
+
+    # the point that started before the second window has already been seen by the first
+    assert ret == ['-1', '1', '11']
+    assert iter_pages.call_args_list == [
+        call(GfitAPI.cal_data_source, 0, 10),
+        call(GfitAPI.cal_data_source, 10, 20),
+    ]
+
+
+@patch.object(GfitAPI, '_fetch_range')
+def test_sync_cache_fetches_tail(fetch_range):
+    api = GfitAPI({'start_time': datetime(2015, 1, 1)})
+    api.cache = Mock()
+    synced_end = datetime(2015, 6, 1)
+    api.cache.synced_range.return_value = (0, GfitAPI.datetime_to_ns(synced_end))
+    now = datetime(2015, 7, 1)
+
+    ret = api._sync_cache('source', now)
+
+    assert fetch_range.call_args_list == [call('source', synced_end, now)]
+    assert api.cache.store.call_args_list == [call('source', fetch_range.return_value)]
+    assert api.cache.get_response.call_args_list == [
+        call('source', GfitAPI.datetime_to_ns(api.start), GfitAPI.datetime_to_ns(now))
+    ]
+    assert ret == api.cache.get_response.return_value
+
+
+@patch.object(GfitAPI, '_fetch_range')
+def test_sync_cache_fetches_gap(fetch_range):
+    api = GfitAPI({'start_time': datetime(2015, 3, 1)})
+    api.cache = Mock()
+    synced_end = datetime(2015, 2, 1)
+    api.cache.synced_range.return_value = (0, GfitAPI.datetime_to_ns(synced_end))
+    now = datetime(2015, 4, 1)
+
+    api._sync_cache('source', now)
+
+    # starting from the end of what we have, so the cache stays one contiguous range
+    assert fetch_range.call_args_list == [call('source', synced_end, now)]
+
+
+@pytest.mark.parametrize(
+    'synced_range',
+    [
+        # never synced before
+        None,
+        # synced, but not as far back as we want now
+        (GfitAPI.datetime_to_ns(datetime(2015, 3, 1)), GfitAPI.datetime_to_ns(datetime(2015, 6, 1))),
+    ]
+)
+@patch.object(GfitAPI, '_fetch_range')
+def test_sync_cache_fetches_everything(fetch_range, synced_range):
+    api = GfitAPI({'start_time': datetime(2015, 1, 1)})
+    api.cache = Mock()
+    api.cache.synced_range.return_value = synced_range
+    now = datetime(2015, 7, 1)
+
+    api._sync_cache('source', now)
+
+    assert fetch_range.call_args_list == [call('source', api.start, now)]
+
+
+@patch.object(GfitAPI, '_sync_cache')
+@patch.object(GfitAPI, '_fetch_range')
+@patch.object(GfitAPI, 'preprocess_data')
+def test_get_fit_data_uses_cache(preprocess_data, fetch_range, sync_cache):
+    api = GfitAPI({})
+    api.cache = Mock()
+
+    api._get_fit_data('source', 'fpVal')
+
+    assert not fetch_range.called
+    assert preprocess_data.call_args_list == [call(sync_cache.return_value, 'fpVal')]
+
+
+@patch.object(GfitAPI, '_get_fit_response')
+def test_get_cal_columns(get_fit_response):
+    get_fit_response.return_value = {
+        'point': [{'startTimeNanos': '1', 'endTimeNanos': '2', 'value': [{'fpVal': 1.5}]}]
+    }
+
+    cols = GfitAPI({}).get_cal_columns()
+
+    assert get_fit_response.call_args_list == [call(GfitAPI.cal_data_source)]
+    assert list(cols.values) == [1.5]
+
+
+def test_authorize_uses_http_pool():
+    pool = Mock()
+    api = GfitAPI({'http_pool': pool})
+    api.credentials = Mock()
+
+    assert api._authorize() == pool.authorize.return_value
+    assert pool.authorize.call_args_list == [call(api.credentials)]
+    assert not api.credentials.authorize.called
+
+
+@pytest.mark.parametrize(
+    'bucket, millis',
+    [
+        ('1d', 24 * 60 * 60 * 1000),
+        ('6h', 6 * 60 * 60 * 1000),
+        ('15m', 15 * 60 * 1000),
+        ('30s', 30 * 1000),
+        ('500ms', 500),
+        (timedelta(hours=1), 60 * 60 * 1000),
+    ]
+)
+def test_parse_bucket(bucket, millis):
+    assert GfitAPI.parse_bucket(bucket) == millis
+
+
+@pytest.mark.parametrize('bucket', ['', 'd', '1 d', '1w', '-1d'])
+def test_parse_bucket_raises(bucket):
+    with pytest.raises(ValueError):
+        GfitAPI.parse_bucket(bucket)
+
+
+def test_process_buckets():
+    response = {
+        'bucket': [
+            {
+                'startTimeMillis': '1000',
+                'endTimeMillis': '2000',
+                'dataset': [{'point': [{'value': [{'fpVal': 1.5}]}, {'value': [{'fpVal': 2.0}]}]}]
+            },
+            {
+                'startTimeMillis': '2000',
+                'endTimeMillis': '3000',
+                'dataset': [{
+                    'dataSourceId': 'derived:com.google.step_count.delta:com.google.android.gms:aggregated',
+                    'point': [{'dataTypeName': 'com.google.step_count.delta', 'value': [{'intVal': 7}]}]
+                }]
+            },
+            {
+                # nothing happened in this bucket
+                'startTimeMillis': '3000',
+                'endTimeMillis': '4000',
+                'dataset': [{}]
+            },
+        ]
+    }
+
+    with patch('gfitpy.gfit_api.ns_to_datetime', side_effect=lambda ns: ns):
+        ret = GfitAPI.process_buckets(response)
+
+    assert list(ret.items()) == [
+        (DateRange(1000000000, 2000000000), 3.5),
+        (DateRange(2000000000, 3000000000), 7),
+        (DateRange(3000000000, 4000000000), 0),
+    ]
+
+
+def test_process_activity_buckets():
+    source = 'derived:com.google.activity.summary:com.google.android.gms:aggregated'
+
+    def summary(activity, minutes, segments=1):
+        return {
+            'dataTypeName': 'com.google.activity.summary',
+            'value': [{'intVal': activity}, {'intVal': minutes * 60 * 1000}, {'intVal': segments}],
+        }
+
+    response = {
+        'bucket': [
+            {
+                'startTimeMillis': '1000',
+                'endTimeMillis': '2000',
+                'dataset': [{
+                    'dataSourceId': source,
+                    'point': [summary(7, 30, 2), summary(72, 420), summary(7, 10), summary(1000, 5)],
+                }]
+            },
+            {
+                'startTimeMillis': '2000',
+                'endTimeMillis': '3000',
+                'dataset': [{'dataSourceId': source}]
+            },
+        ]
+    }
+
+    with patch('gfitpy.gfit_api.ns_to_datetime', side_effect=lambda ns: ns):
+        ret = GfitAPI.process_buckets(response)
+
+    assert list(ret.values()) == [
+        {
+            Activity.walking: timedelta(minutes=40),
+            Activity.sleeping: timedelta(minutes=420),
+            # not an activity we know about
+            1000: timedelta(minutes=5),
+        },
+        {},
+    ]
+
+
+def test_process_buckets_rejects_multi_field_types():
+    response = {
+        'bucket': [{
+            'startTimeMillis': '1000',
+            'endTimeMillis': '2000',
+            'dataset': [{
+                'dataSourceId': 'derived:com.google.heart_rate.summary:com.google.android.gms:aggregated',
+                'point': [{
+                    'dataTypeName': 'com.google.heart_rate.summary',
+                    'value': [{'fpVal': 70.0}, {'fpVal': 120.0}, {'fpVal': 50.0}],
+                }],
+            }],
+        }]
+    }
+
+    with pytest.raises(ValueError, match='average, max, min'):
+        GfitAPI.process_buckets(response)
+
+
+def test_get_aggregated_keeps_windows_to_whole_buckets():
+    api = GfitAPI({'start_time': datetime(2015, 1, 1), 'window': timedelta(days=30)})
+    api.api = Mock()
+    aggregate = api.api.users.return_value.dataset.return_value.aggregate
+
+    with patch.object(GfitAPI, '_execute', return_value={}), \
+            patch('gfitpy.gfit_api.datetime') as dt:
+        dt.now.return_value = datetime(2015, 3, 1)
+        ret = api.get_aggregated('com.google.calories.expended', bucket='7d')
+
+    assert ret == {}
+    bodies = sorted(
+        (kwargs['body'] for args, kwargs in aggregate.call_args_list),
+        key=lambda body: body['startTimeMillis']
+    )
+    # four weeks to a window
+    starts = [body['startTimeMillis'] for body in bodies]
+    assert [b - a for a, b in zip(starts, starts[1:])] == [28 * 24 * 60 * 60 * 1000] * 2
+    assert bodies[0]['aggregateBy'] == [{'dataTypeName': 'com.google.calories.expended'}]
+    assert bodies[0]['bucketByTime'] == {'durationMillis': 7 * 24 * 60 * 60 * 1000}
+
+
+@patch.object(GfitAPI, '_iter_dataset_pages')
+def test_iter_columns(iter_pages):
+    api = GfitAPI({'start_time': 0, 'window': 10})
+    iter_pages.side_effect = lambda source, start, end: iter([{
+        'minStartTimeNs': str(start),
+        'point': [
+            {'startTimeNanos': str(start - 1), 'endTimeNanos': str(start), 'value': [{'fpVal': 1.0}]},
+            {'startTimeNanos': str(start + 1), 'endTimeNanos': str(start + 2), 'value': [{'fpVal': 2.0}]},
+        ]
+    }])
+
+    with patch('gfitpy.gfit_api.datetime') as dt:
+        dt.now.return_value = 20
+        chunks = list(api.iter_columns('source', 'fpVal'))
+
+    assert [list(chunk.start_ns) for chunk in chunks] == [[-1, 1], [11]]
+
+
+@patch('gfitpy.gfit_api.argparse')
+@patch('gfitpy.gfit_api.tools')
+@patch('gfitpy.gfit_api.OAuth2WebServerFlow')
+def test_refresh_credentials_passes_oauth_flags(oauth, tools, argparse):
+    GfitAPI({'oauth_flags': ['--noauth_local_webserver']}).refresh_credentials(Mock())
+
+    parse_args = argparse.ArgumentParser.return_value.parse_args
+    assert parse_args.call_args_list == [call(['--noauth_local_webserver'])]
+
+
+def test_get_end_time():
+    assert GfitAPI({'end_time': datetime(2015, 1, 1)}).get_end_time() == datetime(2015, 1, 1)
+
+    with patch('gfitpy.gfit_api.datetime') as dt:
+        assert GfitAPI({}).get_end_time() == dt.now.return_value
+
+
+def test_list_data_sources():
+    api = GfitAPI({})
+    api.api = Mock()
+    list_sources = api.api.users.return_value.dataSources.return_value.list
+
+    with patch.object(GfitAPI, '_execute', return_value={'dataSource': ['a', 'b']}):
+        ret = api.list_data_sources(['com.google.heart_rate.bpm'])
+
+    assert ret == ['a', 'b']
+    assert list_sources.call_args_list == [call(userId='me', dataTypeName=['com.google.heart_rate.bpm'])]
+
+
+def test_process_datapoints_multiple_fields():
+    data_type = get_data_type('com.google.heart_rate.summary')
+    point = {
+        'startTimeNanos': '1000000000',
+        'endTimeNanos': '2000000000',
+        'value': [{'fpVal': 70.0}, {'fpVal': 90.0}, {'fpVal': 60.0}]
+    }
+
+    ret = GfitAPI.process_datapoints([point], data_type)
+
+    assert ret[0]['value'] == {'average': 70.0, 'max': 90.0, 'min': 60.0}
+
+
+@patch.object(GfitAPI, '_get_fit_response')
+def test_get_data_looks_up_data_type(get_fit_response):
+    source = 'raw:com.google.step_count.delta:com.example'
+    get_fit_response.return_value = {
+        'minStartTimeNs': '1000000000',
+        'maxEndTimeNs': '2000000000',
+        'point': [{'startTimeNanos': '1000000000', 'endTimeNanos': '2000000000', 'value': [{'intVal': 12}]}]
+    }
+
+    ret = GfitAPI({}).get_data(source)
+
+    assert get_fit_response.call_args_list == [call(source)]
+    assert ret['data'][0]['value'] == 12
+
+
+@patch.object(GfitAPI, '_get_fit_response')
+def test_get_data_instantaneous_points(get_fit_response):
+    # heart rate samples (like location, speed...) start and end at the same nanosecond
+    source = 'derived:com.google.heart_rate.bpm:com.google.android.gms:merge_heart_rate_bpm'
+    get_fit_response.return_value = {
+        'minStartTimeNs': '1000000000',
+        'maxEndTimeNs': '3000000000',
+        'point': [
+            {'startTimeNanos': '1500000000', 'endTimeNanos': '1500000000', 'value': [{'fpVal': 72.0}]},
+            {'startTimeNanos': '2500000000', 'endTimeNanos': '2500000000', 'value': [{'fpVal': 75.0}]},
+        ]
+    }
+
+    ret = GfitAPI({}).get_data(source)
+
+    assert [point['value'] for point in ret['data']] == [72.0, 75.0]
+    instant = ns_to_datetime(1500000000)
+    assert ret['data'][0]['times'] == DateRange(instant, instant)
+    assert ret['times'] == DateRange(ns_to_datetime(1000000000), ns_to_datetime(3000000000))
+
+
+@patch.object(GfitAPI, '_get_dataset')
+def test_get_all_data_fetches_every_source_together(get_dataset):
+    api = GfitAPI({'start_time': 0, 'end_time': 20, 'window': 10})
+    sources = [
+        'raw:com.google.step_count.delta:com.example',
+        {
+            'dataStreamId': 'raw:com.example.custom:com.example',
+            'dataType': {'name': 'com.example.custom', 'field': [{'name': 'x', 'format': 'integer'}, {'name': 'y', 'format': 'integer'}]}
+        },
+    ]
+    get_dataset.side_effect = lambda source, start, end: {
+        'minStartTimeNs': str(start * 1000000000),
+        'maxEndTimeNs': str(end * 1000000000),
+        'point': [{
+            'startTimeNanos': str(start * 1000000000),
+            'endTimeNanos': str(end * 1000000000),
+            'value': [{'intVal': start}, {'intVal': end}] if 'custom' in source else [{'intVal': start}]
+        }]
+    }
+
+    with patch.object(GfitAPI, 'datetime_to_ns', side_effect=lambda time: time):
+        ret = api.get_all_data(sources)
+
+    assert sorted(get_dataset.call_args_list) == [
+        call('raw:com.example.custom:com.example', 0, 10),
+        call('raw:com.example.custom:com.example', 10, 20),
+        call('raw:com.google.step_count.delta:com.example', 0, 10),
+        call('raw:com.google.step_count.delta:com.example', 10, 20),
+    ]
+    assert list(ret) == ['raw:com.google.step_count.delta:com.example', 'raw:com.example.custom:com.example']
+    assert [point['value'] for point in ret['raw:com.google.step_count.delta:com.example']['data']] == [0, 10]
+    assert [point['value'] for point in ret['raw:com.example.custom:com.example']['data']] == [
+        {'x': 0, 'y': 10},
+        {'x': 10, 'y': 20},
+    ]
+
+
+@patch.object(GfitAPI, '_fetch_ranges')
+@patch.object(GfitAPI, 'preprocess_data')
+def test_get_all_data_only_fetches_what_the_cache_is_missing(preprocess_data, fetch_ranges):
+    api = GfitAPI({'start_time': datetime(2015, 1, 1), 'end_time': datetime(2015, 7, 1)})
+    api.cache = Mock()
+    synced = {
+        'a:com.google.weight': (0, GfitAPI.datetime_to_ns(datetime(2015, 6, 1))),
+        'b:com.google.weight': (0, GfitAPI.datetime_to_ns(datetime(2015, 7, 1))),
+    }
+    api.cache.synced_range.side_effect = synced.get
+    fetch_ranges.return_value = ['response']
+
+    api.get_all_data(['a:com.google.weight', 'b:com.google.weight'])
+
+    assert fetch_ranges.call_args_list == [call([('a:com.google.weight', datetime(2015, 6, 1), datetime(2015, 7, 1))])]
+    assert api.cache.store.call_args_list == [call('a:com.google.weight', 'response')]
+    assert api.cache.get_response.call_count == 2
+
+
+@patch.object(GfitAPI, 'list_data_sources', return_value=[])
+def test_get_all_data_lists_sources(list_data_sources):
+    assert GfitAPI({}).get_all_data() == {}
+    assert list_data_sources.called
+
+
+class FakeBatch(object):
+    '''
+    Stands in for googleapiclient's BatchHttpRequest - "requests" are the args to
+    _dataset_request, and each is answered from pages
+    '''
+    def __init__(self, pages):
+        self.pages = pages
+        self.requests = []
+
+    def add(self, request, callback, request_id):
+        self.requests.append((request, callback, request_id))
+
+    def execute(self):
+        for request, callback, request_id in self.requests:
+            response = self.pages[request]
+            if isinstance(response, Exception):
+                callback(request_id, None, response)
+            else:
+                callback(request_id, dict(response), None)
+
+
+def batch_api(pages, batch_size):
+    api = GfitAPI({'batch_size': batch_size})
+    api.api = Mock()
+    api.batches = []
+
+    def new_batch():
+        api.batches.append(FakeBatch(pages))
+        return api.batches[-1]
+
+    api.api.new_batch_http_request.side_effect = new_batch
+    api._dataset_request = lambda source, start, end, page_args: (source, start, end, page_args.get('pageToken'))
+    api._execute = lambda batch: batch.execute()
+    return api
+
+
+def test_batch_get_datasets():
+    pages = {
+        ('a', 1, 2, None): {'minStartTimeNs': '1', 'point': ['a1'], 'nextPageToken': 'abc'},
+        ('a', 1, 2, 'abc'): {'minStartTimeNs': '1', 'point': ['a2'], 'nextPageToken': 'def'},
+        ('a', 1, 2, 'def'): {'minStartTimeNs': '1', 'point': ['a3']},
+        ('b', 1, 2, None): {'minStartTimeNs': '1', 'point': ['b1']},
+        ('b', 2, 3, None): {'minStartTimeNs': '2'},
+    }
+    api = batch_api(pages, batch_size=2)
+
+    ret = api._batch_get_datasets([('a', 1, 2), ('b', 1, 2), ('b', 2, 3)])
+
+    assert ret == [
+        {'minStartTimeNs': '1', 'point': ['a1', 'a2', 'a3']},
+        {'minStartTimeNs': '1', 'point': ['b1']},
+        {'minStartTimeNs': '2'},
+    ]
+    # two batches for the first pages, and then one more for each of a's other pages
+    assert [len(batch.requests) for batch in api.batches] == [2, 1, 1, 1]
+
+
+def test_batch_get_datasets_raises_errors():
+    api = batch_api({('a', 1, 2, None): ValueError('oh no')}, batch_size=10)
+
+    with pytest.raises(ValueError):
+        api._batch_get_datasets([('a', 1, 2)])
+
+
+def test_batch_get_datasets_caps_batch_size():
+    pages = {('a', i, i + 1, None): {'minStartTimeNs': str(i)} for i in range(3)}
+    api = batch_api(pages, batch_size=5000)
+    api.max_batch_size = 2
+
+    api._batch_get_datasets([('a', i, i + 1) for i in range(3)])
+
+    assert [len(batch.requests) for batch in api.batches] == [2, 1]
+
+
+@patch.object(GfitAPI, '_get_dataset')
+@patch.object(GfitAPI, '_batch_get_datasets')
+def test_fetch_ranges_uses_batches(batch_get_datasets, get_dataset):
+    api = GfitAPI({'window': 10, 'batch_size': 100})
+    batch_get_datasets.side_effect = lambda windows: [
+        {'minStartTimeNs': str(start), 'maxEndTimeNs': str(end)} for _, start, end in windows
+    ]
+
+    ret = api._fetch_ranges([('a', 0, 20), ('b', 0, 10)])
+
+    assert batch_get_datasets.call_args_list == [call([('a', 0, 10), ('a', 10, 20), ('b', 0, 10)])]
+    assert not get_dataset.called
+    assert ret == [
+        {'minStartTimeNs': '0', 'maxEndTimeNs': '20'},
+        {'minStartTimeNs': '0', 'maxEndTimeNs': '10'},
+    ]
+
+
+@patch('gfitpy.retry.time.sleep')
+def test_execute_retries(sleep):
+    api = GfitAPI({'retry_policy': RetryPolicy(backoff=0)})
+    api._get_http = Mock()
+    request = Mock()
+    request.execute.side_effect = [ConnectionResetError(), {'ok': True}]
+
+    assert api._execute(request) == {'ok': True}
+    assert request.execute.call_args_list == [call(http=api._get_http.return_value)] * 2
+
+
+@patch.object(GfitAPI, '_get_dataset')
+def test_fetch_ranges_resumes_after_failure(get_dataset):
+    api = GfitAPI({'window': 10})
+    fail = [True]
+
+    def get(source, start, end):
+        if start == 10 and fail:
+            fail.pop()
+            raise ValueError()
+        return {'minStartTimeNs': str(start), 'maxEndTimeNs': str(end)}
+
+    get_dataset.side_effect = get
+
+    with pytest.raises(ValueError):
+        api._fetch_ranges([('a', 0, 30)])
+    assert sorted(get_dataset.call_args_list) == [call('a', 0, 10), call('a', 10, 20), call('a', 20, 30)]
+
+    get_dataset.reset_mock()
+    ret = api._fetch_ranges([('a', 0, 30)])
+
+    # only the window that failed is fetched again
+    assert get_dataset.call_args_list == [call('a', 10, 20)]
+    assert ret == [{'minStartTimeNs': '0', 'maxEndTimeNs': '30'}]
+    assert api._completed_windows == {}
+
+
+@patch.object(GfitAPI, '_get_dataset')
+def test_fetch_ranges_forgets_windows_of_earlier_fetches(get_dataset):
+    api = GfitAPI({'window': 10})
+
+    def get(source, start, end):
+        if source == 'b':
+            raise ValueError()
+        return {'minStartTimeNs': str(start), 'maxEndTimeNs': str(end)}
+
+    get_dataset.side_effect = get
+
+    with pytest.raises(ValueError):
+        api._fetch_ranges([('a', 0, 15), ('b', 0, 5)])
+    assert set(api._completed_windows) == {('a', 0, 10), ('a', 10, 15)}
+
+    # the end has moved on (as it does with end_time None), so the old last window is no use now
+    get_dataset.reset_mock()
+    api._fetch_ranges([('a', 0, 18)])
+
+    assert get_dataset.call_args_list == [call('a', 10, 18)]
+    assert api._completed_windows == {}
+
+
+@patch('gfitpy.gfit_api.time.sleep')
+def test_batch_get_datasets_retries(sleep):
+    pages = {('a', 1, 2, None): http_error(503)}
+    api = batch_api(pages, batch_size=10)
+    api.retry_policy = RetryPolicy(backoff=0)
+
+    def execute(batch):
+        batch.execute()
+        pages[('a', 1, 2, None)] = {'minStartTimeNs': '1'}
+
+    api._execute = execute
+
+    ret = api._batch_get_datasets([('a', 1, 2)])
+
+    assert ret == [{'minStartTimeNs': '1'}]
+    assert len(api.batches) == 2
+    assert sleep.call_count == 1
+
+
+@patch.object(GfitAPI, 'get_credentials')
+@patch('gfitpy.gfit_api.get_service')
+def test_login_with_transport_and_credentials(get_service, get_credentials):
+    transport = Mock()
+    credentials = Mock()
+    api = GfitAPI({'transport': transport, 'credentials': credentials})
+
+    api.login()
+
+    assert not get_credentials.called
+    assert transport.authorize.call_args_list == [call(credentials)]
+    assert api.authed_http == transport.authorize.return_value
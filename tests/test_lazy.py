@@ -0,0 +1,45 @@
+import sys
+import copy
+import subprocess
+
+import pytest
+
+from gfitpy.lazy import LazyImport
+
+# nothing in here should be imported until it's needed
+HEAVY_MODULES = ('googleapiclient.discovery', 'oauth2client', 'oauth2client.tools', 'httplib2')
+
+
+def test_lazy_module():
+    json = LazyImport('json')
+
+    assert json.loads('[1]') == [1]
+    assert repr(json) == '<LazyImport json>'
+
+
+def test_lazy_name():
+    loads = LazyImport('json', 'loads')
+
+    assert loads('[1]') == [1]
+    assert loads.__name__ == 'loads'
+    assert repr(loads) == '<LazyImport json.loads>'
+
+
+def test_lazy_import_waits_until_used():
+    lazy = LazyImport('gfitpy_no_such_module')
+
+    with pytest.raises(ImportError):
+        lazy.anything
+
+
+def test_lazy_import_can_be_copied():
+    assert copy.copy(LazyImport('json')).dumps([]) == '[]'
+
+
+@pytest.mark.parametrize('module', ['gfitpy.gfit_api', 'gfitpy.batch_sync', 'gfitpy.__main__', 'gfitpy.utils.date_range'])
+def test_import_does_not_load_google_clients(module):
+    # in a fresh interpreter, as the other tests will have imported everything already
+    code = 'import sys, {0}; print(",".join(sorted(set({1!r}) & set(sys.modules))))'.format(module, HEAVY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', code], universal_newlines=True)
+
+    assert output.strip() == ''
@@ -0,0 +1,199 @@
+import os
+import csv
+import datetime
+import argparse
+from unittest.mock import Mock, patch
+
+import pytest
+
+from gfitpy.__main__ import main, parse_source, parse_time
+from gfitpy.gfit_api import GfitAPI
+from gfitpy.synthetic import SyntheticHttp
+from gfitpy.transport import NullCredentials, RecordingTransport, ReplayHttp
+
+from conftest import columns
+
+
+@pytest.fixture
+def gfit():
+    with patch('gfitpy.__main__.GfitAPI') as gfit_cls:
+        gfit = gfit_cls.return_value
+        gfit.login.return_value.__enter__ = Mock(return_value=gfit)
+        gfit.login.return_value.__exit__ = Mock(return_value=False)
+        gfit.cache = None
+        gfit.iter_columns.side_effect = lambda source, data_type: iter([
+            columns((1, 2, 1.5)),
+            columns((2, 3, 2.5), (3, 4, 3.5)),
+        ])
+        yield gfit_cls
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('calories', ('calories', GfitAPI.cal_data_source, 'fpVal')),
+    ('activity', ('activity', GfitAPI.activity_data_source, 'intVal')),
+    ('raw:com.google.step_count.delta:x=intVal', ('raw_com.google.step_count.delta_x', 'raw:com.google.step_count.delta:x', 'intVal')),
+    ('raw:com.google.weight:x', ('raw_com.google.weight_x', 'raw:com.google.weight:x', 'fpVal')),
+])
+def test_parse_source(value, expected):
+    assert parse_source(value) == expected
+
+
+def test_parse_source_rejects_unknown_types():
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_source('raw:x=mapVal')
+
+
+@pytest.mark.parametrize('value,expected', [
+    ('2016-01-02', datetime.datetime(2016, 1, 2)),
+    ('2016-01-02T03:04:05', datetime.datetime(2016, 1, 2, 3, 4, 5)),
+    ('2016-01-02 03:04:05', datetime.datetime(2016, 1, 2, 3, 4, 5)),
+])
+def test_parse_time(value, expected):
+    assert parse_time(value) == expected
+
+
+def test_parse_time_rejects_rubbish():
+    with pytest.raises(argparse.ArgumentTypeError):
+        parse_time('yesterday')
+
+
+def test_main_without_command_prints_help(capsys):
+    assert main([]) == 1
+    assert 'sync' in capsys.readouterr().out
+
+
+def test_sync_writes_a_csv_per_source(gfit, tmpdir):
+    ret = main([
+        'sync',
+        '--start', '2016-01-01',
+        '--end', '2016-01-03',
+        '--output', str(tmpdir),
+        '--window', '1',
+    ])
+
+    assert ret == 0
+    settings = gfit.call_args[0][0]
+    assert settings['start_time'] == datetime.datetime(2016, 1, 1)
+    assert settings['end_time'] == datetime.datetime(2016, 1, 3)
+    assert settings['window'] == datetime.timedelta(days=1)
+    assert settings['oauth_flags'] == []
+    assert gfit.return_value.login.call_count == 1
+
+    assert sorted(os.listdir(str(tmpdir))) == ['activity.csv', 'calories.csv']
+    with open(os.path.join(str(tmpdir), 'calories.csv')) as f:
+        assert list(csv.reader(f)) == [
+            ['start_ns', 'end_ns', 'value', 'data_source'],
+            ['1', '2', '1.5', GfitAPI.cal_data_source],
+            ['2', '3', '2.5', GfitAPI.cal_data_source],
+            ['3', '4', '3.5', GfitAPI.cal_data_source],
+        ]
+
+
+def test_sync_passes_unknown_args_to_oauth(gfit, tmpdir):
+    main(['sync', '--output', str(tmpdir), '--noauth_local_webserver'])
+
+    assert gfit.call_args[0][0]['oauth_flags'] == ['--noauth_local_webserver']
+
+
+@pytest.mark.parametrize('args', [
+    ['--sorce', 'calories'],
+    ['--formt', 'parquet'],
+    ['--noauth_local_webserver', 'extra'],
+])
+def test_sync_rejects_unknown_args(gfit, tmpdir, capsys, args):
+    with pytest.raises(SystemExit):
+        main(['sync', '--output', str(tmpdir)] + args)
+
+    assert 'unrecognized arguments' in capsys.readouterr().err
+    assert not gfit.called
+
+
+@pytest.mark.parametrize('args, message', [
+    (['--window', '0'], 'Must be more than 0'),
+    (['--window', '-1.5'], 'Must be more than 0'),
+    (['--window', 'lots'], 'Cannot understand number'),
+    (['--concurrency', '0'], 'Must be more than 0'),
+    (['--start', '2016-01-02', '--end', '2016-01-01'], 'must be before --end'),
+    (['--start', '2016-01-01', '--end', '2016-01-01'], 'must be before --end'),
+    (['--start', '2999-01-01'], 'must be before --end'),
+])
+def test_sync_rejects_bad_values(gfit, tmpdir, capsys, args, message):
+    with pytest.raises(SystemExit) as excinfo:
+        main(['sync', '--output', str(tmpdir)] + args)
+
+    assert excinfo.value.code == 2
+    assert message in capsys.readouterr().err
+    assert not gfit.called
+
+
+def test_sync_defaults_to_ten_days(gfit, tmpdir):
+    main(['sync', '--output', str(tmpdir), '--end', '2016-01-11'])
+
+    assert gfit.call_args[0][0]['start_time'] == datetime.datetime(2016, 1, 1)
+
+
+def test_sync_only_fetches_given_sources(gfit, tmpdir):
+    main(['sync', '--output', str(tmpdir), '--source', 'raw:weight', '--client-id', 'abc'])
+
+    settings = gfit.call_args[0][0]
+    assert settings['client_id'] == 'abc'
+    assert 'client_secret' not in settings
+    gfit.return_value.iter_columns.assert_called_once_with('raw:weight', 'fpVal')
+    assert os.listdir(str(tmpdir)) == ['raw_weight.csv']
+
+
+def test_sync_reads_whole_range_from_cache(gfit, tmpdir):
+    gfit.return_value.cache = Mock()
+    gfit.return_value.get_columns.return_value = columns((1, 2, 1.5))
+
+    main(['sync', '--output', str(tmpdir), '--source', 'calories', '--cache-dir', str(tmpdir)])
+
+    assert gfit.call_args[0][0]['cache_dir'] == str(tmpdir)
+    assert not gfit.return_value.iter_columns.called
+    with open(os.path.join(str(tmpdir), 'calories.csv')) as f:
+        assert len(list(csv.reader(f))) == 2
+
+
+def test_sync_writes_parquet(gfit, tmpdir):
+    pyarrow = pytest.importorskip('pyarrow.parquet')
+
+    main(['sync', '--output', str(tmpdir), '--source', 'calories', '--format', 'parquet'])
+
+    table = pyarrow.read_table(os.path.join(str(tmpdir), 'calories.parquet'))
+    assert table.column('value').to_pylist() == [1.5, 2.5, 3.5]
+
+
+@pytest.mark.parametrize('args, transport', [
+    (['--synthetic'], SyntheticHttp),
+    (['--replay', 'recorded'], ReplayHttp),
+])
+def test_sync_offline(gfit, tmpdir, args, transport):
+    main(['sync', '--output', str(tmpdir)] + args)
+
+    settings = gfit.call_args[0][0]
+    assert isinstance(settings['transport'], transport)
+    assert isinstance(settings['credentials'], NullCredentials)
+
+
+def test_sync_records(gfit, tmpdir):
+    main(['sync', '--output', str(tmpdir), '--record', str(tmpdir.join('recorded'))])
+
+    settings = gfit.call_args[0][0]
+    assert isinstance(settings['transport'], RecordingTransport)
+    assert 'credentials' not in settings
+
+
+def test_sync_synthetic_end_to_end(tmpdir):
+    ret = main([
+        'sync',
+        '--output', str(tmpdir),
+        '--synthetic',
+        '--start', '2016-01-01',
+        '--end', '2016-01-02',
+        '--source', 'calories',
+    ])
+
+    assert ret == 0
+    with open(os.path.join(str(tmpdir), 'calories.csv')) as f:
+        # a point a minute, plus the header
+        assert len(list(csv.reader(f))) == 24 * 60 + 1
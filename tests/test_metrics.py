@@ -0,0 +1,126 @@
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+import pytest
+
+from gfitpy.gfit_api import GfitAPI
+from gfitpy.metrics import MeteredHttp, Metrics, PrometheusMetrics, StatsMetrics
+from gfitpy.retry import RetryPolicy
+from gfitpy.synthetic import SyntheticHttp
+from gfitpy.transport import NullCredentials
+
+
+def test_metered_http():
+    metrics = Mock()
+    http = Mock(credentials='creds')
+    http.request.return_value = (Mock(status=200), b'12345')
+    metered = MeteredHttp(http, metrics)
+
+    assert metered.request('uri', 'GET') == http.request.return_value
+    assert metered.credentials == 'creds'
+    seconds, status, response_bytes = metrics.request.call_args[0]
+    assert (status, response_bytes) == (200, 5)
+
+
+def test_metered_http_errors():
+    metrics = Mock()
+    http = Mock()
+    http.request.side_effect = ConnectionResetError()
+
+    with pytest.raises(ConnectionResetError):
+        MeteredHttp(http, metrics).request('uri')
+    assert metrics.request.call_args[0][1:] == (None, 0)
+
+
+def test_stats_metrics_summary():
+    metrics = StatsMetrics()
+    metrics.request(1.0, 200, 100)
+    metrics.request(3.0, 503, 10)
+    metrics.retry(Mock(), 0, 1)
+    metrics.parse(50, 0.5)
+    metrics.cache('source', hit=True)
+    metrics.cache('source', hit=False)
+    metrics.cache('source', hit=True)
+
+    summary = metrics.summary()
+
+    assert summary['requests'] == 2
+    assert summary['statuses'] == {200: 1, 503: 1}
+    assert summary['request_seconds'] == 4.0
+    assert summary['request_seconds_p95'] == 3.0
+    assert summary['response_bytes'] == 110
+    assert summary['retries'] == 1
+    assert summary['points'] == 50
+    assert summary['cache_hit_rate'] == pytest.approx(2 / 3)
+
+
+def test_gfit_api_defaults_to_no_metrics():
+    api = GfitAPI({})
+    api.credentials = Mock()
+
+    assert type(api.metrics) is Metrics
+    assert not isinstance(api._authorize(), MeteredHttp)
+
+
+def api(metrics, **settings):
+    return GfitAPI(dict({
+        'transport': SyntheticHttp(),
+        'credentials': NullCredentials(),
+        'start_time': datetime(2016, 1, 1),
+        'end_time': datetime(2016, 1, 3),
+        'window': timedelta(days=1),
+        'metrics': metrics,
+    }, **settings))
+
+
+def test_gfit_api_reports_metrics():
+    metrics = StatsMetrics()
+
+    data = api(metrics).login().get_cal_data()
+
+    summary = metrics.summary()
+    assert len(metrics.logins) == 1
+    assert summary['requests'] == 2
+    assert summary['statuses'] == {200: 2}
+    assert summary['response_bytes'] > 0
+    assert summary['points'] == len(data['data'])
+    assert summary['cache_hit_rate'] is None
+
+
+def test_gfit_api_reports_cache(tmpdir):
+    metrics = StatsMetrics()
+    gfit = api(metrics, cache_dir=str(tmpdir)).login()
+
+    gfit.get_cal_data()
+    gfit.get_cal_data()
+
+    assert (metrics.cache_hits, metrics.cache_misses) == (1, 1)
+
+
+@patch('gfitpy.retry.time.sleep')
+def test_gfit_api_reports_retries(sleep):
+    metrics = Mock()
+    gfit = GfitAPI({'metrics': metrics, 'retry_policy': RetryPolicy(backoff=0)})
+    gfit._get_http = Mock()
+    request = Mock()
+    request.execute.side_effect = [ConnectionResetError(), {}]
+
+    gfit._execute(request)
+
+    assert metrics.retry.call_count == 1
+
+
+def test_prometheus_metrics():
+    prometheus_client = pytest.importorskip('prometheus_client')
+    registry = prometheus_client.CollectorRegistry()
+    metrics = PrometheusMetrics(registry=registry)
+
+    api(metrics).login().get_cal_data()
+    metrics.cache('source', hit=True)
+    metrics.retry(ValueError(), 0, 1)
+
+    assert registry.get_sample_value('gfitpy_request_seconds_count', {'status': '200'}) == 2
+    assert registry.get_sample_value('gfitpy_points_total') == 2 * 24 * 60
+    assert registry.get_sample_value('gfitpy_login_seconds_count') == 1
+    assert registry.get_sample_value('gfitpy_cache_lookups_total', {'result': 'hit'}) == 1
+    assert registry.get_sample_value('gfitpy_retries_total', {'error': 'ValueError'}) == 1
@@ -0,0 +1,66 @@
+import socket
+from unittest.mock import Mock, patch, call
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from gfitpy.retry import RetryPolicy
+
+from conftest import http_error
+
+
+@pytest.mark.parametrize('error, retryable', [
+    (http_error(429), True),
+    (http_error(503), True),
+    (http_error(404), False),
+    (socket.timeout(), True),
+    (ConnectionResetError(), True),
+    (ValueError(), False),
+])
+def test_is_retryable(error, retryable):
+    assert RetryPolicy().is_retryable(error) == retryable
+
+
+def test_should_retry_stops_after_max_attempts():
+    policy = RetryPolicy(max_attempts=3)
+
+    assert policy.should_retry(http_error(503), 1)
+    assert not policy.should_retry(http_error(503), 2)
+
+
+def test_delay_honours_retry_after():
+    assert RetryPolicy().delay(http_error(429, {'retry-after': '7'}), 0) == 7
+
+
+@patch('gfitpy.retry.random.uniform', return_value=1)
+def test_delay_backs_off_exponentially(uniform):
+    policy = RetryPolicy(backoff=2, max_backoff=10)
+
+    assert [policy.delay(socket.timeout(), attempt) for attempt in range(4)] == [2, 4, 8, 10]
+
+
+@patch('gfitpy.retry.time.sleep')
+def test_call_retries(sleep):
+    func = Mock(side_effect=[http_error(503), socket.timeout(), 'ok'])
+
+    assert RetryPolicy(backoff=0).call(func, 1, a=2) == 'ok'
+    assert func.call_args_list == [call(1, a=2)] * 3
+    assert sleep.call_count == 2
+
+
+@patch('gfitpy.retry.time.sleep')
+def test_call_gives_up(sleep):
+    error = http_error(503)
+    func = Mock(side_effect=error)
+
+    with pytest.raises(HttpError):
+        RetryPolicy(max_attempts=2, backoff=0).call(func)
+    assert func.call_count == 2
+
+
+def test_call_doesnt_retry_other_errors():
+    func = Mock(side_effect=ValueError())
+
+    with pytest.raises(ValueError):
+        RetryPolicy().call(func)
+    assert func.call_count == 1
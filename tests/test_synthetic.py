@@ -0,0 +1,105 @@
+import json
+from datetime import datetime, timedelta
+
+from gfitpy.gfit_api import GfitAPI
+from gfitpy.synthetic import SyntheticHttp
+from gfitpy.transport import NullCredentials
+from gfitpy.utils.activities import Activity
+
+DAY_NS = 24 * 60 * 60 * 10 ** 9
+START_NS = 1451606400 * 10 ** 9
+
+
+def test_calorie_points_cover_the_range():
+    response = SyntheticHttp().dataset(GfitAPI.cal_data_source, START_NS, START_NS + DAY_NS)
+
+    points = response['point']
+    assert len(points) == 24 * 60
+    assert all(point['value'][0]['fpVal'] > 0 for point in points)
+    assert [point['startTimeNanos'] for point in points[1:]] == [point['endTimeNanos'] for point in points[:-1]]
+
+
+def test_data_is_the_same_however_it_is_split():
+    synthetic = SyntheticHttp(seed=3)
+    whole = synthetic.dataset(GfitAPI.activity_data_source, START_NS, START_NS + DAY_NS)['point']
+    halves = (
+        synthetic.dataset(GfitAPI.activity_data_source, START_NS, START_NS + DAY_NS // 2)['point'] +
+        synthetic.dataset(GfitAPI.activity_data_source, START_NS + DAY_NS // 2, START_NS + DAY_NS)['point']
+    )
+
+    assert whole == halves
+    assert whole != SyntheticHttp(seed=4).dataset(GfitAPI.activity_data_source, START_NS, START_NS + DAY_NS)['point']
+
+
+def test_activities_are_realistic():
+    points = SyntheticHttp().activity_points(START_NS, START_NS + DAY_NS)
+
+    assert len(points) == 24 * 4
+    # asleep at midnight
+    assert points[0]['value'][0]['intVal'] == Activity.sleeping.value
+    assert {point['value'][0]['intVal'] for point in points[7 * 4:23 * 4]} <= {
+        Activity.still_not_moving.value,
+        Activity.walking.value,
+        Activity.running.value,
+        Activity.biking.value,
+    }
+
+
+def test_dataset_pages():
+    synthetic = SyntheticHttp()
+
+    first = synthetic.dataset(GfitAPI.cal_data_source, START_NS, START_NS + DAY_NS, limit=1000)
+    second = synthetic.dataset(GfitAPI.cal_data_source, START_NS, START_NS + DAY_NS, limit=1000, page_token=first['nextPageToken'])
+
+    assert len(first['point']) == 1000
+    assert len(second['point']) == 24 * 60 - 1000
+    assert 'nextPageToken' not in second
+
+
+def test_unknown_data_sources_are_empty():
+    response = SyntheticHttp().dataset('raw:com.google.weight:x', START_NS, START_NS + DAY_NS)
+
+    assert 'point' not in response
+
+
+def test_respond_404s_for_anything_else():
+    status, content = SyntheticHttp().respond('POST', 'https://host/fitness/v1/users/me/dataset:aggregate', '{}')
+
+    assert status == 404
+    assert json.loads(content.decode('utf-8'))['error']['code'] == 404
+
+
+def test_gfit_api_end_to_end():
+    api = GfitAPI({
+        'transport': SyntheticHttp(),
+        'credentials': NullCredentials(),
+        'start_time': datetime(2016, 1, 1),
+        'end_time': datetime(2016, 1, 5),
+        'window': timedelta(days=1),
+        'page_size': 500,
+        'batch_size': 3,
+    }).login()
+
+    data = api.get_all_data()
+
+    assert list(data) == [GfitAPI.cal_data_source, GfitAPI.activity_data_source]
+    assert len(data[GfitAPI.cal_data_source]['data']) == 4 * 24 * 60
+    assert len(data[GfitAPI.activity_data_source]['data']) == 4 * 24 * 4
+
+
+def test_cache_does_not_claim_gaps(tmpdir):
+    def get_cal_data(start, end):
+        with GfitAPI({
+            'transport': SyntheticHttp(calorie_minutes=60),
+            'credentials': NullCredentials(),
+            'cache_dir': str(tmpdir),
+            'start_time': start,
+            'end_time': end,
+        }).login() as api:
+            return api.get_cal_data()['data']
+
+    get_cal_data(datetime(2016, 1, 1), datetime(2016, 1, 11))
+    get_cal_data(datetime(2016, 2, 1), datetime(2016, 2, 11))
+
+    # a point an hour, with nothing missing from between the first two syncs
+    assert len(get_cal_data(datetime(2016, 1, 1), datetime(2016, 2, 11))) == 41 * 24
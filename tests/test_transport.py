@@ -0,0 +1,176 @@
+import os
+import json
+from unittest.mock import Mock, patch, call
+
+import pytest
+from googleapiclient.http import BatchHttpRequest, HttpRequest
+from googleapiclient.model import JsonModel
+
+from gfitpy.transport import (
+    FakeHttp,
+    HttpPool,
+    NullCredentials,
+    PooledHttp,
+    RecordingHttp,
+    RecordingTransport,
+    ReplayError,
+    ReplayHttp,
+    request_key,
+)
+
+
+@patch('gfitpy.transport.httplib2')
+def test_pool_reuses_connections(httplib2):
+    pool = HttpPool(size=2, timeout=5)
+
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert httplib2.Http.call_args_list == [call(timeout=5)]
+
+
+@patch('gfitpy.transport.httplib2')
+def test_pool_opens_new_connections_when_busy(httplib2):
+    httplib2.Http.side_effect = lambda timeout: Mock()
+    pool = HttpPool(size=2)
+
+    with pool.connection() as first, pool.connection() as second:
+        assert first is not second
+
+
+def test_pooled_http_applies_credentials():
+    pool = HttpPool()
+    http = Mock()
+    http.request.return_value = (Mock(status=200), b'content')
+    pool._idle.put(http)
+    credentials = Mock(access_token='token')
+    credentials.apply.side_effect = lambda headers: headers.update(authorization='Bearer token')
+
+    ret = pool.authorize(credentials).request('uri', headers={'a': 'b'})
+
+    assert ret == http.request.return_value
+    assert http.request.call_args_list == [
+        call(
+            'uri',
+            'GET',
+            body=None,
+            headers={'a': 'b', 'authorization': 'Bearer token'},
+            redirections=5,
+            connection_type=None
+        )
+    ]
+    assert not credentials.refresh.called
+
+
+def test_pooled_http_refreshes_expired_token():
+    pool = HttpPool()
+    http = Mock()
+    http.request.side_effect = [(Mock(status=401), b''), (Mock(status=200), b'content')]
+    pool._idle.put(http)
+    credentials = Mock(access_token='token')
+
+    resp, content = PooledHttp(pool, credentials).request('uri')
+
+    assert content == b'content'
+    assert credentials.refresh.call_args_list == [call(http)]
+    assert len(credentials.apply.call_args_list) == 2
+
+
+def test_pooled_http_gets_initial_token():
+    pool = HttpPool()
+    http = Mock()
+    http.request.return_value = (Mock(status=200), b'content')
+    pool._idle.put(http)
+    credentials = Mock(access_token=None)
+
+    PooledHttp(pool, credentials).request('uri')
+
+    assert credentials.refresh.call_args_list == [call(http)]
+
+
+def test_request_key_ignores_access_tokens():
+    first = request_key('GET', 'https://host/path?b=2&a=1&access_token=abc', None)
+    second = request_key('get', 'https://host/path?a=1&b=2&access_token=def', '')
+
+    assert first == second
+    assert first != request_key('GET', 'https://host/path?a=1&b=3', None)
+    assert first != request_key('POST', 'https://host/path?a=1&b=2', '{}')
+
+
+class EchoHttp(FakeHttp):
+    def respond(self, method, uri, body):
+        return 200, json.dumps({'method': method, 'uri': uri, 'body': body}).encode('utf-8')
+
+
+def test_fake_http_request():
+    resp, content = EchoHttp().request('https://host/path', 'POST', body='{"a": 1}')
+
+    assert resp.status == 200
+    assert json.loads(content.decode('utf-8')) == {'method': 'POST', 'uri': 'https://host/path', 'body': '{"a": 1}'}
+
+
+def batch_request(http, uris):
+    '''
+    Sends a real googleapiclient batch through http, and returns each request's response in order
+    '''
+    results = {}
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = exception if exception is not None else response
+
+    batch = BatchHttpRequest(callback=callback, batch_uri='https://host/batch')
+    for i, uri in enumerate(uris):
+        batch.add(HttpRequest(None, JsonModel().response, uri, headers={}), request_id=str(i))
+    batch.execute(http=http)
+    return [results[i] for i in range(len(uris))]
+
+
+def test_fake_http_answers_batches():
+    responses = batch_request(EchoHttp(), ['https://host/a?x=1', 'https://host/b'])
+
+    assert [(response['method'], response['uri']) for response in responses] == [
+        ('GET', 'https://host/a?x=1'),
+        ('GET', 'https://host/b'),
+    ]
+
+
+def test_replay_http(tmpdir):
+    RecordingHttp(Mock(), str(tmpdir)).save('GET', 'https://host/a', None, 200, b'{"a": 1}')
+    replay = ReplayHttp(str(tmpdir))
+
+    resp, content = replay.request('https://host/a')
+
+    assert replay.authorize(Mock()) is replay
+    assert resp.status == 200
+    assert content == b'{"a": 1}'
+    with pytest.raises(ReplayError):
+        replay.request('https://host/b')
+
+
+def test_record_then_replay(tmpdir):
+    credentials = Mock()
+    credentials.authorize.side_effect = lambda http: EchoHttp()
+    recording = RecordingTransport(str(tmpdir)).authorize(credentials)
+
+    recorded = recording.request('https://host/a?access_token=secret')
+    assert os.listdir(str(tmpdir)) == [request_key('GET', 'https://host/a', None)]
+
+    replayed = ReplayHttp(str(tmpdir)).request('https://host/a?access_token=other')
+    assert replayed[0].status == recorded[0].status
+    assert replayed[1] == recorded[1]
+
+
+def test_record_then_replay_batches(tmpdir):
+    transport = RecordingTransport(str(tmpdir), transport=EchoHttp())
+    uris = ['https://host/a', 'https://host/b']
+
+    recorded = batch_request(transport.authorize(NullCredentials()), uris)
+
+    # each request in the batch is recorded on its own, so they can be replayed one by one
+    assert len(os.listdir(str(tmpdir))) == 2
+    resp, content = ReplayHttp(str(tmpdir)).request('https://host/b')
+    assert json.loads(content.decode('utf-8')) == recorded[1]
+    assert batch_request(ReplayHttp(str(tmpdir)), uris) == recorded
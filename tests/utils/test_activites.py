@@ -1,6 +1,6 @@
 import pytest
 
-from gfitpy.utils.activities import Activity
+from gfitpy.utils.activities import Activity, classify
 
 
 @pytest.mark.parametrize(
@@ -48,3 +48,29 @@ def test_mfp_id(activity, mfp_id):
 def test_mfp_id_raises(activity):
     with pytest.raises(NotImplementedError):
         activity.mfp_id
+
+
+def test_classify():
+    assert classify([1, 7, 8, 4]) == [Activity.biking, Activity.walking, Activity.running, Activity.unknown]
+
+
+@pytest.mark.parametrize('value', [-1, 6, 107, 1000])
+def test_classify_unknown_values(value):
+    assert classify([value]) == [None]
+
+
+def test_classify_matches_enum():
+    values = [activity.value for activity in Activity]
+
+    assert classify(values) == [Activity(value) for value in values]
+
+
+def test_no_aliases():
+    # every name is its own activity, rather than an alias for another
+    assert len(Activity.__members__) == len(list(Activity))
+
+
+def test_badminton_and_zumba_are_different():
+    assert Activity.badminton != Activity.zumba
+    assert Activity(10) == Activity.badminton
+    assert Activity(101) == Activity.zumba
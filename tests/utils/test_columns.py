@@ -0,0 +1,102 @@
+from datetime import datetime
+
+import pytest
+
+from gfitpy.utils import columns
+from gfitpy.utils.columns import FitColumns
+from gfitpy.utils.date_range import DateRange
+
+
+def point(start, end, value, data_type='fpVal'):
+    return {'startTimeNanos': str(start), 'endTimeNanos': str(end), 'value': [{data_type: value}]}
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        monkeypatch.setattr(columns, 'numpy', None)
+    return request.param
+
+
+def test_from_response(backend):
+    response = {'point': [point(1445385600123456789, 1445385660123456789, 1.5), point(3, 4, 2.5)]}
+
+    cols = FitColumns.from_response(response, 'fpVal')
+
+    assert len(cols) == 2
+    # nanosecond precision is kept
+    assert list(cols.start_ns) == [1445385600123456789, 3]
+    assert list(cols.end_ns) == [1445385660123456789, 4]
+    assert list(cols.values) == [1.5, 2.5]
+
+
+def test_from_response_int_values(backend):
+    cols = FitColumns.from_response({'point': [point(1, 2, 7, 'intVal')]}, 'intVal')
+
+    assert cols.values.tolist() == [7]
+    assert isinstance(cols.values.tolist()[0], int)
+
+
+def test_from_response_no_points(backend):
+    assert len(FitColumns.from_response({}, 'fpVal')) == 0
+
+
+@pytest.mark.parametrize('value', [[], [{'fpVal': 1}, {'fpVal': 2}]])
+def test_from_response_raises(backend, value):
+    response = {'point': [{'startTimeNanos': '1', 'endTimeNanos': '2', 'value': value}]}
+
+    with pytest.raises(ValueError):
+        FitColumns.from_response(response, 'fpVal')
+
+
+def test_concat(backend):
+    left = FitColumns.from_response({'point': [point(1, 2, 1.0)]}, 'fpVal')
+    right = FitColumns.from_response({'point': [point(3, 4, 2.0), point(5, 6, 3.0)]}, 'fpVal')
+
+    cols = FitColumns.concat([left, right])
+
+    assert list(cols.start_ns) == [1, 3, 5]
+    assert list(cols.end_ns) == [2, 4, 6]
+    assert list(cols.values) == [1.0, 2.0, 3.0]
+    # the originals are left alone
+    assert len(left) == 1
+
+
+def test_to_points(backend):
+    cols = FitColumns.from_response({'point': [point(1000000000, 2000000000, 1.5)]}, 'fpVal')
+
+    assert cols.to_points() == [{
+        'times': DateRange(datetime.fromtimestamp(1), datetime.fromtimestamp(2)),
+        'value': 1.5
+    }]
+
+
+def test_to_points_instantaneous(backend):
+    # a heart rate sample - it starts and ends at the same time
+    cols = FitColumns.from_response({'point': [point(1000000000, 1000000000, 72.0)]}, 'fpVal')
+
+    assert cols.to_points() == [{
+        'times': DateRange(datetime.fromtimestamp(1), datetime.fromtimestamp(1)),
+        'value': 72.0
+    }]
+
+def test_datetime64_times():
+    numpy = pytest.importorskip('numpy')
+    cols = FitColumns.from_response({'point': [point(1445385600123456789, 1445385660000000000, 1.0)]}, 'fpVal')
+
+    assert cols.start_times[0] == numpy.datetime64('2015-10-21T00:00:00.123456789')
+    assert cols.end_times[0] == numpy.datetime64('2015-10-21T00:01:00')
+
+
+def test_from_response_field(backend):
+    response = {'point': [
+        {'startTimeNanos': '1', 'endTimeNanos': '2', 'value': [{'fpVal': 1.5}, {'fpVal': 2.5}]},
+        {'startTimeNanos': '2', 'endTimeNanos': '3', 'value': [{'fpVal': 3.5}, {}]},
+    ]}
+
+    cols = FitColumns.from_response(response, 'fpVal', field=1)
+
+    assert cols.values[0] == 2.5
+    assert cols.values[1] != cols.values[1]
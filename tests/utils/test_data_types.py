@@ -0,0 +1,138 @@
+import math
+
+import pytest
+
+from gfitpy.utils import data_types
+from gfitpy.utils.columns import FitColumns
+from gfitpy.utils.data_types import DataType, data_type_name, get_data_type, register
+
+
+location = DataType('com.google.location.sample', [
+    ('latitude', 'floatPoint'),
+    ('longitude', 'floatPoint'),
+    ('accuracy', 'floatPoint'),
+    ('altitude', 'floatPoint'),
+])
+
+
+def point(start, end, *values):
+    return {'startTimeNanos': str(start), 'endTimeNanos': str(end), 'value': list(values)}
+
+
+def test_decode_single_field():
+    assert DataType('steps', [('steps', 'integer')]).decode(point(1, 2, {'intVal': 5})) == 5
+
+
+def test_decode_single_field_raises_on_several_values():
+    with pytest.raises(ValueError):
+        DataType('steps', [('steps', 'integer')]).decode(point(1, 2, {'intVal': 5}, {'intVal': 6}))
+
+
+def test_decode_multiple_fields():
+    value = location.decode(point(1, 2, {'fpVal': 51.5}, {'fpVal': -0.1}, {'fpVal': 10.0}, {}))
+
+    assert value == {'latitude': 51.5, 'longitude': -0.1, 'accuracy': 10.0, 'altitude': None}
+
+
+def test_decode_multiple_fields_with_missing_values():
+    value = location.decode(point(1, 2, {'fpVal': 51.5}, {'fpVal': -0.1}))
+
+    assert value['altitude'] is None
+
+
+def test_decode_map_and_string():
+    nutrition = get_data_type('com.google.nutrition')
+
+    value = nutrition.decode(point(
+        1, 2,
+        {'mapVal': [{'key': 'fat.total', 'value': {'fpVal': 1.5}}, {'key': 'sodium', 'value': {'fpVal': 0.2}}]},
+        {'intVal': 1},
+        {'stringVal': 'banana'},
+    ))
+
+    assert value == {'nutrients': {'fat.total': 1.5, 'sodium': 0.2}, 'meal_type': 1, 'food_item': 'banana'}
+
+
+def test_from_description():
+    data_type = DataType.from_description({
+        'name': 'com.google.heart_rate.summary',
+        'field': [
+            {'name': 'average', 'format': 'floatPoint'},
+            {'name': 'max', 'format': 'floatPoint'},
+            {'name': 'min', 'format': 'floatPoint'},
+        ]
+    })
+
+    assert data_type == get_data_type('com.google.heart_rate.summary')
+    assert data_type.keys == ('fpVal', 'fpVal', 'fpVal')
+
+
+def test_to_columns_single_field():
+    cols = get_data_type('com.google.step_count.delta').to_columns({'point': [point(1, 2, {'intVal': 5})]})
+
+    assert isinstance(cols, FitColumns)
+    assert list(cols.values) == [5]
+
+
+def test_to_columns_multiple_fields():
+    response = {'point': [
+        point(1, 2, {'fpVal': 51.5}, {'fpVal': -0.1}, {'fpVal': 10.0}, {}),
+        point(2, 3, {'fpVal': 51.6}, {'fpVal': -0.2}, {'fpVal': 12.0}, {'fpVal': 30.0}),
+    ]}
+
+    cols = location.to_columns(response)
+
+    assert list(cols) == ['latitude', 'longitude', 'accuracy', 'altitude']
+    assert list(cols['latitude'].values) == [51.5, 51.6]
+    assert list(cols['latitude'].start_ns) == [1, 2]
+    assert math.isnan(cols['altitude'].values[0])
+    assert cols['altitude'].values[1] == 30.0
+
+
+def test_to_columns_leaves_out_non_numeric_fields():
+    cols = get_data_type('com.google.nutrition').to_columns({'point': []})
+
+    assert list(cols) == ['meal_type']
+
+
+def test_to_columns_with_missing_int_field():
+    nutrients = {'mapVal': [{'key': 'fat.total', 'value': {'fpVal': 4.5}}]}
+    response = {'point': [
+        point(1, 2, nutrients, {}, {'stringVal': 'toast'}),
+        point(2, 3, nutrients, {'intVal': 3}, {'stringVal': 'toast'}),
+    ]}
+
+    cols = get_data_type('com.google.nutrition').to_columns(response)
+
+    assert math.isnan(cols['meal_type'].values[0])
+    assert cols['meal_type'].values[1] == 3
+
+
+def test_to_columns_raises_without_numeric_field():
+    with pytest.raises(ValueError):
+        DataType('notes', [('note', 'string')]).to_columns({'point': []})
+
+
+def test_register(monkeypatch):
+    monkeypatch.setattr(data_types, 'DATA_TYPES', {})
+    data_type = register(DataType('com.example.custom', [('thing', 'integer')]))
+
+    assert get_data_type('com.example.custom') is data_type
+
+
+def test_get_data_type_unknown():
+    with pytest.raises(ValueError):
+        get_data_type('com.example.nope')
+
+
+@pytest.mark.parametrize('data_source, expected', [
+    ('derived:com.google.calories.expended:com.google.android.gms:from_activities', 'com.google.calories.expended'),
+    ('raw:com.google.heart_rate.bpm:com.example:Polar:H7:12345:', 'com.google.heart_rate.bpm'),
+])
+def test_data_type_name(data_source, expected):
+    assert data_type_name(data_source) == expected
+
+
+def test_data_type_name_raises():
+    with pytest.raises(ValueError):
+        data_type_name('nonsense')
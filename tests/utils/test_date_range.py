@@ -1,8 +1,10 @@
+import pickle
+import random
 from datetime import datetime as dt, date as d, time as t, timedelta as td
 
 import pytest
 
-from gfitpy.utils.date_range import DateRange
+from gfitpy.utils.date_range import DateRange, IntervalIndex, coalesce
 
 
 def test_create_date_range():
@@ -220,3 +222,183 @@ def test_combine(left, right, new):
 
 def test_duration():
     assert DateRange(4, 6).duration == 2
+
+
+def random_ranges(count, seed):
+    rand = random.Random(seed)
+    ranges = []
+    for _ in range(count):
+        start = rand.randint(0, 1000)
+        ranges.append(DateRange(start, start + rand.randint(1, 100)))
+    return ranges
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_interval_index_matches_brute_force(seed):
+    ranges = random_ranges(200, seed)
+    index = IntervalIndex(ranges)
+
+    for query in random_ranges(50, seed + 100):
+        expected = sorted(r for r in ranges if r in query)
+        assert index.overlapping(query) == expected
+
+
+def test_interval_index_key():
+    points = [
+        {'times': DateRange(dt(2000, 1, 1, 12), dt(2000, 1, 1, 13)), 'value': 1},
+        {'times': DateRange(dt(2000, 1, 1, 10), dt(2000, 1, 1, 11)), 'value': 2},
+        {'times': DateRange(dt(2000, 1, 1, 14), dt(2000, 1, 1, 15)), 'value': 3},
+    ]
+    index = IntervalIndex(points, key=lambda point: point['times'])
+
+    ret = index.overlapping(DateRange(dt(2000, 1, 1, 10, 30), dt(2000, 1, 1, 12, 30)))
+
+    assert [point['value'] for point in ret] == [2, 1]
+    assert len(index) == 3
+
+
+def test_interval_index_datetime():
+    index = IntervalIndex([DateRange(dt(2000, 1, 1, 10), dt(2000, 1, 1, 11))])
+
+    assert index.overlapping(dt(2000, 1, 1, 11)) == [DateRange(dt(2000, 1, 1, 10), dt(2000, 1, 1, 11))]
+    assert index.overlapping(dt(2000, 1, 1, 12)) == []
+
+
+def test_interval_index_near():
+    ranges = [
+        DateRange(dt(2000, 1, 1, 12, 0), dt(2000, 1, 1, 12, 5)),
+        DateRange(dt(2000, 1, 1, 13, 0), dt(2000, 1, 1, 14, 0)),
+    ]
+    index = IntervalIndex(ranges)
+    query = DateRange(dt(2000, 1, 1, 12, 10), dt(2000, 1, 1, 12, 55))
+
+    assert index.overlapping(query) == []
+    assert index.near(query, near_time=td(minutes=5)) == ranges
+    assert index.near(dt(2000, 1, 1, 12, 9)) == ranges[:1]
+
+
+def test_interval_index_empty():
+    assert IntervalIndex([]).overlapping(DateRange(1, 2)) == []
+
+
+@pytest.mark.parametrize('val', [d.today(), t(0), '', None])
+def test_interval_index_bad_val(val):
+    with pytest.raises(NotImplementedError):
+        IntervalIndex([]).overlapping(val)
+
+
+def test_date_range_has_no_dict():
+    obj = DateRange(dt(2000, 1, 5), dt(2000, 1, 10))
+
+    assert not hasattr(obj, '__dict__')
+
+
+def test_near_time_overridden_per_instance():
+    obj = DateRange(dt(2000, 1, 5), dt(2000, 1, 10))
+    other = DateRange(dt(2000, 1, 5), dt(2000, 1, 10))
+
+    obj.near_time = td(seconds=300)
+
+    assert obj.near_time == td(seconds=300)
+    assert other.near_time == DateRange.near_time == td(seconds=600)
+
+
+def test_near_time_overridden_on_class(monkeypatch):
+    monkeypatch.setattr(DateRange, 'near_time', td(hours=1))
+    obj = DateRange(dt(2000, 1, 5, 12), dt(2000, 1, 5, 13))
+    other = DateRange(dt(2000, 1, 5, 13, 30), dt(2000, 1, 5, 14))
+
+    assert DateRange.near_time == obj.near_time == td(hours=1)
+    assert obj.near(other)
+    assert IntervalIndex([other]).near(obj) == [other]
+    # the default is looked up when coalesce is called, not when it was defined
+    assert coalesce([obj, other]) == [DateRange(obj.start, other.end)]
+
+    # and instances can still have their own
+    obj.near_time = td(minutes=5)
+    assert not obj.near(other)
+    assert other.near_time == td(hours=1)
+
+
+def test_near_time_overridden_on_subclass():
+    class ShortRange(DateRange):
+        __slots__ = ()
+
+    ShortRange.near_time = td(seconds=1)
+    obj = ShortRange(dt(2000, 1, 5), dt(2000, 1, 10))
+    obj.near_time = td(seconds=2)
+
+    assert obj.near_time == td(seconds=2)
+    assert ShortRange(dt(2000, 1, 5), dt(2000, 1, 10)).near_time == td(seconds=1)
+    assert DateRange.near_time == td(seconds=600)
+
+
+def test_pickle_round_trip():
+    obj = DateRange(dt(2000, 1, 5), dt(2000, 1, 10))
+
+    assert pickle.loads(pickle.dumps(obj)) == obj
+
+
+@pytest.mark.parametrize(
+    'ranges, gap, expected',
+    [
+        # nothing to do
+        ([], 1, []),
+        ([DateRange(1, 2)], 1, [DateRange(1, 2)]),
+        # overlapping, in any order
+        ([DateRange(5, 8), DateRange(1, 3), DateRange(2, 6)], 0, [DateRange(1, 8)]),
+        # one inside another
+        ([DateRange(1, 10), DateRange(2, 3), DateRange(11, 12)], 0, [DateRange(1, 10), DateRange(11, 12)]),
+        # touching
+        ([DateRange(1, 2), DateRange(2, 3)], 0, [DateRange(1, 3)]),
+        # close enough
+        ([DateRange(1, 2), DateRange(4, 5), DateRange(8, 9)], 2, [DateRange(1, 5), DateRange(8, 9)]),
+    ]
+)
+def test_coalesce(ranges, gap, expected):
+    assert coalesce(ranges, gap=gap) == expected
+
+
+def test_coalesce_default_gap():
+    date = d(2000, 1, 5)
+    ranges = [
+        DateRange(dt.combine(date, t(12, 0)), dt.combine(date, t(12, 30))),
+        DateRange(dt.combine(date, t(12, 40)), dt.combine(date, t(13, 0))),
+        DateRange(dt.combine(date, t(13, 11)), dt.combine(date, t(13, 30))),
+    ]
+
+    assert coalesce(ranges) == [
+        DateRange(dt.combine(date, t(12, 0)), dt.combine(date, t(13, 0))),
+        DateRange(dt.combine(date, t(13, 11)), dt.combine(date, t(13, 30))),
+    ]
+
+
+def test_coalesce_values():
+    ranges = [DateRange(5, 6), DateRange(1, 2), DateRange(2, 3)]
+
+    assert coalesce(ranges, gap=0, values=[10, 20, 30]) == [
+        (DateRange(1, 3), 50),
+        (DateRange(5, 6), 10),
+    ]
+    assert coalesce(ranges, gap=0, values=[10, 20, 30], aggregate=list) == [
+        (DateRange(1, 3), [20, 30]),
+        (DateRange(5, 6), [10]),
+    ]
+
+
+def test_coalesce_values_wrong_length():
+    with pytest.raises(ValueError):
+        coalesce([DateRange(1, 2)], values=[])
+
+
+def test_date_range_can_be_an_instant():
+    obj = DateRange(3, 3)
+
+    assert obj.duration == 0
+    assert DateRange(1, 3) in obj
+    assert DateRange(1, 2) not in obj
+
+
+def test_date_range_cant_end_before_it_starts():
+    with pytest.raises(AssertionError):
+        DateRange(3, 2)
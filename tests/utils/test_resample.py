@@ -0,0 +1,122 @@
+import random
+from datetime import datetime as dt, timedelta as td
+
+import pytest
+
+from gfitpy.utils import resample as resample_module
+from gfitpy.utils.columns import FitColumns
+from gfitpy.utils.date_range import DateRange
+from gfitpy.utils.resample import resample
+
+
+def point(start, end, value):
+    return {'times': DateRange(start, end), 'value': value}
+
+
+def test_resample_splits_points_across_buckets():
+    points = [
+        point(dt(2015, 1, 1, 11, 30), dt(2015, 1, 1, 12, 30), 100),
+        point(dt(2015, 1, 1, 12, 15), dt(2015, 1, 1, 12, 45), 10),
+    ]
+
+    ret = resample(points, td(hours=1))
+
+    assert ret == [
+        point(dt(2015, 1, 1, 11), dt(2015, 1, 1, 12), 50),
+        point(dt(2015, 1, 1, 12), dt(2015, 1, 1, 13), 60),
+    ]
+
+
+def test_resample_includes_empty_buckets():
+    points = [
+        point(dt(2015, 1, 1, 11), dt(2015, 1, 1, 11, 30), 1),
+        point(dt(2015, 1, 1, 13), dt(2015, 1, 1, 13, 30), 2),
+    ]
+
+    assert [bucket['value'] for bucket in resample(points, td(hours=1))] == [1, 0, 2]
+
+
+def test_resample_origin():
+    points = [point(dt(2015, 1, 1, 11, 30), dt(2015, 1, 1, 12, 0), 100)]
+
+    ret = resample(points, td(hours=1), origin=dt(2015, 1, 1, 0, 30))
+
+    assert ret == [point(dt(2015, 1, 1, 11, 30), dt(2015, 1, 1, 12, 30), 100)]
+
+
+def test_resample_point_ending_on_boundary():
+    points = [point(dt(2015, 1, 1, 11), dt(2015, 1, 1, 12), 100)]
+
+    assert resample(points, td(hours=1), origin=dt(2015, 1, 1)) == [
+        point(dt(2015, 1, 1, 11), dt(2015, 1, 1, 12), 100)
+    ]
+
+
+def test_resample_long_point():
+    points = [point(dt(2015, 1, 1, 12), dt(2015, 1, 3, 12), 100)]
+
+    assert [bucket['value'] for bucket in resample(points, td(days=1))] == [25, 50, 25]
+
+
+def test_resample_empty():
+    assert resample([], td(hours=1)) == []
+
+
+def columns(intervals):
+    return FitColumns.from_response({
+        'point': [
+            {'startTimeNanos': str(start), 'endTimeNanos': str(end), 'value': [{'fpVal': value}]}
+            for start, end, value in intervals
+        ]
+    }, 'fpVal')
+
+
+@pytest.fixture(params=['numpy', 'array'])
+def backend(request, monkeypatch):
+    if request.param == 'numpy':
+        pytest.importorskip('numpy')
+    else:
+        from gfitpy.utils import columns as columns_module
+        monkeypatch.setattr(resample_module, 'numpy', None)
+        monkeypatch.setattr(columns_module, 'numpy', None)
+    return request.param
+
+
+def test_resample_columns(backend):
+    hour = 60 * 60 * 10 ** 9
+    origin = dt(2015, 1, 1)
+    origin_ns = int(origin.timestamp()) * 10 ** 9
+    cols = columns([
+        (origin_ns + 11 * hour + hour // 2, origin_ns + 12 * hour + hour // 2, 100.0),
+        (origin_ns + 12 * hour + hour // 4, origin_ns + 12 * hour + hour // 2, 10.0),
+        # no duration at all
+        (origin_ns + 13 * hour, origin_ns + 13 * hour, 5.0),
+    ])
+
+    ret = resample(cols, td(hours=1), origin=origin)
+
+    assert list(ret.start_ns) == [origin_ns + i * hour for i in (11, 12, 13)]
+    assert list(ret.end_ns) == [origin_ns + i * hour for i in (12, 13, 14)]
+    assert list(ret.values) == pytest.approx([50, 60, 5])
+
+
+def test_resample_columns_empty(backend):
+    assert len(resample(columns([]), td(hours=1))) == 0
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_resample_columns_matches_points(seed):
+    pytest.importorskip('numpy')
+    rand = random.Random(seed)
+    base = int(dt(2015, 1, 1).timestamp()) * 10 ** 9
+    intervals = []
+    for _ in range(500):
+        start = base + rand.randint(0, 10 ** 14)
+        intervals.append((start, start + rand.randint(1, 10 ** 13), rand.uniform(0, 100)))
+    cols = columns(intervals)
+
+    vectorised = resample(cols, td(hours=1))
+    slow = resample(cols.to_points(), td(hours=1))
+
+    assert len(vectorised) == len(slow)
+    assert list(vectorised.values) == pytest.approx([bucket['value'] for bucket in slow], abs=1e-3)
@@ -0,0 +1,79 @@
+import random
+from datetime import datetime as dt
+
+import pytest
+
+from gfitpy.utils.activities import Activity
+from gfitpy.utils.date_range import DateRange
+from gfitpy.utils.rollup import attribute_calories
+
+
+def point(start, end, value):
+    return {'times': DateRange(start, end), 'value': value}
+
+
+def test_attribute_calories():
+    cals = [
+        point(dt(2015, 1, 1, 10), dt(2015, 1, 1, 11), 100.0),
+        # straddles the end of the walk and the start of the run
+        point(dt(2015, 1, 1, 11), dt(2015, 1, 1, 12), 200.0),
+        point(dt(2015, 1, 1, 12), dt(2015, 1, 1, 13), 300.0),
+    ]
+    activities = [
+        point(dt(2015, 1, 1, 11, 30), dt(2015, 1, 1, 13), Activity.running.value),
+        point(dt(2015, 1, 1, 10), dt(2015, 1, 1, 11, 30), Activity.walking.value),
+    ]
+
+    ret = attribute_calories(cals, activities)
+
+    assert ret['segments'] == [
+        {'times': DateRange(dt(2015, 1, 1, 10), dt(2015, 1, 1, 11, 30)), 'activity': Activity.walking, 'calories': 200},
+        {'times': DateRange(dt(2015, 1, 1, 11, 30), dt(2015, 1, 1, 13)), 'activity': Activity.running, 'calories': 400},
+    ]
+    assert ret['activities'] == {Activity.walking: 200, Activity.running: 400}
+
+
+def test_attribute_calories_totals_per_activity():
+    cals = [point(0, 10, 10.0), point(10, 20, 20.0), point(20, 30, 30.0)]
+    activities = [point(0, 10, 1), point(10, 20, 7), point(20, 30, 1)]
+
+    ret = attribute_calories(cals, activities)
+
+    assert ret['activities'] == {Activity.biking: 40, Activity.walking: 20}
+
+
+def test_attribute_calories_unknown_activity():
+    ret = attribute_calories([point(0, 10, 10.0)], [point(0, 10, 1000)])
+
+    assert ret['activities'] == {None: 10}
+
+
+def test_attribute_calories_no_calories():
+    ret = attribute_calories([], [point(0, 10, 1)])
+
+    assert ret['segments'] == [{'times': DateRange(0, 10), 'activity': Activity.biking, 'calories': 0}]
+
+
+@pytest.mark.parametrize('seed', range(3))
+def test_attribute_calories_matches_nested_loops(seed):
+    rand = random.Random(seed)
+    cals, time = [], 0
+    for _ in range(300):
+        length = rand.randint(1, 20)
+        cals.append(point(time, time + length, rand.uniform(0, 10)))
+        time += length + rand.randint(0, 5)
+    activities, time = [], 0
+    for _ in range(50):
+        length = rand.randint(1, 100)
+        activities.append(point(time, time + length, rand.choice([1, 7, 8])))
+        time += length + rand.randint(0, 20)
+
+    ret = attribute_calories(cals, activities)
+
+    for segment, activity in zip(ret['segments'], activities):
+        expected = sum(
+            cal['value'] * (min(cal['times'].end, activity['times'].end) - max(cal['times'].start, activity['times'].start)) / cal['times'].duration
+            for cal in cals
+            if cal['times'].start < activity['times'].end and activity['times'].start < cal['times'].end
+        )
+        assert segment['calories'] == pytest.approx(expected)
@@ -0,0 +1,39 @@
+from datetime import datetime
+
+import pytest
+
+from gfitpy.utils.timestamps import decode_nanos, decode_nanos_array, ns_to_datetime, to_datetime64
+
+
+def test_decode_nanos_is_exact():
+    assert decode_nanos(['1445385600123456789', '2']) == [1445385600123456789, 2]
+
+
+def test_decode_nanos_array():
+    numpy = pytest.importorskip('numpy')
+
+    ret = decode_nanos_array(['1445385600123456789', '2'])
+
+    assert ret.dtype == numpy.int64
+    assert ret.tolist() == [1445385600123456789, 2]
+
+
+def test_to_datetime64():
+    numpy = pytest.importorskip('numpy')
+
+    ret = to_datetime64(['1445385600123456789'])
+
+    assert ret[0] == numpy.datetime64('2015-10-21T00:00:00.123456789')
+
+
+@pytest.mark.parametrize(
+    'ns, expected',
+    [
+        (0, datetime.fromtimestamp(0)),
+        (1445385600000000000, datetime.fromtimestamp(1445385600)),
+        # microseconds survive - beyond that, datetime can't go
+        (1445385600123456789, datetime.fromtimestamp(1445385600).replace(microsecond=123456)),
+    ]
+)
+def test_ns_to_datetime(ns, expected):
+    assert ns_to_datetime(ns) == expected